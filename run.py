@@ -1,15 +1,31 @@
 import tello_control
 import runpy
 import sys
+from tello_control.profiler import default_profiler
 
 def main() -> None:
+    # python run.py [--profile] module [args...]
+    profile = len(sys.argv) > 1 and sys.argv[1] == "--profile"
+    if profile:
+        del sys.argv[1]
+    if len(sys.argv) < 2:
+        sys.exit("usage: python run.py [--profile] module [args...]")
     new_argv = sys.argv[2:]
     module = sys.argv[1]
     sys.argv = [sys.argv[0], *new_argv]
-    runpy._run_module_as_main(
-        module,
-        alter_argv=False,
-    )
+    profiler = default_profiler()
+    profiler.name = module.rpartition(".")[2]
+    if profile:
+        profiler.start()
+    try:
+        runpy._run_module_as_main(
+            module,
+            alter_argv=False,
+        )
+    finally:
+        # Also writes out a profile started from inside the module (e.g. the
+        # controller's hotkey) that was never stopped.
+        profiler.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,39 @@
 import mmap
+from contextlib import contextmanager
 import numpy as np
 from pathlib import Path
 import typing as T
 from dataclasses import dataclass, field
 import sys
 import os
+import time
+import struct
+if sys.platform != "win32":
+    import fcntl
+from .ipc_notify import (
+    Notifier,
+    FRAME_EVENT,
+    STATE_EVENT,
+    TELEMETRY_EVENT,
+    MAX_SUBSCRIBERS,
+    SUBSCRIBER_FIELDS,
+    SUBSCRIBER_TABLE_LENGTH,
+)
+from .stats import LatencyHistogram
+from .frame_layout import (
+    FrameLayout,
+    PixelFormat,
+    Lane,
+    lanes_to_mask,
+    lanes_from_mask,
+    parse_lanes,
+)
+
+# Several controller/drone pairs can share a host by using different sessions.
+DEFAULT_SESSION = os.environ.get("DRONEIPC_SESSION", "default")
+
+# tmpfs, so frames never get written back to disk.
+LINUX_SHM_DIR = Path("/dev/shm")
 
 CAMERA_W = 960
 CAMERA_H = 720
@@ -16,25 +45,231 @@ STREAMON  = 0b0000_0100
 STREAMOFF = 0b0000_1000
 EMERGENCY = 0b0001_0000
 
-CONTROL_LENGTH_IN_BYTES = (
-    # Flags
-    1 + 
-    # RC commands
-    4
+
+# The layout a new session gets unless its creator asks for another one,
+# e.g. DRONEIPC_LAYOUT=480x360:nv12 for a reduced perception stream.
+DEFAULT_LAYOUT = (
+    FrameLayout.parse(os.environ["DRONEIPC_LAYOUT"]) if "DRONEIPC_LAYOUT" in os.environ
+    else FrameLayout(CAMERA_W, CAMERA_H, PixelFormat.BGR24)
 )
 
+# Reduced lanes a new session carries next to the full frame unless its
+# creator asks for others, e.g. DRONEIPC_LANES=half,quarter,gray
+DEFAULT_LANES = parse_lanes(os.environ.get("DRONEIPC_LANES", ""))
 
-FRAME_LENGTH_IN_BYTES = (
-    CAMERA_W * CAMERA_H * CAMERA_C
-)
+FRAME_LENGTH_IN_BYTES = DEFAULT_LAYOUT.nbytes
+
+# Frames are published into a ring of slots, so a reader copying the latest
+# frame is never racing the writer (which always fills the *next* slot).
+N_FRAME_SLOTS = 4
+
+# Every region of the buffer is 64-byte aligned.
+ALIGNMENT = 64
+
+def _align(n: int) -> int:
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+# The buffer starts with a header of uint32 fields describing the rest of it,
+# so that readers never have to assume the frame geometry.
+HEADER_MAGIC = 0x43504944 # "DIPC"
+# Bump whenever the layout of the buffer changes.
+HEADER_VERSION = 5
+HEADER_FORMAT = "<16I"
+HEADER_LENGTH = ALIGNMENT
+HEADER_MAGIC_FIELD = 0
+HEADER_VERSION_FIELD = 1
+HEADER_BUFFER_LENGTH = 2
+HEADER_WIDTH = 3
+HEADER_HEIGHT = 4
+HEADER_STRIDE = 5
+HEADER_PIXEL_FORMAT = 6
+HEADER_N_SLOTS = 7
+HEADER_SLOT_LENGTH = 8
+HEADER_SLOTS_OFFSET = 9
+HEADER_LANES = 10
+HEADER_TELEMETRY_OFFSET = 11
+HEADER_TELEMETRY_RING_LENGTH = 12
+
+# The control block follows the header. It is struct-packed, and every field
+# is naturally aligned.
+CONTROL_OFFSET = HEADER_LENGTH
+U64_STRUCT = struct.Struct("<Q")
+
+# RC: the sticks a script wants, guarded by a seqlock.
+#   sequence (odd while being written), written_ns,
+#   left_right, up_down, fwd_back, yaw (-100 .. 100)
+RC_STRUCT = struct.Struct("<QQ4b4x")
+RC_OFFSET = CONTROL_OFFSET
+
+# When the controller last polled for commands, so scripts can tell whether
+# anyone is listening.
+SERVICED_OFFSET = RC_OFFSET + RC_STRUCT.size
 
-BUFFER_LENGTH = CONTROL_LENGTH_IN_BYTES + FRAME_LENGTH_IN_BYTES
+# Command mailbox. One-shot commands (TAKEOFF, LAND, ...) are delivered
+# exactly once, in order, and acknowledged by the controller.
+#   sequence of the newest posted command
+MAILBOX_OFFSET = SERVICED_OFFSET + U64_STRUCT.size
 
-def uint_to_int(number: np.uint8) -> int:
-    return max(min(int(number.view(dtype=np.int8)), 100), -100)
+# Ring of the most recent commands, written by the script: sequence,
+# posted_ns, flags. Command n is in entry n % COMMAND_RING_LENGTH.
+COMMAND_STRUCT = struct.Struct("<QQI4x")
+COMMAND_RING_LENGTH = 8
+COMMAND_RING_OFFSET = MAILBOX_OFFSET + U64_STRUCT.size
 
-def int_to_uint(number: int) -> np.uint8:
-    return np.int8(max(min(number, 100), -100)).view(dtype=np.uint8)
+# Ring of acks, written by the controller: sequence, acked_ns, ACK_* status.
+# The ack of command n is in entry n % COMMAND_RING_LENGTH. The sequence is
+# 0 while the entry is being written.
+ACK_STRUCT = struct.Struct("<QQI4x")
+ACK_RING_OFFSET = COMMAND_RING_OFFSET + COMMAND_RING_LENGTH * COMMAND_STRUCT.size
+
+CONTROL_LENGTH_IN_BYTES = ACK_RING_OFFSET + COMMAND_RING_LENGTH * ACK_STRUCT.size - CONTROL_OFFSET
+
+ACK_OK = 1
+ACK_FAILED = 2
+# Nobody polled the command before it got too old to run safely.
+ACK_EXPIRED = 3
+# Newer commands took its place in the ring before the controller polled it,
+# so it never ran.
+ACK_DROPPED = 4
+# It was acked, but the ack was overwritten by a newer command's before this
+# handle read it.
+ACK_UNKNOWN = 5
+COMMAND_MAX_AGE_NS = 1_000_000_000
+# How many times a reader re-reads an ack entry that is being written.
+ACK_READ_RETRIES = 100
+
+# Ring index: the frame id of the most recently published frame (0 = none yet)
+RING_INDEX_OFFSET = _align(CONTROL_OFFSET + CONTROL_LENGTH_IN_BYTES)
+RING_INDEX_LENGTH = ALIGNMENT
+
+# Processes blocked in wait_for_frame/wait_for_state/wait_for_telemetry, see ipc_notify.py
+SUBSCRIBERS_OFFSET = RING_INDEX_OFFSET + RING_INDEX_LENGTH
+
+# Telemetry: the drone's state packets, as TELEMETRY_DTYPE records in a
+# ring. A uint64 counter of samples written (the newest sample's sequence),
+# then the ring, where sample n is in row n % TELEMETRY_RING_LENGTH.
+# Field names and units are the drone's (cm, dm/s, degrees, %, ...), see the
+# Tello SDK. mid/x/y/z are only set with mission pads.
+TELEMETRY_DTYPE = np.dtype([
+    # Starts at 1. 0 in a row that was never written.
+    ("sequence", np.uint64),
+    # time.monotonic_ns() of the controller when the packet was picked up.
+    ("timestamp_ns", np.int64),
+    ("pitch", np.int32), ("roll", np.int32), ("yaw", np.int32),
+    ("vgx", np.int32), ("vgy", np.int32), ("vgz", np.int32),
+    ("templ", np.int32), ("temph", np.int32),
+    ("tof", np.int32), ("h", np.int32), ("bat", np.int32), ("time", np.int32),
+    ("mid", np.int32), ("x", np.int32), ("y", np.int32), ("z", np.int32),
+    ("baro", np.float32), ("agx", np.float32), ("agy", np.float32), ("agz", np.float32),
+])
+TELEMETRY_FIELDS = TELEMETRY_DTYPE.names[2:]
+# About 25 s of state at the drone's ~10 Hz.
+TELEMETRY_RING_LENGTH = 256
+TELEMETRY_OFFSET = _align(SUBSCRIBERS_OFFSET + SUBSCRIBER_TABLE_LENGTH)
+TELEMETRY_RING_OFFSET = TELEMETRY_OFFSET + ALIGNMENT
+TELEMETRY_LENGTH = ALIGNMENT + TELEMETRY_RING_LENGTH * TELEMETRY_DTYPE.itemsize
+
+# Each slot starts with a header of uint64 fields, followed by the frame and
+# then each of the session's lanes. The seqlock covers all of them.
+#   sequence: seqlock generation. Odd while the slot is being written.
+#   frame id: monotonically increasing, starts at 1.
+#   timestamp: time.monotonic_ns() when the frame was captured.
+SLOT_SEQUENCE = 0
+SLOT_FRAME_ID = 1
+SLOT_TIMESTAMP = 2
+SLOT_HEADER_FIELDS = 3
+SLOT_HEADER_LENGTH = ALIGNMENT
+SLOTS_OFFSET = _align(TELEMETRY_OFFSET + TELEMETRY_LENGTH)
+
+# How many times a reader re-checks the ring before giving up. A reader
+# only has to retry if the writer lapped the whole ring during one copy.
+FRAME_READ_RETRIES = 8
+RC_READ_RETRIES = 100
+
+def _slot_parts(layout: FrameLayout, lanes: T.Tuple[Lane, ...]) -> T.Tuple[T.List[T.Tuple[T.Optional[Lane], FrameLayout, int]], int]:
+    """
+    Returns (lane, layout, offset in the slot) for the full frame (lane None)
+    and each lane, and the length of the slot.
+    """
+    parts = []
+    offset = SLOT_HEADER_LENGTH
+    for lane in (None, *lanes):
+        part_layout = layout if lane is None else layout.lane_layout(lane)
+        parts.append((lane, part_layout, offset))
+        offset = _align(offset + part_layout.nbytes)
+    return parts, offset
+
+@dataclass(frozen=True)
+class _Geometry:
+    """
+    Everything the header says about where things are in the buffer.
+    """
+    layout: FrameLayout
+    lanes: T.Tuple[Lane, ...]
+    n_slots: int
+    slot_length: int
+    slots_offset: int
+    buffer_length: int
+
+    @staticmethod
+    def for_layout(layout: FrameLayout, lanes: T.Tuple[Lane, ...] = (), n_slots: int = N_FRAME_SLOTS) -> "_Geometry":
+        _, slot_length = _slot_parts(layout, lanes)
+        return _Geometry(
+            layout=layout,
+            lanes=lanes,
+            n_slots=n_slots,
+            slot_length=slot_length,
+            slots_offset=SLOTS_OFFSET,
+            buffer_length=SLOTS_OFFSET + n_slots * slot_length,
+        )
+
+    def pack(self) -> bytes:
+        fields = [0] * 16
+        fields[HEADER_MAGIC_FIELD] = HEADER_MAGIC
+        fields[HEADER_VERSION_FIELD] = HEADER_VERSION
+        fields[HEADER_BUFFER_LENGTH] = self.buffer_length
+        fields[HEADER_WIDTH] = self.layout.width
+        fields[HEADER_HEIGHT] = self.layout.height
+        fields[HEADER_STRIDE] = self.layout.stride
+        fields[HEADER_PIXEL_FORMAT] = self.layout.pixel_format
+        fields[HEADER_N_SLOTS] = self.n_slots
+        fields[HEADER_SLOT_LENGTH] = self.slot_length
+        fields[HEADER_SLOTS_OFFSET] = self.slots_offset
+        fields[HEADER_LANES] = lanes_to_mask(self.lanes)
+        fields[HEADER_TELEMETRY_OFFSET] = TELEMETRY_OFFSET
+        fields[HEADER_TELEMETRY_RING_LENGTH] = TELEMETRY_RING_LENGTH
+        return struct.pack(HEADER_FORMAT, *fields)
+
+    @staticmethod
+    def unpack(data: bytes) -> T.Optional["_Geometry"]:
+        """
+        Returns None unless `data` starts with a header this version wrote.
+        """
+        if len(data) < HEADER_LENGTH:
+            return None
+        fields = struct.unpack_from(HEADER_FORMAT, data)
+        if fields[HEADER_MAGIC_FIELD] != HEADER_MAGIC or fields[HEADER_VERSION_FIELD] != HEADER_VERSION:
+            return None
+        layout = FrameLayout(
+            width=fields[HEADER_WIDTH],
+            height=fields[HEADER_HEIGHT],
+            pixel_format=PixelFormat(fields[HEADER_PIXEL_FORMAT]),
+        )
+        if fields[HEADER_STRIDE] != layout.stride:
+            return None
+        if fields[HEADER_TELEMETRY_OFFSET] != TELEMETRY_OFFSET or fields[HEADER_TELEMETRY_RING_LENGTH] != TELEMETRY_RING_LENGTH:
+            return None
+        return _Geometry(
+            layout=layout,
+            lanes=lanes_from_mask(fields[HEADER_LANES]),
+            n_slots=fields[HEADER_N_SLOTS],
+            slot_length=fields[HEADER_SLOT_LENGTH],
+            slots_offset=fields[HEADER_SLOTS_OFFSET],
+            buffer_length=fields[HEADER_BUFFER_LENGTH],
+        )
+
+# Size of a buffer with the default layout and lanes.
+BUFFER_LENGTH = _Geometry.for_layout(DEFAULT_LAYOUT, DEFAULT_LANES).buffer_length
 
 @dataclass
 class DroneState:
@@ -48,75 +283,782 @@ class DroneState:
     fwd_back_vel: int = 0
     yaw_vel: int = 0
 
+@dataclass
+class DroneCommand:
+    sequence: int
+    # Bitmask of TAKEOFF, LAND, ...
+    flags: int
+    # time.monotonic_ns() of the script when it posted the command.
+    posted_ns: int
+
+def _state_flags(state: DroneState) -> int:
+    return (
+        (LAND if state.land else 0) |
+        (TAKEOFF if state.takeoff else 0) |
+        (STREAMON if state.streamon else 0) |
+        (STREAMOFF if state.streamoff else 0) |
+        (EMERGENCY if state.emergency else 0)
+    )
+
+def _clamp_rc(velocity: int) -> int:
+    return max(min(int(velocity), 100), -100)
+
+@dataclass
+class IPCFrame:
+    frame_id: int
+    # time.monotonic_ns() of the producer when the frame was captured.
+    timestamp_ns: int
+    image: np.ndarray
+
+class FrameOverwrittenError(RuntimeError):
+    pass
+
+class FrameLease:
+    """
+    A frame borrowed straight out of shared memory, see DroneIPC.borrow_frame.
+
+    `image` is a read-only view of the slot, so it is only good for as long as
+    the producer leaves that slot alone (n_slots - 1 frame periods).
+    """
+
+    def __init__(self, header: T.Optional[np.ndarray], sequence: int, frame_id: int, timestamp_ns: int, image: T.Optional[np.ndarray], strict: bool) -> None:
+        self._header = header
+        self._sequence = sequence
+        # Whether the lease was still valid when the block ended.
+        self._valid_on_exit = header is not None
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.image = image
+        self.strict = strict
+
+    @property
+    def valid(self) -> bool:
+        """
+        False once the producer has started overwriting the borrowed slot,
+        after which anything computed from `image` may be torn.
+        """
+        if self._header is None:
+            return self._valid_on_exit
+        return int(self._header[SLOT_SEQUENCE]) == self._sequence
+
+    def __enter__(self) -> T.Optional[np.ndarray]:
+        return self.image
+
+    def __exit__(self, exc_type, exc, tb):
+        self._valid_on_exit = self.valid
+        # Drop our views so they don't keep the mmap from closing.
+        self._header = None
+        self.image = None
+        if self.strict and exc_type is None and self.frame_id != 0 and not self._valid_on_exit:
+            raise FrameOverwrittenError(f"Frame {self.frame_id} was overwritten while borrowed")
+
 class DroneIPC:
-    def __init__(self):
+    def __init__(self, session: str = DEFAULT_SESSION, layout: T.Optional[FrameLayout] = None, lanes: T.Optional[T.Iterable[Lane]] = None):
+        """
+        `layout` is the frame geometry to create the session with, and `lanes`
+        the reduced copies of each frame to publish with it. Leave them as
+        None to use whatever the session already has (or DEFAULT_LAYOUT and
+        DEFAULT_LANES if this handle creates it).
+        """
+        self.session = session
+        self.requested_layout = layout
+        self.requested_lanes = None if lanes is None else lanes_from_mask(lanes_to_mask(lanes))
+        self.path: T.Optional[Path] = None
+        self.layout: FrameLayout = layout or DEFAULT_LAYOUT
+        self.lanes: T.Tuple[Lane, ...] = ()
+        self._lane_layouts: T.Dict[Lane, FrameLayout] = {}
+        self._geometry: T.Optional[_Geometry] = None
         self._arr = None
         self._shmem = None
         self.fd = None
+        self._latest = None
+        self._slot_headers = None
+        # Lane (None for the full frame) -> its view in every slot
+        self._slot_views: T.Dict[T.Optional[Lane], np.ndarray] = {}
+        self._notifier: T.Optional[Notifier] = None
+        # Id of the last frame this handle read. Used to skip duplicates.
+        self.last_frame_id: int = 0
+        # RC sequence of the last state this handle read, and what it read.
+        self.last_state_sequence: int = 0
+        self._last_rc: T.Tuple[int, ...] = (0, 0, 0, 0, 0, 0)
+        # Sequence of the newest telemetry sample this handle read.
+        self.last_telemetry_sequence: int = 0
+        self._telemetry_count = None
+        self._telemetry = None
+        # Command flags in the last save_state, so only new ones get posted.
+        self._saved_flags: int = 0
+        # Newest command sequence returned by poll_commands.
+        self._polled_command_sequence: int = 0
+        # Newest command sequence this handle has seen, for wait_for_state.
+        self._seen_command_sequence: int = 0
+        # Script -> controller latencies: RC values (written to read), and
+        # commands (posted to executed and acked).
+        self.state_latency = LatencyHistogram("state")
+        self.command_latency = LatencyHistogram("command")
+
+    def _requested_geometry(self) -> _Geometry:
+        return _Geometry.for_layout(
+            self.requested_layout or DEFAULT_LAYOUT,
+            DEFAULT_LANES if self.requested_lanes is None else self.requested_lanes,
+        )
+
+    def _check_requested_layout(self, geometry: _Geometry) -> None:
+        if self.requested_layout is not None and self.requested_layout != geometry.layout:
+            raise ValueError(
+                f"DroneIPC session {self.session!r} is already in use with {geometry.layout}, "
+                f"can't switch it to {self.requested_layout}. Start the producer first."
+            )
+        if self.requested_lanes is not None and self.requested_lanes != geometry.lanes:
+            raise ValueError(
+                f"DroneIPC session {self.session!r} is already in use with lanes {geometry.lanes}, "
+                f"can't switch it to {self.requested_lanes}. Start the producer first."
+            )
+
+    @property
+    def lock_path(self) -> T.Optional[Path]:
+        """
+        Held while attaching to or detaching from the session, and while
+        claiming or freeing a row of the subscriber table. None on Windows,
+        where there's no backing file.
+        """
+        return None if self.path is None else self.path.with_name(f"{self.path.name}.lock")
+
+    @contextmanager
+    def _session_lock(self) -> T.Iterator[None]:
+        # The last process out deletes the lock file while holding it, so
+        # anyone who was waiting on it has to start over with a new one.
+        while True:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, mode=0o666)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                same_file = os.fstat(fd).st_ino == os.stat(self.lock_path).st_ino
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                break
+            os.close(fd)
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+    def _open_backing_file(self) -> None:
+        # Every attached process holds a shared flock for as long as it is
+        # attached, which is how the last one out knows to delete the file.
+        # Whoever can get an exclusive lock is alone, and sets the file up.
+        # Attaching and detaching happen under the session lock, so nobody
+        # else can decide they are alone while we go from exclusive to
+        # shared (which flock doesn't do atomically).
+        with self._session_lock():
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR, mode=0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                alone = True
+            except BlockingIOError:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                alone = False
+
+            if alone:
+                # Nobody is attached, so start from zeros rather than whatever
+                # a previous session left behind.
+                geometry = self._requested_geometry()
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, geometry.buffer_length)
+                header = geometry.pack()
+                os.pwrite(fd, header, 0)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            else:
+                existing = _Geometry.unpack(os.pread(fd, HEADER_LENGTH, 0))
+                if existing is None:
+                    os.close(fd)
+                    raise RuntimeError(f"{self.path} is in use by an incompatible version of DroneIPC")
+                geometry = existing
+                try:
+                    self._check_requested_layout(geometry)
+                except ValueError:
+                    os.close(fd)
+                    raise
+        self.fd = fd
+        self._geometry = geometry
+
+    def _close_backing_file(self) -> None:
+        with self._session_lock():
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Someone else is still attached.
+                pass
+            else:
+                self.path.unlink(missing_ok=True)
+                self.lock_path.unlink(missing_ok=True)
+            os.close(self.fd)
+        self.fd = None
+
+    def _open_named_mapping(self) -> None:
+        # Windows. Named mappings are freed when the last handle closes.
+        tagname = f"droneipc-{self.session}"
+        requested = self._requested_geometry()
+        self._shmem = mmap.mmap(-1, requested.buffer_length, tagname=tagname)
+        existing = _Geometry.unpack(self._shmem[:HEADER_LENGTH])
+        if existing is None:
+            header = requested.pack()
+            # Magic goes in last, so nobody sees a half-written header.
+            self._shmem[4:HEADER_LENGTH] = header[4:]
+            self._shmem[:4] = header[:4]
+            self._geometry = requested
+            return
+        try:
+            self._check_requested_layout(existing)
+        except ValueError:
+            self._shmem.close()
+            raise
+        self._geometry = existing
+        if existing.buffer_length != requested.buffer_length:
+            self._shmem.close()
+            self._shmem = mmap.mmap(-1, existing.buffer_length, tagname=tagname)
 
     def __enter__(self) -> "DroneIPC":
         # This function is only called once, so it can be expensive
         if sys.platform == "win32":
-            # Windows.
-            self._shmem = mmap.mmap(-1, BUFFER_LENGTH, tagname="droneipc")
-        elif sys.platform == "darwin":
-            # Mac.
-            self.fd = os.open("/tmp/droneipc", os.O_CREAT | os.O_RDWR, mode=0o777)
-            os.ftruncate(self.fd, BUFFER_LENGTH)
-            self._shmem = mmap.mmap(self.fd, BUFFER_LENGTH)
-        elif sys.platform == "linux":
-            self.fd = os.open(Path(__file__).resolve().parent / "droneipc", os.O_CREAT | os.O_RDWR, mode=0o777)
-            os.ftruncate(self.fd, BUFFER_LENGTH)
-            self._shmem = mmap.mmap(self.fd, BUFFER_LENGTH)
+            self._open_named_mapping()
+        else:
+            if sys.platform == "linux" and LINUX_SHM_DIR.is_dir():
+                self.path = LINUX_SHM_DIR / f"droneipc-{self.session}"
+            else:
+                # Mac.
+                self.path = Path("/tmp") / f"droneipc-{self.session}"
+            self._open_backing_file()
+            self._shmem = mmap.mmap(self.fd, self._geometry.buffer_length)
+
+        geometry = self._geometry
+        self.layout = geometry.layout
+        self.lanes = geometry.lanes
+        self._lane_layouts = {lane: self.layout.lane_layout(lane) for lane in self.lanes}
         self._arr = np.frombuffer(self._shmem, dtype=np.uint8)
+        self._latest = np.ndarray(
+            (1,), dtype=np.uint64, buffer=self._shmem, offset=RING_INDEX_OFFSET,
+        )
+        self._telemetry_count = np.ndarray(
+            (1,), dtype=np.uint64, buffer=self._shmem, offset=TELEMETRY_OFFSET,
+        )
+        self._telemetry = np.ndarray(
+            (TELEMETRY_RING_LENGTH,), dtype=TELEMETRY_DTYPE, buffer=self._shmem, offset=TELEMETRY_RING_OFFSET,
+        )
+        # Commands handled before we attached are history, not news.
+        self._polled_command_sequence = self._handled_sequence()
+        self._seen_command_sequence = self._polled_command_sequence
+        self._notifier = Notifier(
+            np.ndarray(
+                (MAX_SUBSCRIBERS, SUBSCRIBER_FIELDS),
+                dtype=np.uint32,
+                buffer=self._shmem,
+                offset=SUBSCRIBERS_OFFSET,
+            ),
+            namespace=f"droneipc-{self.session}",
+            lock_path=self.lock_path,
+        )
+        self._slot_headers = np.ndarray(
+            (geometry.n_slots, SLOT_HEADER_FIELDS),
+            dtype=np.uint64,
+            buffer=self._shmem,
+            offset=geometry.slots_offset,
+            strides=(geometry.slot_length, 8),
+        )
+        parts, _ = _slot_parts(geometry.layout, geometry.lanes)
+        self._slot_views = {
+            lane: np.ndarray(
+                (geometry.n_slots, *part_layout.shape),
+                dtype=np.uint8,
+                buffer=self._shmem,
+                offset=geometry.slots_offset + offset,
+                strides=(geometry.slot_length, *part_layout.strides),
+            )
+            for lane, part_layout, offset in parts
+        }
         return self
     
     def __exit__(self, exc_type, exc, tb):
+        self._notifier.close()
+        # All views into the mmap have to be gone before it can be closed.
+        del self._notifier
         del self._arr
+        del self._latest
+        del self._telemetry_count
+        del self._telemetry
+        del self._slot_headers
+        self._slot_views.clear()
         self._shmem.close()
-        if self.                                                          fd:
-            os.close(self.fd)
+        if self.fd is not None:
+            self._close_backing_file()
+
+    def lane_layout(self, lane: T.Optional[Lane] = None) -> FrameLayout:
+        """
+        Layout of `lane` (or of the full frame, for None).
+        """
+        if lane is None:
+            return self.layout
+        if lane not in self._lane_layouts:
+            raise ValueError(f"DroneIPC session {self.session!r} has no {lane.name} lane")
+        return self._lane_layouts[lane]
+
+    def to_bgr(self, frame: np.ndarray, out: T.Optional[np.ndarray] = None, lane: T.Optional[Lane] = None) -> np.ndarray:
+        """
+        Converts a frame read from this session (or from one of its lanes)
+        to BGR.
+        """
+        return self.lane_layout(lane).to_bgr(frame, out)
     
+    def _u64(self, offset: int) -> int:
+        return U64_STRUCT.unpack_from(self._shmem, offset)[0]
+
+    def _ack_offset(self, sequence: int) -> int:
+        return ACK_RING_OFFSET + (sequence % COMMAND_RING_LENGTH) * ACK_STRUCT.size
+
+    def _read_ack(self, sequence: int) -> T.Tuple[int, int, int]:
+        """
+        The ack entry command `sequence` would be in, as (sequence, acked_ns,
+        status). The sequence is that of whichever command's ack it holds.
+        """
+        offset = self._ack_offset(sequence)
+        for _ in range(ACK_READ_RETRIES):
+            entry = ACK_STRUCT.unpack_from(self._shmem, offset)
+            # Unchanged while we read it, so not torn.
+            if self._u64(offset) == entry[0]:
+                return entry
+        return (0, 0, 0)
+
+    def _is_acked(self, sequence: int) -> bool:
+        return self._read_ack(sequence)[0] >= sequence
+
+    def _handled_sequence(self) -> int:
+        """
+        The newest command sequence that it and every command before it has
+        been acked (or dropped).
+        """
+        newest = self._u64(MAILBOX_OFFSET)
+        for sequence in range(max(newest - COMMAND_RING_LENGTH + 1, 1), newest + 1):
+            if not self._is_acked(sequence):
+                return sequence - 1
+        return newest
+
     def save_state(self, state: DroneState) -> None:
-        commands = np.uint8(
-            LAND if state.land else 0 +
-            TAKEOFF if state.takeoff else 0 +
-            STREAMON if state.streamon else 0 +
-            STREAMOFF if state.streamoff else 0 +
-            EMERGENCY if state.emergency else 0
+        """
+        Publishes the velocities in `state`. Command flags are edge-triggered:
+        a flag that was already set in this handle's last save_state is not
+        sent again, so leaving `takeoff` set takes off exactly once.
+        """
+        sequence = self._u64(RC_OFFSET) | 1
+        U64_STRUCT.pack_into(self._shmem, RC_OFFSET, sequence)
+        RC_STRUCT.pack_into(
+            self._shmem,
+            RC_OFFSET,
+            sequence,
+            time.monotonic_ns(),
+            _clamp_rc(state.left_right_vel),
+            _clamp_rc(state.up_down_vel),
+            _clamp_rc(state.fwd_back_vel),
+            _clamp_rc(state.yaw_vel),
+        )
+        U64_STRUCT.pack_into(self._shmem, RC_OFFSET, sequence + 1)
+
+        flags = _state_flags(state)
+        new_flags = flags & ~self._saved_flags
+        self._saved_flags = flags
+        if new_flags:
+            self.send_command(new_flags)
+        else:
+            self._notifier.publish(STATE_EVENT)
+
+    def send_command(self, flags: int) -> int:
+        """
+        Posts a one-shot command (a bitmask of TAKEOFF, LAND, ...) and returns
+        its sequence number, for wait_for_ack. Only one process per session
+        should post commands.
+        """
+        sequence = self._u64(MAILBOX_OFFSET) + 1
+        COMMAND_STRUCT.pack_into(
+            self._shmem,
+            COMMAND_RING_OFFSET + (sequence % COMMAND_RING_LENGTH) * COMMAND_STRUCT.size,
+            sequence,
+            time.monotonic_ns(),
+            flags,
+        )
+        # Publish only once the entry is complete.
+        U64_STRUCT.pack_into(self._shmem, MAILBOX_OFFSET, sequence)
+        self._notifier.publish(STATE_EVENT)
+        return sequence
+
+    def _read_command(self, sequence: int) -> T.Optional[DroneCommand]:
+        entry_sequence, posted_ns, flags = COMMAND_STRUCT.unpack_from(
+            self._shmem,
+            COMMAND_RING_OFFSET + (sequence % COMMAND_RING_LENGTH) * COMMAND_STRUCT.size,
         )
+        # A newer command has already taken its place in the ring.
+        if entry_sequence != sequence:
+            return None
+        return DroneCommand(sequence=sequence, flags=flags, posted_ns=posted_ns)
+
+    def poll_commands(self) -> T.List[DroneCommand]:
+        """
+        For the controller. Returns the commands posted since the last poll,
+        oldest first. Each must be passed to ack_command once executed.
+        Commands older than COMMAND_MAX_AGE_NS are acked as expired instead.
+        """
+        now = time.monotonic_ns()
+        U64_STRUCT.pack_into(self._shmem, SERVICED_OFFSET, now)
+        newest = self._u64(MAILBOX_OFFSET)
+        commands = []
+        first = max(self._polled_command_sequence + 1, newest - COMMAND_RING_LENGTH + 1)
+        # Posted faster than we polled, so their entries are already gone.
+        # Acks older than these would be overwritten right away.
+        for sequence in range(max(self._polled_command_sequence + 1, first - COMMAND_RING_LENGTH), first):
+            self._write_ack(sequence, now, ACK_DROPPED)
+        for sequence in range(first, newest + 1):
+            command = self._read_command(sequence)
+            if command is None:
+                continue
+            if now - command.posted_ns > COMMAND_MAX_AGE_NS:
+                self.ack_command(command, status=ACK_EXPIRED)
+                continue
+            commands.append(command)
+        self._polled_command_sequence = newest
+        self._seen_command_sequence = newest
+        return commands
+
+    def ack_command(self, command: DroneCommand, ok: bool = True, status: T.Optional[int] = None) -> None:
+        """
+        For the controller. Marks `command` as executed, and records how long
+        it took from being posted.
+        """
+        if status is None:
+            status = ACK_OK if ok else ACK_FAILED
+        now = time.monotonic_ns()
+        self._write_ack(command.sequence, now, status)
+        if status != ACK_EXPIRED:
+            self.command_latency.record(now - command.posted_ns)
+
+    def _write_ack(self, sequence: int, acked_ns: int, status: int) -> None:
+        offset = self._ack_offset(sequence)
+        # A command that finishes after one posted COMMAND_RING_LENGTH later
+        # was acked loses its ack, rather than overwriting the newer one.
+        if self._u64(offset) > sequence:
+            return
+        U64_STRUCT.pack_into(self._shmem, offset, 0)
+        ACK_STRUCT.pack_into(self._shmem, offset, 0, acked_ns, status)
+        U64_STRUCT.pack_into(self._shmem, offset, sequence)
+        self._notifier.publish(STATE_EVENT)
 
-        arr = np.zeros((CONTROL_LENGTH_IN_BYTES,), dtype=np.uint8)
-        arr[0] = commands
-        arr[1] = int_to_uint(state.left_right_vel)
-        arr[2] = int_to_uint(state.up_down_vel)
-        arr[3] = int_to_uint(state.fwd_back_vel)
-        arr[4] = int_to_uint(state.yaw_vel)
-        np.copyto(self._arr[:CONTROL_LENGTH_IN_BYTES], arr)
+    def wait_for_ack(self, sequence: int, timeout: T.Optional[float] = None) -> T.Optional[int]:
+        """
+        For scripts. Blocks until the controller acks command `sequence`, and
+        returns its ACK_* status (None if `timeout` passes first). Returns
+        ACK_UNKNOWN if the ack was already overwritten by a newer command's.
+        """
+        if not self._wait(STATE_EVENT, lambda: self._is_acked(sequence), timeout):
+            return None
+        acked_sequence, acked_ns, status = self._read_ack(sequence)
+        if acked_sequence != sequence:
+            return ACK_UNKNOWN
+        command = self._read_command(sequence)
+        if command is not None and status not in (ACK_EXPIRED, ACK_DROPPED):
+            self.command_latency.record(acked_ns - command.posted_ns)
+        return status
+
+    @property
+    def serviced_ns(self) -> int:
+        """
+        time.monotonic_ns() when the controller last polled for commands.
+        """
+        return self._u64(SERVICED_OFFSET)
 
     def get_state(self) -> DroneState:
-        arr = np.zeros((CONTROL_LENGTH_IN_BYTES,), dtype=np.uint8)
-        np.copyto(arr, self._arr[:CONTROL_LENGTH_IN_BYTES])
-        commands = arr[0]
+        """
+        Returns the velocities last saved by a script. The command flags are
+        set for commands that have been posted but not acked yet.
+        """
+        for _ in range(RC_READ_RETRIES):
+            rc = RC_STRUCT.unpack_from(self._shmem, RC_OFFSET)
+            if not rc[0] & 1 and self._u64(RC_OFFSET) == rc[0]:
+                self._last_rc = rc
+                break
+        else:
+            # The script kept writing (or died mid-write), so every copy may
+            # be torn. Fall back to the last one that wasn't.
+            rc = self._last_rc
+        sequence, written_ns, left_right, up_down, fwd_back, yaw = rc
+        if sequence != self.last_state_sequence and written_ns:
+            self.state_latency.record(time.monotonic_ns() - written_ns)
+        self.last_state_sequence = sequence
+
+        newest = self._u64(MAILBOX_OFFSET)
+        self._seen_command_sequence = newest
+        pending = 0
+        for command_sequence in range(max(newest - COMMAND_RING_LENGTH + 1, 1), newest + 1):
+            command = self._read_command(command_sequence)
+            if command is not None and not self._is_acked(command_sequence):
+                pending |= command.flags
         return DroneState(
-            land = (commands & LAND) > 0,
-            takeoff = (commands & TAKEOFF) > 0,
-            streamon = (commands & STREAMON) > 0,
-            streamoff = (commands & STREAMOFF) > 0,
-            emergency = (commands & EMERGENCY) > 0,
-            left_right_vel = uint_to_int(arr[1]),
-            up_down_vel = uint_to_int(arr[2]),
-            fwd_back_vel = uint_to_int(arr[3]),
-            yaw_vel = uint_to_int(arr[4]),
+            land = (pending & LAND) > 0,
+            takeoff = (pending & TAKEOFF) > 0,
+            streamon = (pending & STREAMON) > 0,
+            streamoff = (pending & STREAMOFF) > 0,
+            emergency = (pending & EMERGENCY) > 0,
+            left_right_vel = left_right,
+            up_down_vel = up_down,
+            fwd_back_vel = fwd_back,
+            yaw_vel = yaw,
+        )
+
+    @property
+    def latest_frame_id(self) -> int:
+        """
+        Id of the most recently published frame, or 0 if there is none yet.
+        """
+        return int(self._latest[0])
+
+    def save_frame(self, frame: np.ndarray, timestamp_ns: T.Optional[int] = None) -> int:
+        """
+        Publishes a frame into the next slot of the ring, and returns its
+        frame id.
+
+        `frame` is either already in this session's layout, or a BGR frame of
+        any size, which gets resized and converted on the way in.
+        """
+        layout = self.layout
+        native = frame.shape == layout.shape and frame.dtype == np.uint8
+        if not native and not (frame.ndim == 3 and frame.shape[2] == 3):
+            raise ValueError(f"Expected a {layout.shape} or BGR frame, got {frame.shape}")
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+
+        frame_id = int(self._latest[0]) + 1
+        slot = frame_id % len(self._slot_headers)
+        header = self._slot_headers[slot]
+
+        # Seqlock: odd while writing, even (and changed) once done. The "| 1"
+        # recovers a slot left odd by a writer that died mid-copy.
+        sequence = int(header[SLOT_SEQUENCE]) | 1
+        header[SLOT_SEQUENCE] = sequence
+        if native:
+            np.copyto(self._slot_views[None][slot], frame)
+        else:
+            layout.from_bgr(frame, self._slot_views[None][slot])
+        if self.lanes:
+            bgr = layout.to_bgr(frame) if native else frame
+            self._write_lanes(slot, bgr)
+        header[SLOT_FRAME_ID] = frame_id
+        header[SLOT_TIMESTAMP] = timestamp_ns
+        header[SLOT_SEQUENCE] = sequence + 1
+
+        # Only now do readers get pointed at the new slot.
+        self._latest[0] = frame_id
+        self._notifier.publish(FRAME_EVENT)
+        return frame_id
+
+    def _write_lanes(self, slot: int, bgr: np.ndarray) -> None:
+        # Each lane is computed once per frame here, instead of once per
+        # consumer. Lanes are downscaled from the half lane when there is
+        # one, which is a quarter of the pixels of the full frame.
+        half = self._slot_views[Lane.HALF][slot] if Lane.HALF in self._slot_views else None
+        for lane in self.lanes:
+            source = bgr if lane == Lane.HALF or half is None else half
+            self._lane_layouts[lane].from_bgr(source, self._slot_views[lane][slot])
+
+    def _wait(self, event: int, is_ready: T.Callable[[], bool], timeout: T.Optional[float]) -> bool:
+        # Subscribe before checking, so a publish in between still wakes us.
+        self._notifier.subscribe(event)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not is_ready():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+            self._notifier.wait(remaining)
+        return True
+
+    def wait_for_frame(self, timeout: T.Optional[float] = None, after: T.Optional[int] = None) -> bool:
+        """
+        Blocks until a frame newer than `after` (by default, the last frame
+        this handle read) is published. Returns False if `timeout` seconds
+        pass first.
+        """
+        if after is None:
+            after = self.last_frame_id
+        return self._wait(FRAME_EVENT, lambda: int(self._latest[0]) > after, timeout)
+
+    def wait_for_state(self, timeout: T.Optional[float] = None) -> bool:
+        """
+        Blocks until a script saves a state or posts a command after the last
+        get_state/poll_commands on this handle. Returns False if `timeout`
+        seconds pass first.
+        """
+        rc_after = self.last_state_sequence
+        command_after = self._seen_command_sequence
+        return self._wait(
+            STATE_EVENT,
+            lambda: self._u64(RC_OFFSET) != rc_after or self._u64(MAILBOX_OFFSET) != command_after,
+            timeout,
         )
 
-    def save_frame(self, frame: np.ndarray) -> None:
-        if frame.shape == (CAMERA_H, CAMERA_W, CAMERA_C):
-            np.copyto(self._arr[CONTROL_LENGTH_IN_BYTES:], frame.reshape((-1,)))
+    def save_telemetry(self, state: T.Mapping[str, T.Union[int, float]], timestamp_ns: T.Optional[int] = None) -> int:
+        """
+        Publishes one of the drone's state packets, as parsed by djitellopy
+        (see StateTap), and returns its sequence. Fields the packet doesn't
+        have are left 0. Only one thread per session should publish.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        sequence = int(self._telemetry_count[0]) + 1
+        row = self._telemetry[sequence % TELEMETRY_RING_LENGTH]
+        # Readers check the counter after copying, so a row is only torn if
+        # they fell a whole ring behind.
+        row["sequence"] = 0
+        row["timestamp_ns"] = timestamp_ns
+        for name in TELEMETRY_FIELDS:
+            value = state.get(name, 0)
+            row[name] = value if isinstance(value, (int, float)) else 0
+        row["sequence"] = sequence
+        self._telemetry_count[0] = sequence
+        self._notifier.publish(TELEMETRY_EVENT)
+        return sequence
+
+    @property
+    def latest_telemetry_sequence(self) -> int:
+        """
+        Sequence of the newest telemetry sample, or 0 if there is none yet.
+        """
+        return int(self._telemetry_count[0])
+
+    def read_telemetry(self, after: T.Optional[int] = None) -> np.ndarray:
+        """
+        Copies of the telemetry samples newer than `after` (by default, the
+        newest this handle has read), oldest first, as a TELEMETRY_DTYPE
+        array. At most the last TELEMETRY_RING_LENGTH - 1 are still there.
+
+            samples = ipc.read_telemetry(after=0)
+            recent = samples[samples["timestamp_ns"] > time.monotonic_ns() - 5_000_000_000]
+        """
+        if after is None:
+            after = self.last_telemetry_sequence
+        samples = self._copy_telemetry(after)
+        if len(samples):
+            self.last_telemetry_sequence = int(samples["sequence"][-1])
+        return samples
+
+    def _copy_telemetry(self, after: int) -> np.ndarray:
+        newest = int(self._telemetry_count[0])
+        first = max(after + 1, newest - TELEMETRY_RING_LENGTH + 2, 1)
+        if first > newest:
+            return np.zeros((0,), dtype=TELEMETRY_DTYPE)
+        sequences = np.arange(first, newest + 1, dtype=np.uint64)
+        samples = np.take(self._telemetry, sequences % TELEMETRY_RING_LENGTH)
+        # Anything the writer got to while we were copying may be torn. It
+        # may be writing the row after the newest, hence the +2 above.
+        overwritten_before = int(self._telemetry_count[0]) - TELEMETRY_RING_LENGTH + 2
+        keep = (samples["sequence"] == sequences) & (sequences >= max(overwritten_before, 1))
+        return samples[keep]
+
+    def latest_telemetry(self) -> T.Optional[np.void]:
+        """
+        A copy of the newest telemetry sample, or None if there is none yet.
+        Fields are read by name: `ipc.latest_telemetry()["bat"]`.
+        """
+        newest = int(self._telemetry_count[0])
+        samples = self._copy_telemetry(newest - 1) if newest else ()
+        return samples[-1] if len(samples) else None
+
+    def wait_for_telemetry(self, timeout: T.Optional[float] = None, after: T.Optional[int] = None) -> bool:
+        """
+        Blocks until a telemetry sample newer than `after` (by default, the
+        newest this handle has read) is published. Returns False if
+        `timeout` seconds pass first.
+        """
+        if after is None:
+            after = self.last_telemetry_sequence
+        return self._wait(TELEMETRY_EVENT, lambda: int(self._telemetry_count[0]) > after, timeout)
+
+    def _read_slot(self, frame_id: int, out: np.ndarray, lane: T.Optional[Lane] = None) -> T.Optional[int]:
+        """
+        Copies frame `frame_id` into `out` if its slot still holds it, and
+        returns its timestamp. Returns None if the copy may be torn.
+        """
+        slot = frame_id % len(self._slot_headers)
+        header = self._slot_headers[slot]
+        sequence = int(header[SLOT_SEQUENCE])
+        if sequence & 1 or int(header[SLOT_FRAME_ID]) != frame_id:
+            return None
+        np.copyto(out, self._slot_views[lane][slot])
+        timestamp_ns = int(header[SLOT_TIMESTAMP])
+        if int(header[SLOT_SEQUENCE]) != sequence:
+            return None
+        return timestamp_ns
+
+    def read_frame(self, after: T.Optional[int] = None, into: T.Optional[np.ndarray] = None, lane: T.Optional[Lane] = None) -> T.Optional[IPCFrame]:
+        """
+        Returns a consistent copy of the newest frame whose id is greater than
+        `after` (by default, the last frame this handle read), or None if there
+        is no such frame.
+
+        If `into` is given, the frame is copied into it instead of a new array.
+        If `lane` is given, that lane of the frame is read instead.
+        """
+        if after is None:
+            after = self.last_frame_id
+        layout = self.lane_layout(lane)
+        out = into if into is not None else np.empty(layout.shape, dtype=np.uint8)
+        for _ in range(FRAME_READ_RETRIES):
+            latest = int(self._latest[0])
+            if latest <= after:
+                return None
+            # Fall back to older slots if the newest one is being rewritten.
+            for frame_id in range(latest, max(after, latest - len(self._slot_headers)), -1):
+                timestamp_ns = self._read_slot(frame_id, out, lane)
+                if timestamp_ns is not None:
+                    self.last_frame_id = frame_id
+                    return IPCFrame(frame_id=frame_id, timestamp_ns=timestamp_ns, image=out)
+        return None
+
+    def borrow_frame(self, after: int = 0, strict: bool = True, lane: T.Optional[Lane] = None) -> FrameLease:
+        """
+        Lends out the newest frame (with id greater than `after`) without
+        copying it:
+
+            with ipc.borrow_frame() as frame:
+                ...
+
+        `frame` is a read-only view of shared memory, or None if there is no
+        such frame. If the producer overwrote the slot before the block ends,
+        FrameOverwrittenError is raised on exit (or, with strict=False, the
+        lease's `valid` is False). Don't keep the view past the block.
+        """
+        self.lane_layout(lane)
+        latest = int(self._latest[0])
+        for frame_id in range(latest, max(after, latest - len(self._slot_headers)), -1):
+            slot = frame_id % len(self._slot_headers)
+            header = self._slot_headers[slot]
+            sequence = int(header[SLOT_SEQUENCE])
+            if sequence & 1 or int(header[SLOT_FRAME_ID]) != frame_id:
+                continue
+            timestamp_ns = int(header[SLOT_TIMESTAMP])
+            image = self._slot_views[lane][slot].view()
+            image.flags.writeable = False
+            self.last_frame_id = frame_id
+            return FrameLease(header, sequence, frame_id, timestamp_ns, image, strict)
+        return FrameLease(None, 0, 0, 0, None, strict)
 
-    def get_frame(self) -> np.ndarray:
-        arr = np.empty((FRAME_LENGTH_IN_BYTES,), dtype=np.uint8)
-        np.copyto(arr, self._arr[CONTROL_LENGTH_IN_BYTES:])
-        return arr.reshape((CAMERA_H, CAMERA_W, CAMERA_C))
+    def get_frame(self, into: T.Optional[np.ndarray] = None, lane: T.Optional[Lane] = None) -> np.ndarray:
+        """
+        Returns a copy of the newest frame (all zeros if there is none yet).
+        Pass a preallocated uint8 array of shape `self.layout.shape` as
+        `into` to avoid allocating a new frame on every call.
+        """
+        frame = self.read_frame(after=0, into=into, lane=lane)
+        if frame is None:
+            if into is None:
+                return np.zeros(self.lane_layout(lane).shape, dtype=np.uint8)
+            into.fill(0)
+            return into
+        return frame.image
 
 
@@ -0,0 +1,61 @@
+"""
+Compares the per-frame cost of drawing a camera frame into the window, the
+old way (flip, resize, tobytes, new Surface) against DroneView.
+
+    python run.py tello_control.bench_render [n_frames]
+"""
+import os
+import sys
+import time
+import typing as T
+import numpy as np
+import cv2
+
+# No window needed, just a display surface of the right size and format.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+
+from .autonomous import CAMERA_W, CAMERA_H, CAMERA_C
+from .controller import DroneView
+
+WINDOW_SIZE = (1280, 800)
+
+
+def draw_copying(screen: pygame.Surface, frame: np.ndarray, view: DroneView) -> None:
+    # What render_drone_view used to do.
+    left, top, w, h = view.rect(screen.get_size())
+    smaller = cv2.resize(frame[:, :, ::-1], (w, h))
+    img = pygame.image.frombuffer(smaller.tobytes(), (w, h), "BGR")
+    screen.blit(img, ((left, top), (w, h)))
+
+
+def bench(name: str, draw: T.Callable[[pygame.Surface, np.ndarray], None], screen: pygame.Surface, frames: T.List[np.ndarray], n_frames: int) -> None:
+    # Warm up caches and the view's buffers.
+    for frame in frames:
+        draw(screen, frame)
+    start = time.perf_counter()
+    for i in range(n_frames):
+        draw(screen, frames[i % len(frames)])
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {elapsed / n_frames * 1e3:.3f} ms/frame")
+
+
+def main() -> None:
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    pygame.init()
+    screen = pygame.display.set_mode(WINDOW_SIZE)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (CAMERA_H, CAMERA_W, CAMERA_C), dtype=np.uint8) for _ in range(4)]
+
+    for full_screen in (False, True):
+        view = DroneView(full_screen=full_screen)
+        label = "full screen" if full_screen else "windowed"
+        print(f"{WINDOW_SIZE[0]}x{WINDOW_SIZE[1]} {label}, {CAMERA_W}x{CAMERA_H} frames")
+        bench("  before", lambda s, f: draw_copying(s, f, view), screen, frames, n_frames)
+        bench("  after ", view.draw, screen, frames, n_frames)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Logs of fixed-size numpy records: a 64-byte header naming the kind of log
+and its record size, then the records back to back, so a log can be
+memory-mapped straight into numpy while it's still being written.
+
+Kinds in use: input_log's events (1) and inputs (2), video_store's segment
+indexes (3) and h264_tee's packet index (4).
+"""
+import struct
+from pathlib import Path
+import numpy as np
+
+LOG_MAGIC = b"TINL"
+LOG_VERSION = 1
+# magic, version, kind, record size
+LOG_HEADER = struct.Struct("<4sHHI")
+LOG_HEADER_LENGTH = 64
+
+# Flush to disk after this many records, so a crash loses little.
+FLUSH_EVERY = 256
+
+
+class LogWriter:
+    """
+    Writes records of one dtype to a new log file, replacing any that was
+    there. With `append`, adds them to the end of an existing log instead.
+    """
+
+    def __init__(self, path: Path, kind: int, dtype: np.dtype, append: bool = False) -> None:
+        self.path = Path(path)
+        self.dtype = dtype
+        new = not append or not self.path.exists() or self.path.stat().st_size == 0
+        if not new:
+            _check_header(self.path, kind, dtype)
+        self._file = open(self.path, "wb" if new else "ab")
+        if new:
+            self._file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, kind, dtype.itemsize).ljust(LOG_HEADER_LENGTH, b"\0"))
+            # Readers can open the log as soon as it exists.
+            self._file.flush()
+        self._record = np.zeros((1,), dtype=dtype)
+        self._unflushed = 0
+
+    @property
+    def record(self) -> np.void:
+        """
+        Scratch record: fill it in, then call append().
+        """
+        return self._record[0]
+
+    def append(self) -> None:
+        self._file.write(self._record.tobytes())
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._unflushed = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _check_header(path: Path, kind: int, dtype: np.dtype) -> None:
+    with open(path, "rb") as f:
+        magic, version, file_kind, record_size = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+    if magic != LOG_MAGIC or version != LOG_VERSION or file_kind != kind or record_size != dtype.itemsize:
+        raise ValueError(f"{path} is not a version {LOG_VERSION} log of this kind")
+
+
+def read_log(path: Path, kind: int, dtype: np.dtype) -> np.ndarray:
+    """
+    Memory-maps a log's records. A partly written last record is ignored.
+    """
+    path = Path(path)
+    _check_header(path, kind, dtype)
+    n = (path.stat().st_size - LOG_HEADER_LENGTH) // dtype.itemsize
+    if n == 0:
+        return np.zeros((0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=LOG_HEADER_LENGTH, shape=(n,))
@@ -0,0 +1,163 @@
+import itertools
+import queue
+import threading
+import time
+import typing as T
+from dataclasses import dataclass, field
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+CANCELLED = "cancelled"
+
+# Queued jobs run in priority order, then in the order they were submitted.
+# Flight commands (takeoff, land, ...) go ahead of background work like
+# stream settings, which can only delay them by the one job in flight.
+PRIORITY_FLIGHT = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_STOP = 2
+
+
+@dataclass
+class Job:
+    name: str
+    fn: T.Callable[[], T.Any]
+    timeout_s: float
+    # Called on the thread that calls dispatch_completions, with whether the
+    # job succeeded.
+    on_done: T.Optional[T.Callable[[bool], None]] = None
+    priority: int = PRIORITY_FLIGHT
+    state: str = QUEUED
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    error: T.Optional[BaseException] = None
+
+
+class CommandExecutor:
+    """
+    Runs blocking drone calls (connect, takeoff, land, streamon, ...) one at
+    a time on a background thread, so the render/control loop never waits
+    on a UDP response.
+
+    Completion callbacks are not run on the worker. The loop calls
+    dispatch_completions() once per frame, and they run there, so they can
+    safely touch pygame (e.g. play sound cues).
+    """
+
+    def __init__(self, before_job: T.Optional[T.Callable[[], None]] = None) -> None:
+        # Called on the worker before each job, e.g. to drop drone replies
+        # left over from earlier commands.
+        self.before_job = before_job
+        # (priority, submission order, job). None stops the worker.
+        self._jobs: "queue.PriorityQueue[T.Tuple[int, int, T.Optional[Job]]]" = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._completed: "queue.Queue[Job]" = queue.Queue()
+        self._lock = threading.Lock()
+        # Jobs that are queued or running, by name.
+        self._pending: T.Dict[str, Job] = {}
+        self.in_flight: T.Optional[Job] = None
+        self._worker = threading.Thread(target=self._run, name="CommandExecutor", daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        name: str,
+        fn: T.Callable[[], T.Any],
+        timeout_s: float,
+        on_done: T.Optional[T.Callable[[bool], None]] = None,
+        priority: int = PRIORITY_FLIGHT,
+    ) -> T.Optional[Job]:
+        """
+        Queues `fn`. Returns None without queueing it if a job with the same
+        name is already queued or running, so mashing a button is harmless.
+        """
+        with self._lock:
+            if name in self._pending:
+                return None
+            job = Job(name=name, fn=fn, timeout_s=timeout_s, on_done=on_done, priority=priority)
+            self._pending[name] = job
+        self._jobs.put((priority, next(self._order), job))
+        return job
+
+    def cancel(self, name: str) -> bool:
+        """
+        Drops the job called `name` if it hasn't started yet. Its on_done is
+        not called. Returns whether there was one to drop.
+        """
+        with self._lock:
+            job = self._pending.get(name)
+            if job is None or job.state != QUEUED:
+                return False
+            job.state = CANCELLED
+            del self._pending[name]
+        return True
+
+    def busy(self, name: T.Optional[str] = None) -> bool:
+        with self._lock:
+            return name in self._pending if name is not None else bool(self._pending)
+
+    def _run(self) -> None:
+        while True:
+            _, _, job = self._jobs.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.state == CANCELLED:
+                    continue
+                job.started_at = time.monotonic()
+                job.state = RUNNING
+            self.in_flight = job
+            try:
+                if self.before_job is not None:
+                    self.before_job()
+                job.fn()
+                state = DONE
+            except Exception as e:
+                job.error = e
+                state = FAILED
+            job.finished_at = time.monotonic()
+            self.in_flight = None
+            with self._lock:
+                self._pending.pop(job.name, None)
+                # dispatch_completions may already have given up on it.
+                if job.state == TIMED_OUT:
+                    continue
+                job.state = state
+            self._completed.put(job)
+
+    def dispatch_completions(self) -> None:
+        """
+        Runs the callbacks of jobs that finished (or timed out) since the
+        last call. Call this from the main loop.
+        """
+        job = self.in_flight
+        if job is not None and job.state == RUNNING and time.monotonic() - job.started_at > job.timeout_s:
+            with self._lock:
+                if job.state == RUNNING:
+                    # There's no way to interrupt the call itself. Report it
+                    # now, and drop its result whenever it does return.
+                    job.state = TIMED_OUT
+                    self._completed.put(job)
+
+        while True:
+            try:
+                job = self._completed.get_nowait()
+            except queue.Empty:
+                return
+            elapsed = (job.finished_at or time.monotonic()) - job.started_at
+            if job.state == DONE:
+                print(f"{job.name} done in {elapsed:.2f}s")
+            elif job.error is not None:
+                print(f"{job.name} {job.state} after {elapsed:.2f}s: {job.error}")
+            else:
+                print(f"{job.name} {job.state} after {elapsed:.2f}s")
+            if job.on_done is not None:
+                job.on_done(job.state == DONE)
+
+    def close(self, timeout_s: float = 1.0) -> None:
+        self._jobs.put((_PRIORITY_STOP, next(self._order), None))
+        self._worker.join(timeout_s)
@@ -4,7 +4,18 @@ from dataclasses import dataclass, field
 import time
 from djitellopy import Tello
 import cv2
-from .autonomous import DroneIPC
+import numpy as np
+from .autonomous import DroneIPC, TAKEOFF, LAND, EMERGENCY, STREAMON, STREAMOFF
+from .command_executor import CommandExecutor
+from .rc_sender import RCSender
+from .scheduler import LoopScheduler
+from .stage_timer import StageTimer
+from .profiler import default_profiler
+from .tello_protocol import DEFAULT_COMMAND_PORT as DEFAULT_FAKE_COMMAND_PORT, discard_responses
+from .h264_tee import H264Tee
+from .video_decoder import VideoDecoder
+from .stream_governor import StreamGovernor
+from .state_tap import StateTap
 import logging
 from .sound_cues import SoundCuePlayer, SoundCue
 from .controller_state import (
@@ -12,17 +23,36 @@ from .controller_state import (
     WINDOWS_SHIELD_CONTROLLER,
     MAC_SHIELD_CONTROLLER,
     STEAM_DECK_INTEGRATED_CONTROLLER,
+    KEYBOARD_BUTTONS,
     Binding,
+    BindingTable,
     Input,
     Axis1D,
     Button,
     Hat,
 )
 import sys
+import os
+import argparse
 
 CONTROLLER: T.List[Binding]
 SCREEN_FLAGS = pygame.RESIZABLE
 FULL_SCREEN_DRONE = False
+# RC packets go out at this rate regardless of the frame rate.
+RC_RATE_HZ = 30
+
+# Lower the video quality when the loop can't hold its frame rate. See
+# StreamGovernor. Opt in: it changes the drone's stream settings mid-flight.
+ADAPTIVE_STREAM_QUALITY = False
+LOOP_RATE_HZ = 60
+
+# Set TELLO_STAGE_TIMING to time each stage of the main loop. If it names a
+# .csv or .ndjson file, the timings are written there on exit. F3 shows them
+# on screen.
+STAGE_TIMING = os.environ.get("TELLO_STAGE_TIMING", "")
+STAGE_REPORT_INTERVAL_S = 5.0
+STAGES = ("events", "control", "video", "render", "present", "wait")
+STAGE_EVENTS, STAGE_CONTROL, STAGE_VIDEO, STAGE_RENDER, STAGE_PRESENT, STAGE_WAIT = range(len(STAGES))
 
 if sys.platform == "win32":
     CONTROLLER = WINDOWS_SHIELD_CONTROLLER
@@ -38,37 +68,81 @@ else:
 
 
 
-def draw_controllers(screen: pygame.Surface, controller: Input) -> None:
+GRAY = (127, 127, 127)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+
+@dataclass(frozen=True)
+class HudLayout:
+    thumbstick_x: T.Tuple[int, int]
+    thumbstick_y: int
+    thumbstick_r: int
+    trigger_l: T.Tuple[int, int]
+    trigger_top: int
+    trigger_width: int
+    trigger_height: int
+
+    @staticmethod
+    def for_size(width: int, height: int) -> "HudLayout":
+        trigger_width = width // 12
+        return HudLayout(
+            thumbstick_x=(2 * width // 12, 10 * width // 12),
+            thumbstick_y=height - (2 * width // 12),
+            thumbstick_r=width // 12,
+            trigger_l=(width // 6 - trigger_width // 2, 5 * width // 6 - trigger_width // 2),
+            trigger_top=0,
+            trigger_width=trigger_width,
+            trigger_height=height // 4,
+        )
+
+    def regions(self) -> T.List[pygame.Rect]:
+        """
+        Everything the controller overlay can ever draw on, one rect per
+        stick and trigger.
+        """
+        # A stick's dot can be pushed one radius off center, plus its own size.
+        reach = self.thumbstick_r + self.thumbstick_r // 3 + 1
+        sticks = [
+            pygame.Rect(x - reach, self.thumbstick_y - reach, 2 * reach, 2 * reach)
+            for x in self.thumbstick_x
+        ]
+        triggers = [
+            pygame.Rect(left, self.trigger_top, self.trigger_width, self.trigger_height)
+            for left in self.trigger_l
+        ]
+        return sticks + triggers
+
+def draw_controller_background(screen: pygame.Surface) -> None:
+    """
+    The parts of the overlay that don't depend on input.
+    """
+    layout = HudLayout.for_size(*screen.get_size())
+    for x in layout.thumbstick_x:
+        pygame.draw.circle(
+            surface = screen,
+            color = GRAY,
+            center = (x, layout.thumbstick_y),
+            radius = layout.thumbstick_r,
+        )
+    for left in layout.trigger_l:
+        pygame.draw.rect(
+            surface=screen,
+            color=GRAY,
+            rect=((left, layout.trigger_top), (layout.trigger_width, layout.trigger_height)),
+        )
+
+def draw_controller_indicators(screen: pygame.Surface, controller: Input) -> None:
     width, height = screen.get_size()
+    layout = HudLayout.for_size(width, height)
+    l_thumbstick_x, r_thumbstick_x = layout.thumbstick_x
+    thumbstick_y = layout.thumbstick_y
+    thumbstick_r = layout.thumbstick_r
 
     l_offset_x = controller[Axis1D.L_THUMBSTICK_X] * width // 12
     l_offset_y = -1 * controller[Axis1D.L_THUMBSTICK_Y] * width // 12
     r_offset_x = controller[Axis1D.R_THUMBSTICK_X] * width // 12
     r_offset_y = -1 * controller[Axis1D.R_THUMBSTICK_Y] * width // 12
 
-    l_thumbstick_x = 2 * width // 12
-    r_thumbstick_x = 10 * width // 12
-    thumbstick_y = height - (2 * width // 12)
-    thumbstick_r = width // 12
-
-    GRAY = (127, 127, 127)
-    RED = (255, 0, 0)
-    GREEN = (0, 255, 0)
-
-    pygame.draw.circle(
-        surface = screen,
-        color = GRAY,
-        center = (l_thumbstick_x, thumbstick_y),
-        radius = thumbstick_r,
-    )
-
-    pygame.draw.circle(
-        surface = screen,
-        color = GRAY,
-        center = (r_thumbstick_x, thumbstick_y),
-        radius = thumbstick_r,
-    )
-
     pygame.draw.circle(
         surface = screen,
         color = RED,
@@ -83,28 +157,14 @@ def draw_controllers(screen: pygame.Surface, controller: Input) -> None:
         radius = thumbstick_r // 3,
     )
 
-    trigger_width = width // 12
-    trigger_height = height // 4
-    trigger_top = 0
-
-    l_trigger_l = width // 6 - trigger_width // 2
-    r_trigger_l = 5 * width // 6 - trigger_width // 2
+    l_trigger_l, r_trigger_l = layout.trigger_l
+    trigger_top = layout.trigger_top
+    trigger_width = layout.trigger_width
+    trigger_height = layout.trigger_height
 
     l_trigger_offset = int(controller[Axis1D.L_TRIGGER] * trigger_height)
     r_trigger_offset = int(controller[Axis1D.R_TRIGGER] * trigger_height)
 
-    pygame.draw.rect(
-        surface=screen,
-        color=GRAY,
-        rect=((l_trigger_l, trigger_top), (trigger_width, trigger_height)),
-    )
-
-    pygame.draw.rect(
-        surface=screen,
-        color=GRAY,
-        rect=((r_trigger_l, trigger_top), (trigger_width, trigger_height)),
-    )
-
     pygame.draw.rect(
         surface=screen,
         color=RED,
@@ -117,45 +177,82 @@ def draw_controllers(screen: pygame.Surface, controller: Input) -> None:
         rect=((r_trigger_l, trigger_top + (trigger_height - r_trigger_offset)), (trigger_width, r_trigger_offset)),
     )
 
+def draw_controllers(screen: pygame.Surface, controller: Input) -> None:
+    draw_controller_background(screen)
+    draw_controller_indicators(screen, controller)
 
+def _to_control(x: float) -> int:
+    return int(clamp(x * 100, -100, 100))
 
+# How long to wait on a command before reporting it as failed. djitellopy
+# retries each command, waiting up to its response timeout every time.
+COMMAND_TIMEOUT_S = Tello.RESPONSE_TIMEOUT * Tello.RETRY_COUNT
+TAKEOFF_TIMEOUT_S = Tello.TAKEOFF_TIMEOUT * Tello.RETRY_COUNT
 
+def _cue_when_done(sound_player: SoundCuePlayer, cue: SoundCue) -> T.Callable[[bool], None]:
+    def on_done(ok: bool) -> None:
+        if ok:
+            sound_player.cue(cue)
+    return on_done
 
-def _to_control(x: float) -> int:
-    return int(clamp(x * 100, -100, 100))
+# These run on the executor, so they check is_flying when they actually run,
+# not when the button was pressed.
+def _takeoff(tello: Tello) -> None:
+    if not tello.is_flying:
+        tello.takeoff()
+
+def _land(tello: Tello) -> None:
+    if tello.is_flying:
+        tello.land()
+
+def emergency_stop(tello: Tello) -> None:
+    # Sent right away without waiting for a response. Going through the
+    # executor would queue it behind whatever command is in flight. The
+    # drone still replies, and the executor throws that reply away before
+    # its next command (see discard_responses).
+    tello.send_command_without_return("emergency")
+    tello.is_flying = False
 
-def control_drone(tello: Tello, controller: Input, sound_player: SoundCuePlayer) -> None:
+def control_drone(tello: Tello, controller: Input, sound_player: SoundCuePlayer, executor: CommandExecutor, rc_sender: RCSender) -> None:
     if controller.get_down(Button.A):
         # TODO: If your drone crashes, tello.is_flying is False, so you can't
         # takeoff again. But, if you call tello.takeoff() twice in the air,
         # the drone returns errors and crashes.
         print("takeoff")
-        if not tello.is_flying:
+        if not tello.is_flying and executor.submit(
+            "takeoff", lambda: _takeoff(tello), TAKEOFF_TIMEOUT_S,
+            on_done=_cue_when_done(sound_player, SoundCue.READY),
+        ):
             sound_player.cue(SoundCue.TAKEOFF)
-            tello.takeoff()
-            sound_player.cue(SoundCue.READY)
     if controller.get_down(Button.B):
         print("land")
         # TODO: If you call land twice in the air or on the ground, the program
         # crashes and the drone lands.
-        if tello.is_flying:
-            tello.land()
-            sound_player.cue(SoundCue.LANDING)
+        executor.submit(
+            "land", lambda: _land(tello), COMMAND_TIMEOUT_S,
+            on_done=_cue_when_done(sound_player, SoundCue.LANDING),
+        )
     if controller.get_down(Button.START):
         print("connect")
-        sound_player.cue(SoundCue.CONNECTING)
-        tello.connect()
-        sound_player.cue(SoundCue.CONNECTED)
+        if executor.submit(
+            "connect", tello.connect, COMMAND_TIMEOUT_S,
+            on_done=_cue_when_done(sound_player, SoundCue.CONNECTED),
+        ):
+            sound_player.cue(SoundCue.CONNECTING)
     if controller.get_down(Button.X):
         print("streamon")
         # Enables video stream.
-        tello.streamon()
-        sound_player.cue(SoundCue.RECORDING)
+        executor.submit(
+            "streamon", tello.streamon, COMMAND_TIMEOUT_S,
+            on_done=_cue_when_done(sound_player, SoundCue.RECORDING),
+        )
     if controller.get_down(Button.Y):
         print("streamoff")
         # Disables video stream.
-        tello.streamoff()
-        sound_player.cue(SoundCue.STOP_RECORDING)
+        executor.submit(
+            "streamoff", tello.streamoff, COMMAND_TIMEOUT_S,
+            on_done=_cue_when_done(sound_player, SoundCue.STOP_RECORDING),
+        )
     
     # Unsupported by our tello - might need a firmware update.
     """
@@ -186,98 +283,284 @@ def control_drone(tello: Tello, controller: Input, sound_player: SoundCuePlayer)
         left_right_velocity = controller[Axis1D.L_THUMBSTICK_X]
         fw_backward_velocity = controller[Axis1D.L_THUMBSTICK_Y]
 
-        tello.send_rc_control(
-            left_right_velocity=_to_control(left_right_velocity),
-            forward_backward_velocity=_to_control(fw_backward_velocity),
-            up_down_velocity=_to_control(up_down_velocity),
-            yaw_velocity=_to_control(yaw_velocity),
+        rc_sender.set(
+            _to_control(left_right_velocity),
+            _to_control(fw_backward_velocity),
+            _to_control(up_down_velocity),
+            _to_control(yaw_velocity),
         )
+    else:
+        rc_sender.clear()
 
 def print_kw(**kwargs):
     print(" ".join((f"{key}={kwargs[key]}" for key in kwargs)))
 
-def control_drone_autonomous(tello: Tello, drone_ipc: DroneIPC):
-    state = drone_ipc.get_state()
-    if state.takeoff:
-        if not tello.is_flying:
-            tello.takeoff()
-    if state.land:
-        if tello.is_flying:
-            tello.land()
-    if state.emergency:
-        tello.emergency()
-    if state.streamon:
+def _run_command(tello: Tello, flags: int) -> None:
+    if flags & TAKEOFF:
+        _takeoff(tello)
+    if flags & LAND:
+        _land(tello)
+    if flags & STREAMON:
         tello.streamon()
-    if state.streamoff:
+    if flags & STREAMOFF:
         tello.streamoff()
-    
+
+def control_drone_autonomous(tello: Tello, drone_ipc: DroneIPC, sound_player: SoundCuePlayer, executor: CommandExecutor, rc_sender: RCSender):
+    # Commands are one-shot: each is run once, then acked back to the script
+    # when the executor finishes it.
+    for command in drone_ipc.poll_commands():
+        if command.flags & EMERGENCY:
+            emergency_stop(tello)
+            sound_player.cue(SoundCue.EMERGENCY)
+            if not command.flags & ~EMERGENCY:
+                drone_ipc.ack_command(command)
+                continue
+
+        def on_done(ok: bool, command=command) -> None:
+            drone_ipc.ack_command(command, ok)
+            if ok and command.flags & TAKEOFF:
+                sound_player.cue(SoundCue.READY)
+            if ok and command.flags & LAND:
+                sound_player.cue(SoundCue.LANDING)
+
+        # Each command gets its own job name, so none are dropped as duplicates.
+        executor.submit(
+            f"command {command.sequence}",
+            lambda flags=command.flags: _run_command(tello, flags),
+            TAKEOFF_TIMEOUT_S if command.flags & TAKEOFF else COMMAND_TIMEOUT_S,
+            on_done=on_done,
+        )
+        if command.flags & TAKEOFF and not tello.is_flying:
+            sound_player.cue(SoundCue.TAKEOFF)
+
+    state = drone_ipc.get_state()
     if tello.is_flying:
-        tello.send_rc_control(
-            left_right_velocity=state.left_right_vel,
-            forward_backward_velocity=state.fwd_back_vel,
-            up_down_velocity=state.up_down_vel,
-            yaw_velocity=state.yaw_vel,
+        rc_sender.set(
+            state.left_right_vel,
+            state.fwd_back_vel,
+            state.up_down_vel,
+            state.yaw_vel,
         )
+    else:
+        rc_sender.clear()
 
-def render_drone_view(screen: pygame.Surface, tello: Tello, drone_ipc: DroneIPC) -> None:
-    if tello.stream_on:
-        reader = tello.get_frame_read()
-        
-        frame = reader.frame
-        drone_ipc.save_frame(frame)
-
-        screen_w, screen_h = screen.get_size()
-
-        if FULL_SCREEN_DRONE:
-            left = 0
-            top = 0
-            w = screen_w
-            h = screen_h
+class DroneView:
+    """
+    Draws camera frames into the window without allocating per frame.
+
+    Frames are resized straight into a buffer that a pygame Surface shares
+    memory with, so blitting needs no further copies. The buffer and Surface
+    are only rebuilt when the window size changes.
+    """
+
+    def __init__(self, full_screen: bool = FULL_SCREEN_DRONE) -> None:
+        self.full_screen = full_screen
+        self._screen_size: T.Optional[T.Tuple[int, int]] = None
+        self._rect: T.Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self._buffer: T.Optional[np.ndarray] = None
+        self._surface: T.Optional[pygame.Surface] = None
+        self._has_frame = False
+
+    def rect(self, screen_size: T.Tuple[int, int]) -> T.Tuple[int, int, int, int]:
+        screen_w, screen_h = screen_size
+        if self.full_screen:
+            return (0, 0, screen_w, screen_h)
+        left = 3 * screen_w // 12
+        right = 9 * screen_w // 12
+        top = screen_h // 10
+        bottom = 9 * screen_h // 10
+        return (left, top, right - left, bottom - top)
+
+    def _resize(self, screen_size: T.Tuple[int, int]) -> None:
+        self._screen_size = screen_size
+        self._rect = self.rect(screen_size)
+        _, _, w, h = self._rect
+        self._buffer = np.empty((h, w, 3), dtype=np.uint8)
+        # Frames are BGR already, so the buffer is used as-is.
+        self._surface = pygame.image.frombuffer(self._buffer, (w, h), "BGR")
+        self._has_frame = False
+
+    def update(self, screen_size: T.Tuple[int, int], frame: np.ndarray) -> None:
+        if screen_size != self._screen_size:
+            self._resize(screen_size)
+        _, _, w, h = self._rect
+        if frame.shape[:2] == (h, w):
+            np.copyto(self._buffer, frame)
         else:
-            left = 3 * screen_w // 12
-            right = 9 * screen_w // 12
-            top = screen_h // 10
-            bottom = 9 * screen_h // 10
-
-            w, h = (right - left), (bottom - top)
-
-        smaller = cv2.resize(frame[:, :, ::-1], (w, h))
-        img = pygame.image.frombuffer(smaller.tobytes(), (w, h), "BGR")
-        screen.blit(
-            img,
-            (
-                (left, top),
-                (w, h)
-            )
-        )
+            cv2.resize(frame, (w, h), dst=self._buffer)
+        self._has_frame = True
+
+    def clear(self) -> None:
+        self._has_frame = False
+
+    def blit(self, screen: pygame.Surface) -> None:
+        if self._has_frame:
+            left, top, _, _ = self._rect
+            screen.blit(self._surface, (left, top))
+
+    def draw(self, screen: pygame.Surface, frame: np.ndarray) -> None:
+        self.update(screen.get_size(), frame)
+        self.blit(screen)
+
+class ScreenRenderer:
+    """
+    Redraws only the parts of the window that changed since the last call,
+    and only pushes those to the display.
+
+    The video is redrawn when its frame id changes, the controller overlay
+    when the Input's version does. Everything static (the black background
+    and the gray parts of the overlay) is drawn once per window size into a
+    cached Surface, and copied back from there.
+    """
+
+    def __init__(self, view: DroneView, show_controllers: bool = not FULL_SCREEN_DRONE) -> None:
+        self.view = view
+        self.show_controllers = show_controllers
+        self._screen_size: T.Optional[T.Tuple[int, int]] = None
+        self._background: T.Optional[pygame.Surface] = None
+        self._regions: T.List[pygame.Rect] = []
+        self._frame_id = 0
+        self._input_version = -1
+        # Drawn over everything else in the top left, e.g. stage timings.
+        self._overlay: T.Optional[pygame.Surface] = None
+        self._overlay_dirty: T.List[pygame.Rect] = []
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+
+    def set_overlay(self, overlay: T.Optional[pygame.Surface]) -> None:
+        for each in (self._overlay, overlay):
+            if each is not None:
+                self._overlay_dirty.append(each.get_rect())
+        self._overlay = overlay
+
+    def _resize(self, screen: pygame.Surface) -> None:
+        self._screen_size = screen.get_size()
+        self._background = pygame.Surface(self._screen_size, 0, screen)
+        self._background.fill((0, 0, 0))
+        if self.show_controllers:
+            draw_controller_background(self._background)
+            self._regions = HudLayout.for_size(*self._screen_size).regions()
+
+    def render(self, screen: pygame.Surface, frame_id: int, frame: T.Optional[np.ndarray], controller: Input) -> T.List[pygame.Rect]:
+        """
+        `frame_id` identifies `frame`; 0 (with no frame) means there's no video.
+        Returns the rects that were repainted, to pass to present().
+        """
+        dirty: T.List[pygame.Rect] = []
+        full_redraw = screen.get_size() != self._screen_size
+        if full_redraw:
+            self._resize(screen)
+
+        if frame_id != self._frame_id or full_redraw:
+            self._frame_id = frame_id
+            if frame is None:
+                self.view.clear()
+            else:
+                self.view.update(self._screen_size, frame)
+            dirty.append(pygame.Rect(self.view.rect(self._screen_size)))
+
+        if self.show_controllers and controller.version != self._input_version:
+            self._input_version = controller.version
+            dirty.extend(self._regions)
+
+        dirty.extend(self._overlay_dirty)
+        self._overlay_dirty.clear()
+
+        if full_redraw:
+            dirty = [screen.get_rect()]
+        if not dirty:
+            self.frames_skipped += 1
+            return dirty
+
+        # Repaint every layer, in order, but clipped to each changed rect.
+        for rect in dirty:
+            screen.set_clip(rect)
+            screen.blit(self._background, rect, rect)
+            self.view.blit(screen)
+            if self.show_controllers:
+                draw_controller_indicators(screen, controller)
+            if self._overlay is not None:
+                screen.blit(self._overlay, (0, 0))
+        screen.set_clip(None)
+        self.frames_drawn += 1
+        return dirty
+
+    def present(self, dirty: T.List[pygame.Rect]) -> None:
+        if dirty:
+            pygame.display.update(dirty)
 
 def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tello-host", default=Tello.TELLO_IP, help="e.g. 127.0.0.1 for fake_tello")
+    parser.add_argument("--tello-port", type=int, default=None, help="command port, if not the drone's")
+    parser.add_argument("--record-h264", default=None, help="record the undecoded video stream to this path (.h264/.index)")
+    parser.add_argument("--keyboard", action="store_true", help="fly with the keyboard too (always on away from the real drone)")
+    args = parser.parse_args()
+    # A stray key press shouldn't fly (or cut) a real drone, so the keys are
+    # only bound when asked for, or when flying fake_tello.
+    use_keyboard = args.keyboard or args.tello_host != Tello.TELLO_IP
+
     pygame.init()
     size = (1280, 800)
     screen = pygame.display.set_mode(size, SCREEN_FLAGS)
-    tello = Tello()
+    tello = Tello(host=args.tello_host)
+    if args.tello_port is not None:
+        tello.address = (args.tello_host, args.tello_port)
+    elif args.tello_host != Tello.TELLO_IP:
+        tello.address = (args.tello_host, DEFAULT_FAKE_COMMAND_PORT)
     tello.LOGGER.setLevel(logging.INFO)
+    tee = None
+    if args.record_h264 is not None:
+        # The tee takes the video port, records, and passes each packet on
+        # to the decoder.
+        tee = H264Tee(args.record_h264)
+        tee.start()
+        tello.VS_UDP_IP = "127.0.0.1"
+        tello.VS_UDP_PORT = tee.forward_port
+    try:
+        # Decodes only the newest frame, so the view can't fall behind.
+        decoder = VideoDecoder(port=tello.VS_UDP_PORT).start()
+    except ImportError:
+        print("PyAV isn't installed, so djitellopy decodes the video")
+        decoder = None
     n_controllers = pygame.joystick.get_count()
-    assert n_controllers == 1
-    joystick = pygame.joystick.Joystick(0)
-    print(joystick.get_name())
+    assert n_controllers <= 1
+    # Without a controller (e.g. benchmarking against fake_tello), only the
+    # keyboard shortcuts work, if they're enabled.
+    joystick = pygame.joystick.Joystick(0) if n_controllers else None
+    print(joystick.get_name() if joystick is not None else "No controller")
     should_quit: bool = False
-    target_seconds_per_frame: float = 1 / 60
+    scheduler = LoopScheduler(LOOP_RATE_HZ, name="frame")
     
     controller_state = Input()
+    bindings = BindingTable(CONTROLLER + (KEYBOARD_BUTTONS if use_keyboard else []))
     sound_player = SoundCuePlayer()
 
     autonomous_mode = False
-
-    with DroneIPC() as ipc:
+    executor = CommandExecutor(before_job=lambda: discard_responses(tello))
+    governor = StreamGovernor(tello, executor, LOOP_RATE_HZ, decoder=decoder) if ADAPTIVE_STREAM_QUALITY else None
+    renderer = ScreenRenderer(DroneView())
+    timer = StageTimer(STAGES, enabled=bool(STAGE_TIMING))
+    show_timings = False
+    overlay_font = pygame.font.Font(None, 20)
+    drone_frame: T.Optional[np.ndarray] = None
+    drone_frame_id = 0
+
+    with DroneIPC() as ipc, RCSender(tello, rate_hz=RC_RATE_HZ) as rc_sender, StateTap(tello, ipc.save_telemetry) as state_tap:
         while not should_quit:
-            frame_start = time.time()
+            loop_started = time.perf_counter()
+            timer.begin()
             controller_state._tick()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                     should_quit = True
-                for each_binding in CONTROLLER:
-                    each_binding.process_event(event, controller_state)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                    default_profiler().toggle()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and timer.enabled:
+                    show_timings = not show_timings
+                    renderer.set_overlay(timer.render_overlay(overlay_font) if show_timings else None)
+                bindings.process_event(event, controller_state)
+            timer.mark(STAGE_EVENTS)
 
             if should_quit:
                 break
@@ -287,30 +570,77 @@ def main() -> None:
                 print(f"{autonomous_mode=}")
                 sound_player.cue(SoundCue.AUTONOMOUS if autonomous_mode else SoundCue.MANUAL)
             if controller_state.get_down(Button.L_BUTTON):
-                tello.emergency()
+                emergency_stop(tello)
                 sound_player.cue(SoundCue.EMERGENCY)
+            if controller_state.get_down(Button.BACK):
+                default_profiler().toggle()
+
+            # Runs callbacks (sound cues, acks) for commands that finished.
+            executor.dispatch_completions()
 
             if autonomous_mode:
-                control_drone_autonomous(tello, ipc, sound_player)
+                control_drone_autonomous(tello, ipc, sound_player, executor, rc_sender)
             else:
-                control_drone(tello, controller_state, sound_player)
+                control_drone(tello, controller_state, sound_player, executor, rc_sender)
+            timer.mark(STAGE_CONTROL)
             
-            screen.fill((0,0,0))
-
-            render_drone_view(screen, tello, ipc)
-            if not FULL_SCREEN_DRONE:
-                draw_controllers(screen, controller_state)
-
-            pygame.display.flip()
-            frame_end = time.time()
-            elapsed = frame_end - frame_start
-
-            if elapsed > target_seconds_per_frame:
-                print("DROP")
-            if elapsed < target_seconds_per_frame:
-                time.sleep(target_seconds_per_frame - elapsed)
-
+            # Both decoders replace the frame array whenever they decode a
+            # new one, so an unchanged array means there's nothing new to show.
+            if decoder is not None:
+                decoded = decoder.latest() if tello.stream_on else None
+                frame = decoded.image if decoded is not None else None
+            else:
+                decoded = None
+                frame = tello.get_frame_read().frame if tello.stream_on else None
+            if frame is not drone_frame:
+                drone_frame = frame
+                if frame is None:
+                    drone_frame_id = 0
+                else:
+                    # Stamped with when it arrived, so consumers can tell its age.
+                    drone_frame_id = ipc.save_frame(frame, timestamp_ns=decoded.received_ns if decoded is not None else None)
+            timer.mark(STAGE_VIDEO)
+
+            dirty = renderer.render(screen, drone_frame_id, drone_frame, controller_state)
+            timer.mark(STAGE_RENDER)
+            renderer.present(dirty)
+            timer.mark(STAGE_PRESENT)
+
+            if timer.report_due(STAGE_REPORT_INTERVAL_S):
+                print("\n".join(timer.summary_lines()))
+                if show_timings:
+                    renderer.set_overlay(timer.render_overlay(overlay_font))
+
+            work_s = time.perf_counter() - loop_started
+            on_time = scheduler.wait()
+            if governor is not None:
+                governor.record_frame(work_s, on_time)
+            timer.mark(STAGE_WAIT)
+            timer.end()
+
+        print(state_tap.summary())
+        print(ipc.command_latency.summary())
+        print(ipc.state_latency.summary())
+        print(scheduler.summary())
+        print(rc_sender.summary())
+        if governor is not None:
+            print(governor.summary())
+        print(f"frames drawn={renderer.frames_drawn} skipped={renderer.frames_skipped}")
+        if timer.enabled:
+            print("\n".join(timer.summary_lines()))
+            if STAGE_TIMING.endswith((".csv", ".ndjson")):
+                timer.dump(STAGE_TIMING)
+
+    default_profiler().stop()
+    executor.close()
+    if decoder is not None:
+        decoder.close()
+        print(decoder.summary())
+    if tee is not None:
+        tee.close()
+        print(tee.summary())
     pygame.quit()
+    discard_responses(tello)
     if tello.stream_on:
         tello.streamoff()
     if tello.is_flying:
@@ -37,7 +37,7 @@ class Button(Enum):
     # Connect to the tello.
     START = "START"
 
-    # Does nothing
+    # Starts / stops the sampling profiler.
     BACK = "BACK"
     # Emergency (immediately shuts off motors).
     HOME = "HOME"
@@ -90,6 +90,13 @@ class Input:
     _buttons: T.Dict[Button, bool] = field(default_factory=dict)
     _prev_buttons: T.Dict[Button, bool] = field(default_factory=dict)
     _hats: T.Dict[Hat, T.Tuple[int, int]] = field(default_factory=dict)
+    # Buttons that went down / up at some point since the last _tick, even if
+    # they were released / pressed again before it.
+    _pressed: T.Set[Button] = field(default_factory=set)
+    _released: T.Set[Button] = field(default_factory=set)
+    # Bumped whenever any value changes, so readers can tell cheaply whether
+    # there's anything new since they last looked.
+    version: int = 0
 
     def __getitem__(self, inp: T.Union[Axis1D, Button, Hat]) -> T.Union[float, bool, T.Tuple[int, int]]:
         if isinstance(inp, Axis1D):
@@ -105,6 +112,8 @@ class Input:
         Returns True the frame if the button changed
         from up -> down this frame.
         """
+        if button in self._pressed:
+            return True
         return self._buttons.get(button, False) and not self._prev_buttons.get(button, False)
     
     def get_up(self, button: Button) -> bool:
@@ -112,6 +121,8 @@ class Input:
         Returns True the frame if the button changed
         from down -> up this frame.
         """
+        if button in self._released:
+            return True
         return not self._buttons.get(button, False) and self._prev_buttons.get(button, False)
     
     def _tick(self) -> None:
@@ -120,26 +131,53 @@ class Input:
         """
         self._prev_buttons.clear()
         self._prev_buttons.update(self._buttons)
+        self._pressed.clear()
+        self._released.clear()
 
     def __setitem__(self, key: T.Union[Axis1D, Button, Hat], value: T.Union[float, bool, T.Tuple[int, int]]) -> T.Union[float, bool, T.Tuple[int, int]]:
         if isinstance(key, Axis1D):
             assert isinstance(value, float)
-            self._axes[key] = clamp(value, -1.0, 1.0)
+            values = self._axes
+            value = clamp(value, -1.0, 1.0)
         elif isinstance(key, Button):
             assert isinstance(value, bool)
-            self._buttons[key] = value
+            values = self._buttons
         elif isinstance(key, Hat):
             assert isinstance(value, tuple) and len(value) == 2 and all((v in [-1, 0, 1] for v in value))
-            self._hats[key] = value
+            values = self._hats
         else:
             raise KeyError(f"Unknown key: {key}")
 
+        if values.get(key) != value:
+            # Kept until the next _tick, so a press and release between two
+            # frames still shows up in get_down and get_up.
+            if values is self._buttons and self._buttons.get(key, False) != value:
+                (self._pressed if value else self._released).add(key)
+            values[key] = value
+            self.version += 1
+
         return value
 
+# Key a binding is looked up by: (event type, axis/button/hat id)
+EventKey = T.Tuple[int, int]
+
 class Binding(ABC):
     def process_event(self, event: pygame.event.Event, controller: Input) -> None:
         ...
 
+    def event_keys(self) -> T.List[EventKey]:
+        """
+        The events this binding reacts to.
+        """
+        return []
+
+    def apply(self, event: pygame.event.Event, controller: Input) -> None:
+        """
+        Like process_event, but for an event already known to match one of
+        event_keys(), so nothing is rechecked.
+        """
+        ...
+
 @dataclass
 class AxisBinding(Binding):
     axis: Axis1D
@@ -147,15 +185,34 @@ class AxisBinding(Binding):
     multiply: float = 1.0
     offset: float = 0.0
     deadzone: float = 0.1
+    # Stretches what's left after the dead zone back out to -1 .. 1.
+    _scale: float = field(init=False, repr=False, default=1.0)
+
+    def __post_init__(self) -> None:
+        self._scale = 1.0 / (1.0 - self.deadzone)
 
     def process_event(self, event: pygame.event.Event, controller: Input) -> None:
         if event.type == pygame.JOYAXISMOTION:
             if event.axis == self.axis_id:
-                value = 0 if abs(event.value) < self.deadzone else (
-                    (event.value - sign(event.value) * self.deadzone) / (1.0 - self.deadzone)
-                )
-                adjusted = value * self.multiply + self.offset
-                controller[self.axis] = adjusted
+                self.apply(event, controller)
+
+    def event_keys(self) -> T.List[EventKey]:
+        return [(pygame.JOYAXISMOTION, self.axis_id)]
+
+    def apply(self, event: pygame.event.Event, controller: Input) -> None:
+        controller[self.axis] = self.transform(event.value)
+
+    def transform(self, value: float) -> float:
+        """
+        Maps a raw axis reading to this binding's range.
+        """
+        if value >= self.deadzone:
+            value = (value - self.deadzone) * self._scale
+        elif value <= -self.deadzone:
+            value = (value + self.deadzone) * self._scale
+        else:
+            value = 0.0
+        return value * self.multiply + self.offset
 
 @dataclass
 class ButtonBinding(Binding):
@@ -164,9 +221,14 @@ class ButtonBinding(Binding):
 
     def process_event(self, event: pygame.event.Event, controller: Input) -> None:
         if event.type == pygame.JOYBUTTONDOWN or event.type == pygame.JOYBUTTONUP:
-            newval = True if event.type == pygame.JOYBUTTONDOWN else False
             if event.button == self.button_id:
-                controller[self.button] = newval
+                self.apply(event, controller)
+
+    def event_keys(self) -> T.List[EventKey]:
+        return [(pygame.JOYBUTTONDOWN, self.button_id), (pygame.JOYBUTTONUP, self.button_id)]
+
+    def apply(self, event: pygame.event.Event, controller: Input) -> None:
+        controller[self.button] = event.type == pygame.JOYBUTTONDOWN
 
 @dataclass
 class HatBinding(Binding):
@@ -176,7 +238,69 @@ class HatBinding(Binding):
     def process_event(self, event: pygame.event.Event, controller: Input) -> None:
         if event.type == pygame.JOYHATMOTION:
             if event.hat == self.hat_id:
-                controller[self.hat] = event.value
+                self.apply(event, controller)
+
+    def event_keys(self) -> T.List[EventKey]:
+        return [(pygame.JOYHATMOTION, self.hat_id)]
+
+    def apply(self, event: pygame.event.Event, controller: Input) -> None:
+        controller[self.hat] = event.value
+
+@dataclass
+class KeyBinding(Binding):
+    """
+    A keyboard key standing in for a controller button.
+    """
+    button: Button
+    key: int
+
+    def process_event(self, event: pygame.event.Event, controller: Input) -> None:
+        if event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+            if event.key == self.key:
+                self.apply(event, controller)
+
+    def event_keys(self) -> T.List[EventKey]:
+        return [(pygame.KEYDOWN, self.key), (pygame.KEYUP, self.key)]
+
+    def apply(self, event: pygame.event.Event, controller: Input) -> None:
+        controller[self.button] = event.type == pygame.KEYDOWN
+
+# Which attribute of each event holds the id bindings are keyed by.
+EVENT_ID_ATTRIBUTE: T.Dict[int, str] = {
+    pygame.JOYAXISMOTION: "axis",
+    pygame.JOYBUTTONDOWN: "button",
+    pygame.JOYBUTTONUP: "button",
+    pygame.JOYHATMOTION: "hat",
+    pygame.KEYDOWN: "key",
+    pygame.KEYUP: "key",
+}
+
+class BindingTable:
+    """
+    A list of bindings compiled into a lookup table, so handling an event
+    costs one dict lookup no matter how many bindings there are, instead of
+    asking every binding whether it cares.
+
+    If `instance_id` is given, only events from that joystick are handled,
+    so each connected controller can have its own profile.
+    """
+
+    def __init__(self, bindings: T.Iterable[Binding], instance_id: T.Optional[int] = None) -> None:
+        self.instance_id = instance_id
+        handlers: T.Dict[EventKey, T.List[T.Callable[[pygame.event.Event, Input], None]]] = {}
+        for binding in bindings:
+            for key in binding.event_keys():
+                handlers.setdefault(key, []).append(binding.apply)
+        self._handlers = {key: tuple(each) for key, each in handlers.items()}
+
+    def process_event(self, event: pygame.event.Event, controller: Input) -> None:
+        attribute = EVENT_ID_ATTRIBUTE.get(event.type)
+        if attribute is None:
+            return
+        if self.instance_id is not None and getattr(event, "instance_id", self.instance_id) != self.instance_id:
+            return
+        for handler in self._handlers.get((event.type, getattr(event, attribute)), ()):
+            handler(event, controller)
 
 WINDOWS_SHIELD_CONTROLLER: T.List[Binding] = [
     AxisBinding(
@@ -407,3 +531,35 @@ STEAM_DECK_INTEGRATED_CONTROLLER: T.List[Binding] = [
     )
 ]
 
+# Buttons on the keyboard, e.g. for flying fake_tello without a controller.
+KEYBOARD_BUTTONS: T.List[Binding] = [
+    KeyBinding(
+        button=Button.START,
+        key=pygame.K_RETURN,
+    ),
+    KeyBinding(
+        button=Button.A,
+        key=pygame.K_t,
+    ),
+    KeyBinding(
+        button=Button.B,
+        key=pygame.K_l,
+    ),
+    KeyBinding(
+        button=Button.X,
+        key=pygame.K_v,
+    ),
+    KeyBinding(
+        button=Button.Y,
+        key=pygame.K_b,
+    ),
+    KeyBinding(
+        button=Button.R_BUTTON,
+        key=pygame.K_TAB,
+    ),
+    # Emergency motor cut, on a key nobody presses by accident.
+    KeyBinding(
+        button=Button.L_BUTTON,
+        key=pygame.K_DELETE,
+    ),
+]
@@ -2,10 +2,15 @@ from .autonomous import DroneIPC, DroneState
 
 def main():
     with DroneIPC() as ipc:
+        last_frame_id = ipc.latest_frame_id
         while True:
             state = DroneState()
             state.yaw_vel = 30
             ipc.save_state(state)
+            # React once per video frame instead of spinning. The timeout
+            # keeps the state fresh even without a video stream.
+            ipc.wait_for_frame(timeout=0.1, after=last_frame_id)
+            last_frame_id = ipc.latest_frame_id
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
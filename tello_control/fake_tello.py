@@ -0,0 +1,289 @@
+"""
+A stand-in for a Tello on the local machine, for running and benchmarking
+the controller without a drone.
+
+    python run.py tello_control.fake_tello --latency-ms 30 --loss 0.05
+    python run.py tello_control.controller --tello-host 127.0.0.1
+
+It answers SDK commands (with configurable latency and loss), sends state
+packets, and while the stream is on, sends a synthetic H.264 video stream.
+"""
+import argparse
+import random
+import socket
+import threading
+import time
+import typing as T
+from collections import Counter
+from fractions import Fraction
+import numpy as np
+from .scheduler import LoopScheduler
+from .tello_protocol import DEFAULT_COMMAND_PORT, CLIENT_STATE_PORT, CLIENT_VIDEO_PORT, VIDEO_PACKET_LENGTH
+
+REPORT_INTERVAL_S = 5.0
+
+# Values of setresolution / setfps / setbitrate. Bitrate 0 is "auto".
+RESOLUTIONS = {"high": (960, 720), "low": (640, 480)}
+FRAME_RATES = {"high": 30, "middle": 15, "low": 5}
+BITRATES_MBPS = {0: 4, 1: 1, 2: 2, 3: 3, 4: 4, 5: 5}
+
+READ_RESPONSES = {
+    "speed?": "10.0",
+    "wifi?": "90",
+    "sdk?": "30",
+    "sn?": "0TQDFAKE000000",
+}
+
+
+class FakeTello:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_COMMAND_PORT,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        loss: float = 0.0,
+        state_hz: float = 10.0,
+    ) -> None:
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.loss = loss
+        self.state_hz = state_hz
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.5)
+        # Where the last command came from. State and video go to this host.
+        self.client: T.Optional[T.Tuple[str, int]] = None
+
+        self.flying = False
+        self.stream_on = False
+        self.height_cm = 0
+        self.battery = 100
+        self.rc = (0, 0, 0, 0)
+        self.resolution = RESOLUTIONS["high"]
+        self.fps = FRAME_RATES["high"]
+        self.bitrate_mbps = BITRATES_MBPS[0]
+        self._started_at = time.monotonic()
+        self._takeoff_at = 0.0
+
+        self.commands: T.Counter[str] = Counter()
+        self.rc_packets = 0
+        self.responses_lost = 0
+        self.video_frames = 0
+        self.video_bytes = 0
+        self._last_report = (time.monotonic(), 0, 0, 0)
+
+        self._stop = threading.Event()
+        self._threads: T.List[threading.Thread] = []
+
+    def serve_forever(self) -> None:
+        for target in (self._state_loop, self._video_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        try:
+            while not self._stop.is_set():
+                try:
+                    data, address = self.socket.recvfrom(1024)
+                except socket.timeout:
+                    data = None
+                if data is not None:
+                    self.client = address
+                    self._handle(data.decode("utf-8", errors="replace").strip(), address)
+                self._maybe_report()
+        finally:
+            self._stop.set()
+            self.report()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def _respond(self, response: str, address: T.Tuple[str, int]) -> None:
+        if random.random() < self.loss:
+            self.responses_lost += 1
+            return
+        delay = self.latency_s + random.uniform(0, self.jitter_s)
+        if delay <= 0:
+            self.socket.sendto(response.encode("utf-8"), address)
+        else:
+            threading.Timer(delay, self.socket.sendto, (response.encode("utf-8"), address)).start()
+
+    def _handle(self, command: str, address: T.Tuple[str, int]) -> None:
+        name, _, args = command.partition(" ")
+        self.commands[name] += 1
+        if name == "rc":
+            # Fire-and-forget, like on the drone.
+            self.rc_packets += 1
+            try:
+                self.rc = tuple(int(v) for v in args.split())
+            except ValueError:
+                pass
+            return
+
+        response = "ok"
+        if name in ("command", "keepalive"):
+            pass
+        elif name == "takeoff":
+            self.flying = True
+            self.height_cm = 80
+            self._takeoff_at = time.monotonic()
+        elif name in ("land", "emergency"):
+            self.flying = False
+            self.height_cm = 0
+            self.rc = (0, 0, 0, 0)
+        elif name == "streamon":
+            self.stream_on = True
+        elif name == "streamoff":
+            self.stream_on = False
+        elif name == "setresolution" and args in RESOLUTIONS:
+            self.resolution = RESOLUTIONS[args]
+        elif name == "setfps" and args in FRAME_RATES:
+            self.fps = FRAME_RATES[args]
+        elif name == "setbitrate" and args.isdigit() and int(args) in BITRATES_MBPS:
+            self.bitrate_mbps = BITRATES_MBPS[int(args)]
+        elif name == "battery?":
+            response = str(self.battery)
+        elif name == "height?":
+            response = f"{self.height_cm // 10}dm"
+        elif name == "time?":
+            response = f"{self._flight_time_s()}s"
+        elif name in READ_RESPONSES:
+            response = READ_RESPONSES[name]
+        else:
+            response = f"unknown command: {command}"
+        self._respond(response, address)
+
+    def _flight_time_s(self) -> int:
+        return int(time.monotonic() - self._takeoff_at) if self.flying else 0
+
+    def _state(self) -> str:
+        # Drains 1% every 30 s, so long runs look a bit like a real battery.
+        self.battery = max(0, 100 - int((time.monotonic() - self._started_at) / 30))
+        return (
+            "mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:0;roll:0;yaw:0;"
+            f"vgx:{self.rc[1] // 10};vgy:{self.rc[0] // 10};vgz:{-self.rc[2] // 10};"
+            f"templ:60;temph:62;tof:{self.height_cm + 10};h:{self.height_cm};"
+            f"bat:{self.battery};baro:0.00;time:{self._flight_time_s()};"
+            "agx:0.00;agy:0.00;agz:-1000.00;\r\n"
+        )
+
+    def _state_loop(self) -> None:
+        scheduler = LoopScheduler(self.state_hz, name="state")
+        while not self._stop.is_set():
+            if self.client is not None:
+                self.socket.sendto(self._state().encode("ascii"), (self.client[0], CLIENT_STATE_PORT))
+            scheduler.wait()
+
+    def _video_loop(self) -> None:
+        try:
+            import av
+        except ImportError:
+            print("fake tello: PyAV isn't installed, so there's no video stream")
+            return
+
+        video_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        settings = None
+        scheduler = LoopScheduler(self.fps, name="video")
+        frame_index = 0
+        while not self._stop.is_set():
+            if not self.stream_on or self.client is None:
+                # Start a fresh stream (with a keyframe) on the next streamon.
+                settings = None
+                time.sleep(0.05)
+                continue
+            if settings != (self.resolution, self.fps, self.bitrate_mbps):
+                settings = (self.resolution, self.fps, self.bitrate_mbps)
+                encoder = _make_encoder(av, *settings)
+                scheduler = LoopScheduler(self.fps, name="video")
+
+            image = _test_pattern(*self.resolution, frame_index)
+            frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+            frame.pts = frame_index
+            frame_index += 1
+            for packet in encoder.encode(frame):
+                payload = bytes(packet)
+                for start in range(0, len(payload), VIDEO_PACKET_LENGTH):
+                    video_socket.sendto(payload[start:start + VIDEO_PACKET_LENGTH], (self.client[0], CLIENT_VIDEO_PORT))
+                self.video_bytes += len(payload)
+            self.video_frames += 1
+            scheduler.wait()
+        video_socket.close()
+
+    def _maybe_report(self) -> None:
+        now = time.monotonic()
+        if now - self._last_report[0] >= REPORT_INTERVAL_S:
+            self.report()
+
+    def report(self) -> None:
+        now = time.monotonic()
+        then, rc_packets, video_frames, video_bytes = self._last_report
+        elapsed = max(now - then, 1e-9)
+        commands = ", ".join(f"{name}={n}" for name, n in sorted(self.commands.items()) if name != "rc")
+        print(
+            f"fake tello: rc={(self.rc_packets - rc_packets) / elapsed:.1f}/s "
+            f"video={(self.video_frames - video_frames) / elapsed:.1f}fps "
+            f"{(self.video_bytes - video_bytes) * 8 / elapsed / 1e6:.2f}Mbps "
+            f"({self.resolution[0]}x{self.resolution[1]}@{self.fps} {self.bitrate_mbps}Mbps) "
+            f"lost_responses={self.responses_lost} commands: {commands or '-'}"
+        )
+        self._last_report = (now, self.rc_packets, self.video_frames, self.video_bytes)
+
+
+def _make_encoder(av, resolution: T.Tuple[int, int], fps: int, bitrate_mbps: int):
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.width, encoder.height = resolution
+    encoder.pix_fmt = "yuv420p"
+    encoder.framerate = Fraction(fps, 1)
+    encoder.time_base = Fraction(1, fps)
+    encoder.bit_rate = bitrate_mbps * 1_000_000
+    encoder.gop_size = fps
+    # Headers with every keyframe, so a decoder can join mid-stream, like
+    # with the real drone.
+    encoder.options = {"preset": "ultrafast", "tune": "zerolatency", "x264-params": "repeat-headers=1"}
+    return encoder
+
+
+def _test_pattern(width: int, height: int, frame_index: int) -> np.ndarray:
+    """
+    Color gradient that scrolls one pixel per frame, with a bar whose
+    position encodes the frame index.
+    """
+    x = (np.arange(width, dtype=np.uint16) + frame_index) % 256
+    y = np.arange(height, dtype=np.uint16) * 255 // max(height - 1, 1)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = x[None, :]
+    image[:, :, 1] = y[:, None]
+    image[:, :, 2] = 128
+    bar = (frame_index * 8) % width
+    image[: height // 10, bar: bar + 8] = 255
+    return image
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_COMMAND_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before each response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay, up to this much")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of responses dropped")
+    parser.add_argument("--state-hz", type=float, default=10.0)
+    args = parser.parse_args()
+
+    fake = FakeTello(
+        host=args.host,
+        port=args.port,
+        latency_s=args.latency_ms / 1000.0,
+        jitter_s=args.jitter_ms / 1000.0,
+        loss=args.loss,
+        state_hz=args.state_hz,
+    )
+    print(f"fake tello listening on {args.host}:{args.port}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
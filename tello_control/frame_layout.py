@@ -0,0 +1,169 @@
+import typing as T
+from dataclasses import dataclass
+from enum import IntEnum
+import numpy as np
+import cv2
+
+
+class PixelFormat(IntEnum):
+    """
+    How a frame is laid out in shared memory. Values are stored in the IPC
+    header, so never renumber them.
+    """
+
+    # Interleaved 8-bit B, G, R. 3 bytes per pixel.
+    BGR24 = 1
+    # Single 8-bit luma plane. 1 byte per pixel.
+    GRAY8 = 2
+    # Full-res Y plane, then a half-res interleaved U/V plane. 1.5 bytes per pixel.
+    NV12 = 3
+    # Full-res Y plane, then half-res U and V planes. 1.5 bytes per pixel.
+    I420 = 4
+
+
+_YUV420 = (PixelFormat.NV12, PixelFormat.I420)
+
+
+class Lane(IntEnum):
+    """
+    Reduced copies of each frame a session can carry next to the full frame.
+    Values are bits of the lane mask in the IPC header.
+    """
+
+    # Half width and height, BGR.
+    HALF = 0b001
+    # Quarter width and height, BGR.
+    QUARTER = 0b010
+    # A third of the width and height, grayscale (320x240 for 960x720).
+    GRAY = 0b100
+
+
+# Lane -> (divisor of the full frame size, pixel format)
+LANE_FORMATS: T.Dict[Lane, T.Tuple[int, PixelFormat]] = {
+    Lane.HALF: (2, PixelFormat.BGR24),
+    Lane.QUARTER: (4, PixelFormat.BGR24),
+    Lane.GRAY: (3, PixelFormat.GRAY8),
+}
+
+
+def lanes_to_mask(lanes: T.Iterable[Lane]) -> int:
+    mask = 0
+    for lane in lanes:
+        mask |= lane
+    return mask
+
+
+def lanes_from_mask(mask: int) -> T.Tuple[Lane, ...]:
+    return tuple(lane for lane in Lane if mask & lane)
+
+
+def parse_lanes(spec: str) -> T.Tuple[Lane, ...]:
+    """
+    Parses a comma separated list of lane names, e.g. "half,gray".
+    """
+    names = [name.strip().upper() for name in spec.split(",") if name.strip()]
+    return lanes_from_mask(lanes_to_mask(Lane[name] for name in names))
+
+
+@dataclass(frozen=True)
+class FrameLayout:
+    width: int
+    height: int
+    pixel_format: PixelFormat = PixelFormat.BGR24
+
+    def __post_init__(self) -> None:
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError(f"Invalid frame size {self.width}x{self.height}")
+        if self.pixel_format in _YUV420 and (self.width % 2 or self.height % 2):
+            raise ValueError(f"{self.pixel_format.name} needs an even frame size, got {self.width}x{self.height}")
+
+    @staticmethod
+    def parse(spec: str) -> "FrameLayout":
+        """
+        Parses "WIDTHxHEIGHT" or "WIDTHxHEIGHT:FORMAT", e.g. "480x360:nv12".
+        """
+        size, _, pixel_format = spec.partition(":")
+        width, _, height = size.lower().partition("x")
+        return FrameLayout(
+            width=int(width),
+            height=int(height),
+            pixel_format=PixelFormat[pixel_format.upper()] if pixel_format else PixelFormat.BGR24,
+        )
+
+    def lane_layout(self, lane: Lane) -> "FrameLayout":
+        divisor, pixel_format = LANE_FORMATS[lane]
+        return FrameLayout(
+            width=max(1, self.width // divisor),
+            height=max(1, self.height // divisor),
+            pixel_format=pixel_format,
+        )
+
+    @property
+    def stride(self) -> int:
+        """
+        Bytes per row of the first plane.
+        """
+        if self.pixel_format == PixelFormat.BGR24:
+            return self.width * 3
+        return self.width
+
+    @property
+    def shape(self) -> T.Tuple[int, ...]:
+        """
+        Shape of the array holding one frame. YUV 4:2:0 frames are stored the
+        way OpenCV expects them, as (height * 3 / 2, width) bytes.
+        """
+        if self.pixel_format == PixelFormat.BGR24:
+            return (self.height, self.width, 3)
+        if self.pixel_format == PixelFormat.GRAY8:
+            return (self.height, self.width)
+        return (self.height * 3 // 2, self.width)
+
+    @property
+    def strides(self) -> T.Tuple[int, ...]:
+        if self.pixel_format == PixelFormat.BGR24:
+            return (self.stride, 3, 1)
+        return (self.stride, 1)
+
+    @property
+    def nbytes(self) -> int:
+        return self.stride * self.shape[0]
+
+    def from_bgr(self, bgr: np.ndarray, out: np.ndarray) -> None:
+        """
+        Converts a BGR frame of any size into this layout, writing into `out`.
+        """
+        if bgr.shape[:2] != (self.height, self.width):
+            bgr = cv2.resize(bgr, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        if self.pixel_format == PixelFormat.BGR24:
+            np.copyto(out, bgr)
+        elif self.pixel_format == PixelFormat.GRAY8:
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY, dst=out)
+        elif self.pixel_format == PixelFormat.I420:
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420, dst=out)
+        else:
+            # OpenCV can't produce NV12 directly, so interleave I420's chroma.
+            i420 = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+            h, w = self.height, self.width
+            out[:h] = i420[:h]
+            chroma = i420[h:].reshape((2, h // 2, w // 2))
+            uv = out[h:].reshape((h // 2, w // 2, 2))
+            uv[:, :, 0] = chroma[0]
+            uv[:, :, 1] = chroma[1]
+
+    def to_bgr(self, frame: np.ndarray, out: T.Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Converts a frame in this layout to BGR. BGR frames are returned as-is
+        unless `out` is given.
+        """
+        if self.pixel_format == PixelFormat.BGR24:
+            if out is None:
+                return frame
+            np.copyto(out, frame)
+            return out
+        code = {
+            PixelFormat.GRAY8: cv2.COLOR_GRAY2BGR,
+            PixelFormat.NV12: cv2.COLOR_YUV2BGR_NV12,
+            PixelFormat.I420: cv2.COLOR_YUV2BGR_I420,
+        }[self.pixel_format]
+        return cv2.cvtColor(frame, code, dst=out)
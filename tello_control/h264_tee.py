@@ -0,0 +1,251 @@
+"""
+Records the drone's H.264 stream as it arrives, without decoding it.
+
+The tee takes the drone's video port, appends each UDP payload to
+<path>.h264 (an Annex-B elementary stream, playable as is) with its arrival
+time in <path>.index, and forwards the packet to a local port where the
+live view's decoder listens. Recording costs a disk write per packet
+instead of a decode and a re-encode.
+
+    python run.py tello_control.controller --record-h264 /tmp/flight
+    python run.py tello_control.h264_tee mp4 /tmp/flight
+
+A recording (or any .h264 file) can be sent back over loopback in place of
+the drone, to test the receiving side:
+
+    python run.py tello_control.h264_tee replay /tmp/flight
+"""
+import argparse
+import socket
+import threading
+import time
+import typing as T
+from fractions import Fraction
+from pathlib import Path
+import numpy as np
+from .tello_protocol import CLIENT_VIDEO_PORT, VIDEO_PACKET_LENGTH
+from .binary_log import LogWriter, read_log
+
+# Where the live view's decoder listens when the tee is in front of it.
+DEFAULT_FORWARD_PORT = 11112
+# Log kind of index files, see binary_log.py.
+INDEX_KIND = 4
+# The drone sends at most VIDEO_PACKET_LENGTH, but leave room.
+RECEIVE_LENGTH = 2048
+MP4_TIME_BASE = Fraction(1, 90000)
+
+INDEX_DTYPE = np.dtype([
+    ("timestamp_ns", np.int64),
+    # Where the packet's payload starts in <path>.h264.
+    ("offset", np.uint64),
+    ("length", np.uint32),
+    ("_pad", np.uint32),
+])
+
+
+class H264Tee:
+    """
+    Receives the video stream on `port`, records it under `path` (if given),
+    and forwards every packet to `forward_port` on this machine.
+    """
+
+    def __init__(
+        self,
+        path: T.Optional[T.Union[str, Path]],
+        port: int = CLIENT_VIDEO_PORT,
+        forward_port: T.Optional[int] = DEFAULT_FORWARD_PORT,
+        host: str = "0.0.0.0",
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.forward_port = forward_port
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.5)
+        self._forward_address = ("127.0.0.1", forward_port) if forward_port is not None else None
+
+        self._stream: T.Optional[T.BinaryIO] = None
+        self._index: T.Optional[LogWriter] = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._stream = open(f"{self.path}.h264", "wb")
+            self._index = LogWriter(Path(f"{self.path}.index"), INDEX_KIND, INDEX_DTYPE)
+        self._offset = 0
+
+        self.packets = 0
+        self.bytes = 0
+        self._started_at = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread: T.Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="H264Tee", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.socket.close()
+        if self._stream is not None:
+            self._stream.close()
+            self._index.close()
+            self._stream = None
+
+    def __enter__(self) -> "H264Tee":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        buffer = bytearray(RECEIVE_LENGTH)
+        view = memoryview(buffer)
+        while not self._stop.is_set():
+            try:
+                n = self.socket.recv_into(buffer)
+            except socket.timeout:
+                continue
+            timestamp_ns = time.monotonic_ns()
+            payload = view[:n]
+            if self._forward_address is not None:
+                self.socket.sendto(payload, self._forward_address)
+            if self._stream is not None:
+                self._stream.write(payload)
+                record = self._index.record
+                record["timestamp_ns"] = timestamp_ns
+                record["offset"] = self._offset
+                record["length"] = n
+                self._index.append()
+                self._offset += n
+            self.packets += 1
+            self.bytes += n
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        recording = f" -> {self.path}.h264" if self.path is not None else ""
+        return f"h264 tee: {self.packets} packets, {self.bytes / 1e6:.1f}MB ({self.bytes * 8 / elapsed / 1e6:.2f}Mbps){recording}"
+
+
+def read_index(path: T.Union[str, Path]) -> np.ndarray:
+    return read_log(Path(f"{path}.index"), INDEX_KIND, INDEX_DTYPE)
+
+
+def remux_to_mp4(path: T.Union[str, Path], output: T.Optional[T.Union[str, Path]] = None) -> Path:
+    """
+    Puts a recording in an MP4 container without re-encoding it. Each frame
+    is timed by when its first byte arrived.
+    """
+    import av
+
+    output = Path(output) if output is not None else Path(f"{path}.mp4")
+    index = read_index(path)
+    offsets = index["offset"]
+    timestamps_ns = index["timestamp_ns"]
+    with av.open(f"{path}.h264", format="h264") as source, av.open(str(output), "w") as destination:
+        source_stream = source.streams.video[0]
+        stream = destination.add_stream_from_template(source_stream)
+        first_ns = int(timestamps_ns[0]) if len(index) else 0
+        last_pts = -1
+        for packet in source.demux(source_stream):
+            if packet.size == 0:
+                continue
+            if len(index) and packet.pos >= 0:
+                arrived_ns = int(timestamps_ns[max(int(np.searchsorted(offsets, packet.pos, side="right")) - 1, 0)])
+                pts = (arrived_ns - first_ns) * MP4_TIME_BASE.denominator // 1_000_000_000
+            else:
+                pts = last_pts + 1
+            # Packets of one burst can share an arrival time.
+            pts = max(pts, last_pts + 1)
+            packet.pts = packet.dts = pts
+            packet.time_base = MP4_TIME_BASE
+            packet.stream = stream
+            destination.mux(packet)
+            last_pts = pts
+    return output
+
+
+def _packets_from_index(path: T.Union[str, Path]) -> T.Iterator[T.Tuple[int, bytes]]:
+    index = read_index(path)
+    first_ns = int(index["timestamp_ns"][0]) if len(index) else 0
+    with open(f"{path}.h264", "rb") as f:
+        for record in index:
+            yield int(record["timestamp_ns"]) - first_ns, f.read(int(record["length"]))
+
+
+def _packets_from_stream(path: T.Union[str, Path], fps: float) -> T.Iterator[T.Tuple[int, bytes]]:
+    """
+    A bare .h264 file, split into frames with the parser (not a decoder) and
+    sent a frame every 1/fps in VIDEO_PACKET_LENGTH pieces.
+    """
+    import av
+
+    parser = av.CodecContext.create("h264", "r")
+    with open(path, "rb") as f:
+        data = f.read()
+    for frame_index, packet in enumerate(parser.parse(data) + parser.parse(None)):
+        payload = bytes(packet)
+        for start in range(0, len(payload), VIDEO_PACKET_LENGTH):
+            yield int(frame_index / fps * 1e9), payload[start:start + VIDEO_PACKET_LENGTH]
+
+
+def replay(path: T.Union[str, Path], host: str = "127.0.0.1", port: int = CLIENT_VIDEO_PORT, fps: float = 30.0, speed: float = 1.0) -> int:
+    """
+    Sends a recording (<path>.h264 with its index, at the recorded pace) or
+    a bare .h264 file (at `fps`) to `host`:`port`. Returns the packets sent.
+    """
+    if Path(f"{path}.index").exists():
+        packets = _packets_from_index(path)
+    else:
+        packets = _packets_from_stream(path, fps)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    started_ns = time.monotonic_ns()
+    n = 0
+    for offset_ns, payload in packets:
+        delay_ns = offset_ns / speed - (time.monotonic_ns() - started_ns)
+        if delay_ns > 0:
+            time.sleep(delay_ns / 1e9)
+        sender.sendto(payload, (host, port))
+        n += 1
+    sender.close()
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Records, remuxes or replays the drone's H.264 stream.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the stream without a controller")
+    record.add_argument("path", help="recording, without the .h264/.index suffix")
+    record.add_argument("--port", type=int, default=CLIENT_VIDEO_PORT)
+    record.add_argument("--forward-port", type=int, default=None, help="also forward packets here")
+    mp4 = commands.add_parser("mp4", help="remux a recording to MP4")
+    mp4.add_argument("path")
+    mp4.add_argument("--output", default=None)
+    send = commands.add_parser("replay", help="send a recording or .h264 file over UDP")
+    send.add_argument("path", help="recording without suffix, or a .h264 file")
+    send.add_argument("--host", default="127.0.0.1")
+    send.add_argument("--port", type=int, default=CLIENT_VIDEO_PORT)
+    send.add_argument("--fps", type=float, default=30.0, help="pace of a bare .h264 file")
+    send.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        with H264Tee(args.path, port=args.port, forward_port=args.forward_port) as tee:
+            try:
+                while True:
+                    time.sleep(1.0)
+            except KeyboardInterrupt:
+                pass
+        print(tee.summary())
+    elif args.command == "mp4":
+        print(f"wrote {remux_to_mp4(args.path, args.output)}")
+    else:
+        started = time.perf_counter()
+        n = replay(args.path, args.host, args.port, args.fps, args.speed)
+        print(f"sent {n} packets in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Binary logs of controller input, for replaying sessions without hardware.
+
+A recording is two files of fixed-size records, each with a small header,
+so they can be memory-mapped straight into numpy:
+
+    <path>.events  every pygame event the bindings react to (EVENT_DTYPE)
+    <path>.inputs  the Input state at the end of every frame (SAMPLE_DTYPE)
+
+Record with the mapper, replay with:
+
+    python run.py tello_control.input_log /tmp/tello-inputs [--fast]
+"""
+import argparse
+import time
+import typing as T
+from pathlib import Path
+import numpy as np
+import pygame
+from .binary_log import LogWriter, read_log
+from .controller_state import EVENT_ID_ATTRIBUTE, Axis1D, Binding, BindingTable, Button, Hat, Input
+
+EVENTS_KIND = 1
+INPUTS_KIND = 2
+
+AXES = list(Axis1D)
+BUTTONS = list(Button)
+HATS = list(Hat)
+
+# The Input state at the end of one frame.
+SAMPLE_DTYPE = np.dtype([
+    ("timestamp_ns", np.int64),
+    ("axes", np.float32, (len(AXES),)),
+    ("buttons", np.bool_, (len(BUTTONS),)),
+    ("hats", np.int8, (len(HATS), 2)),
+])
+
+EVENT_DTYPE = np.dtype([
+    ("timestamp_ns", np.int64),
+    ("type", np.uint16),
+    ("instance_id", np.uint16),
+    # Axis, button, hat or key.
+    ("id", np.int32),
+    ("value", np.float32),
+    ("hat", np.int8, (2,)),
+    ("_pad", np.uint8, (2,)),
+])
+
+
+class InputRecorder:
+    """
+    Records to `path`, replacing an earlier recording there. With `append`,
+    adds a session to it instead. Only do that within one boot: replay
+    relies on timestamps that only go forward.
+    """
+
+    def __init__(self, path: T.Union[str, Path], append: bool = False) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.events = LogWriter(Path(f"{path}.events"), EVENTS_KIND, EVENT_DTYPE, append=append)
+        self.inputs = LogWriter(Path(f"{path}.inputs"), INPUTS_KIND, SAMPLE_DTYPE, append=append)
+
+    def record_event(self, event: pygame.event.Event) -> None:
+        """
+        Records `event` if it's one bindings can react to.
+        """
+        attribute = EVENT_ID_ATTRIBUTE.get(event.type)
+        if attribute is None:
+            return
+        record = self.events.record
+        record["timestamp_ns"] = time.monotonic_ns()
+        record["type"] = event.type
+        record["instance_id"] = getattr(event, "instance_id", 0)
+        record["id"] = getattr(event, attribute)
+        value = getattr(event, "value", 0.0)
+        if isinstance(value, tuple):
+            record["hat"] = value
+            record["value"] = 0.0
+        else:
+            record["hat"] = (0, 0)
+            record["value"] = value
+        self.events.append()
+
+    def record_input(self, controller: Input) -> None:
+        record = self.inputs.record
+        record["timestamp_ns"] = time.monotonic_ns()
+        record["axes"] = [controller[axis] for axis in AXES]
+        record["buttons"] = [controller[button] for button in BUTTONS]
+        record["hats"] = [controller[hat] for hat in HATS]
+        self.inputs.append()
+
+    def close(self) -> None:
+        self.events.close()
+        self.inputs.close()
+
+    def __enter__(self) -> "InputRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _to_event(record: np.void) -> pygame.event.Event:
+    event_type = int(record["type"])
+    attributes: T.Dict[str, T.Any] = {
+        EVENT_ID_ATTRIBUTE[event_type]: int(record["id"]),
+        "instance_id": int(record["instance_id"]),
+    }
+    if event_type == pygame.JOYHATMOTION:
+        attributes["value"] = tuple(int(v) for v in record["hat"])
+    elif event_type == pygame.JOYAXISMOTION:
+        attributes["value"] = float(record["value"])
+    return pygame.event.Event(event_type, attributes)
+
+
+class InputReplayer:
+    """
+    Plays a recording back into an Input through a set of bindings, frame
+    by frame, the way the controller's loop would have seen it.
+    """
+
+    def __init__(self, path: T.Union[str, Path], bindings: T.Iterable[Binding]) -> None:
+        self.events = read_log(Path(f"{path}.events"), EVENTS_KIND, EVENT_DTYPE)
+        self.inputs = read_log(Path(f"{path}.inputs"), INPUTS_KIND, SAMPLE_DTYPE)
+        for log in (self.events, self.inputs):
+            if np.any(np.diff(log["timestamp_ns"]) < 0):
+                raise ValueError(f"{path} has timestamps that go backwards (sessions appended across a reboot?)")
+        # Decoded once up front, so replaying measures the bindings, not this.
+        self._events = [_to_event(record) for record in self.events]
+        self.bindings = BindingTable(bindings)
+        self.mismatches = 0
+
+    def frames(self, controller: Input, realtime: bool = True) -> T.Iterator[Input]:
+        """
+        Yields `controller` once per recorded frame, after applying that
+        frame's events. With `realtime`, frames come at their recorded pace,
+        otherwise as fast as the caller takes them.
+        """
+        event_times = self.events["timestamp_ns"]
+        frame_times = self.inputs["timestamp_ns"]
+        # Frame i gets the events recorded before its snapshot.
+        frame_ends = np.searchsorted(event_times, frame_times, side="right")
+        started_ns = time.monotonic_ns()
+        first_ns = int(frame_times[0]) if len(frame_times) else 0
+        start = 0
+        for i, end in enumerate(frame_ends):
+            if realtime:
+                delay_ns = (int(frame_times[i]) - first_ns) - (time.monotonic_ns() - started_ns)
+                if delay_ns > 0:
+                    time.sleep(delay_ns / 1e9)
+            controller._tick()
+            for event in self._events[start:end]:
+                self.bindings.process_event(event, controller)
+            start = end
+            if not self._matches(controller, self.inputs[i]):
+                self.mismatches += 1
+            yield controller
+
+    @staticmethod
+    def _matches(controller: Input, record: np.void) -> bool:
+        axes = np.array([controller[axis] for axis in AXES], dtype=np.float32)
+        buttons = np.array([controller[button] for button in BUTTONS])
+        # Axis values went through float32 before the bindings scaled them.
+        return bool(np.allclose(axes, record["axes"], atol=1e-6) and np.array_equal(buttons, record["buttons"]))
+
+
+def main() -> None:
+    from .controller import CONTROLLER
+    from .controller_state import KEYBOARD_BUTTONS
+
+    parser = argparse.ArgumentParser(description="Replays a recorded input log.")
+    parser.add_argument("path", help="recording, without the .events/.inputs suffix")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    args = parser.parse_args()
+
+    replayer = InputReplayer(args.path, CONTROLLER + KEYBOARD_BUTTONS)
+    controller = Input()
+    started = time.perf_counter()
+    n_frames = 0
+    for _ in replayer.frames(controller, realtime=not args.fast):
+        n_frames += 1
+    elapsed = time.perf_counter() - started
+    print(
+        f"{n_frames} frames, {len(replayer.events)} events in {elapsed:.2f}s "
+        f"({n_frames / max(elapsed, 1e-9):.0f} frames/s), {replayer.mismatches} frames differ from the recording"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import random
+import typing as T
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+if sys.platform != "win32":
+    import fcntl
+
+# Events a subscriber can be woken up for.
+FRAME_EVENT = 0b001
+STATE_EVENT = 0b010
+TELEMETRY_EVENT = 0b100
+
+# Each subscriber owns one row of the table in shared memory:
+#   pid: owning process, 0 if the row is free.
+#   token: random id, names the subscriber's socket.
+#   events: bitmask of the events it wants.
+SUBSCRIBER_PID = 0
+SUBSCRIBER_TOKEN = 1
+SUBSCRIBER_EVENTS = 2
+SUBSCRIBER_FIELDS = 4
+MAX_SUBSCRIBERS = 16
+SUBSCRIBER_TABLE_LENGTH = MAX_SUBSCRIBERS * SUBSCRIBER_FIELDS * 4
+
+# Wakeups use datagrams on abstract UNIX sockets, which only exist on Linux.
+# Everywhere else, waiting falls back to polling shared memory.
+NOTIFY_SUPPORTED = sys.platform == "linux"
+POLL_INTERVAL_S = 0.002
+
+
+def _address(namespace: str, token: int) -> bytes:
+    # The leading NUL puts the socket in the abstract namespace, so there is
+    # no file to clean up and it disappears when the process dies.
+    return b"\0" + f"{namespace}-{token:08x}".encode("ascii")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except (ProcessLookupError, OverflowError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Notifier:
+    """
+    Lets one process wake up others blocked on the same shared memory.
+
+    Subscribers register in a table that lives in shared memory, so a
+    producer never needs to know who is listening. Publishing costs one
+    non-blocking sendto per interested subscriber.
+
+    Rows are claimed and freed while holding an exclusive flock on
+    `lock_path`, so two processes can't both take the same free row.
+    Without a `lock_path`, every handle polls.
+    """
+
+    def __init__(self, table: np.ndarray, namespace: str, lock_path: T.Optional[Path] = None) -> None:
+        assert table.shape == (MAX_SUBSCRIBERS, SUBSCRIBER_FIELDS)
+        self._table = table
+        self._namespace = namespace
+        self._lock_path = lock_path
+        self._send_socket: T.Optional[socket.socket] = None
+        # publish() can be called from more than one thread (e.g. telemetry
+        # from djitellopy's state thread).
+        self._send_socket_lock = threading.Lock()
+        self._recv_socket: T.Optional[socket.socket] = None
+        self._row: T.Optional[int] = None
+        self._token: int = 0
+
+    @contextmanager
+    def _table_lock(self) -> T.Iterator[None]:
+        # Each open() is its own open file description, so this also keeps
+        # out other handles in the same process.
+        fd = os.open(self._lock_path, os.O_CREAT | os.O_RDWR, mode=0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def subscribe(self, events: int) -> None:
+        """
+        Asks to be woken by `events` (replacing whatever was asked before),
+        so a wait for state isn't woken by every frame after a wait for one.
+        """
+        if not NOTIFY_SUPPORTED or self._lock_path is None:
+            return
+        if self._row is not None:
+            self._table[self._row, SUBSCRIBER_EVENTS] = events
+            return
+
+        token = random.randrange(1, 2 ** 32)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind(_address(self._namespace, token))
+
+        with self._table_lock():
+            for row in range(MAX_SUBSCRIBERS):
+                pid = int(self._table[row, SUBSCRIBER_PID])
+                if pid != 0 and _is_alive(pid):
+                    continue
+                self._table[row, SUBSCRIBER_TOKEN] = token
+                self._table[row, SUBSCRIBER_EVENTS] = events
+                self._table[row, SUBSCRIBER_PID] = os.getpid()
+                self._recv_socket = sock
+                self._row = row
+                self._token = token
+                return
+
+        # Table full: this handle polls instead.
+        sock.close()
+
+    def publish(self, event: int) -> None:
+        if not NOTIFY_SUPPORTED:
+            return
+        for row in np.flatnonzero(self._table[:, SUBSCRIBER_PID]):
+            token = int(self._table[row, SUBSCRIBER_TOKEN])
+            if not (int(self._table[row, SUBSCRIBER_EVENTS]) & event) or token == self._token:
+                continue
+            if self._send_socket is None:
+                with self._send_socket_lock:
+                    if self._send_socket is None:
+                        send_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                        send_socket.setblocking(False)
+                        self._send_socket = send_socket
+            try:
+                self._send_socket.sendto(b"\x01", _address(self._namespace, token))
+            except BlockingIOError:
+                # Its queue is full, so it already has a wakeup pending.
+                pass
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The subscriber died without unregistering. Someone may be
+                # claiming the row again right now, so only free it if not.
+                self._free_row(row, token)
+
+    def wait(self, timeout: T.Optional[float]) -> None:
+        """
+        Sleeps until a subscribed event is published, or `timeout` passes.
+        May return early; callers re-check whatever they are waiting for.
+        """
+        if self._recv_socket is None:
+            time.sleep(POLL_INTERVAL_S if timeout is None else min(timeout, POLL_INTERVAL_S))
+            return
+        readable, _, _ = select.select([self._recv_socket], [], [], timeout)
+        if readable:
+            # Collapse any backlog of wakeups into this one.
+            try:
+                while True:
+                    self._recv_socket.recv(16)
+            except BlockingIOError:
+                pass
+
+    def _free_row(self, row: int, token: int) -> None:
+        if self._lock_path is None:
+            return
+        with self._table_lock():
+            if int(self._table[row, SUBSCRIBER_TOKEN]) == token:
+                self._table[row, SUBSCRIBER_PID] = 0
+
+    def close(self) -> None:
+        if self._row is not None:
+            self._free_row(self._row, self._token)
+        self._row = None
+        self._token = 0
+        for sock in (self._recv_socket, self._send_socket):
+            if sock is not None:
+                sock.close()
+        self._recv_socket = None
+        self._send_socket = None
@@ -1,10 +1,20 @@
+import argparse
 import pygame
-import time
 from pathlib import Path
+from .controller import CONTROLLER
+from .controller_state import KEYBOARD_BUTTONS, BindingTable, Input
+from .input_log import InputRecorder
+from .scheduler import LoopScheduler
 
 mydir = Path(__file__).resolve().parent
+DEFAULT_RECORDING = "/tmp/tello-inputs"
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Logs controller input, and records it for replay.")
+    parser.add_argument("--record", default=DEFAULT_RECORDING, help="recording path, without the .events/.inputs suffix (replaced)")
+    parser.add_argument("--append", action="store_true", help="add this session to the recording instead of replacing it")
+    args = parser.parse_args()
+
     pygame.init()
     size = (1280, 800)
     screen = pygame.display.set_mode(size, pygame.FULLSCREEN)
@@ -13,18 +23,22 @@ def main() -> None:
     joystick = pygame.joystick.Joystick(0)
     should_quit: bool = False
 
-    target_seconds_per_frame: float = 1 / 60
+    scheduler = LoopScheduler(60, name="frame")
     log_file = mydir / "recieved_inputs.txt"
     seen = set()
+    bindings = BindingTable(CONTROLLER + KEYBOARD_BUTTONS)
+    controller_state = Input()
 
-    with open(log_file, "w") as f:
+    with open(log_file, "w") as f, InputRecorder(args.record, append=args.append) as recorder:
         print(joystick.get_name(), file=f)
         print("N Axes", joystick.get_numaxes(), file=f)
         print("N Hats", joystick.get_numhats(), file=f)
         print("N Buttons", joystick.get_numbuttons(), file=f)
         while not should_quit:
-            frame_start = time.time()
+            controller_state._tick()
             for event in pygame.event.get():
+                recorder.record_event(event)
+                bindings.process_event(event, controller_state)
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                     should_quit = True
                 if event.type == pygame.JOYAXISMOTION and abs(event.value) > 0:
@@ -43,20 +57,17 @@ def main() -> None:
                         print(to_log, file=f)
                         seen.add(to_log)
 
+            recorder.record_input(controller_state)
             if should_quit:
                 break
 
             screen.fill((0,0,0))
 
             pygame.display.flip()
-            frame_end = time.time()
-            elapsed = frame_end - frame_start
-
-            if elapsed > target_seconds_per_frame:
-                print("DROP")
-            if elapsed < target_seconds_per_frame:
-                time.sleep(target_seconds_per_frame - elapsed)
+            scheduler.wait()
 
+    print(scheduler.summary())
+    print(f"recorded to {args.record}.events, {args.record}.inputs")
     pygame.quit()
     
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+import sys
+import threading
+import time
+import pstats
+import typing as T
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+
+DEFAULT_INTERVAL_S = 0.005
+PROFILE_DIR = Path(os.environ.get("TELLO_PROFILE_DIR", "/tmp/tello-profiles"))
+
+# (filename, first line, function name), the way pstats keys functions.
+FunctionKey = T.Tuple[str, int, str]
+
+
+def _function_key(frame: FrameType) -> FunctionKey:
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class _SampledStats:
+    """
+    Just enough of a profile for pstats.Stats to load.
+    """
+
+    def __init__(self, stats: T.Dict[FunctionKey, T.Tuple[int, int, float, float, T.Dict[FunctionKey, T.Tuple[int, int, float, float]]]]) -> None:
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for a live process. A background thread grabs every
+    other thread's stack with sys._current_frames() at a fixed interval, so
+    the profiled code runs unmodified and at nearly full speed.
+
+    Each stop() writes the session's samples as collapsed stacks (for flame
+    graphs and diffing) and as a pstats file.
+    """
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL_S, output_dir: Path = PROFILE_DIR, name: str = "profile") -> None:
+        self.interval_s = interval_s
+        self.output_dir = Path(output_dir)
+        self.name = name
+        # Stack (outermost first) -> times seen.
+        self._samples: T.Counter[T.Tuple[FunctionKey, ...]] = Counter()
+        self._thread_names: T.Dict[T.Tuple[FunctionKey, ...], str] = {}
+        self._stop = threading.Event()
+        self._thread: T.Optional[threading.Thread] = None
+        self._started_at = ""
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._samples.clear()
+        self._thread_names.clear()
+        # Milliseconds and the pid, so sessions started within the same
+        # second, or by processes started together, don't overwrite each other.
+        now = time.time()
+        self._started_at = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{os.getpid()}"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> T.List[Path]:
+        """
+        Stops sampling and writes the profile. Returns the files written.
+        """
+        if not self.running:
+            return []
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return self.write()
+
+    def toggle(self) -> T.List[Path]:
+        if self.running:
+            return self.stop()
+        self.start()
+        return []
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_function_key(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                stack = tuple(stack)
+                self._samples[stack] += 1
+                self._thread_names.setdefault(stack, names.get(thread_id, str(thread_id)))
+
+    @property
+    def n_samples(self) -> int:
+        return sum(self._samples.values())
+
+    def write(self) -> T.List[Path]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = f"{self.name}-{self._started_at}"
+        collapsed = self.output_dir / f"{base}.collapsed"
+        stats = self.output_dir / f"{base}.prof"
+        self.write_collapsed(collapsed)
+        self.stats().dump_stats(stats)
+        print(f"profile: {self.n_samples} samples -> {collapsed}, {stats}")
+        return [collapsed, stats]
+
+    def write_collapsed(self, path: Path) -> None:
+        """
+        One line per distinct stack, "thread;outer;...;inner count", sorted so
+        two profiles diff cleanly.
+        """
+        lines = []
+        for stack, count in self._samples.items():
+            frames = (f"{Path(filename).name}:{function}" for filename, _, function in stack)
+            lines.append(f"{';'.join((self._thread_names[stack], *frames))} {count}")
+        with open(path, "w") as f:
+            for line in sorted(lines):
+                print(line, file=f)
+
+    def stats(self) -> pstats.Stats:
+        """
+        The samples as pstats, where each sample counts as `interval_s` of
+        time: own time for the innermost function, cumulative time for
+        every function on the stack.
+        """
+        own: T.Counter[FunctionKey] = Counter()
+        cumulative: T.Counter[FunctionKey] = Counter()
+        callers: T.Dict[FunctionKey, T.Counter[FunctionKey]] = {}
+        for stack, count in self._samples.items():
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            # Recursive functions still only count once per sample.
+            for function in set(stack):
+                cumulative[function] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                callers.setdefault(callee, Counter())[caller] += count
+
+        dt = self.interval_s
+        stats = {}
+        for function, count in cumulative.items():
+            function_callers = {
+                caller: (n, n, 0.0, n * dt)
+                for caller, n in callers.get(function, {}).items()
+            }
+            stats[function] = (count, count, own[function] * dt, count * dt, function_callers)
+        return pstats.Stats(_SampledStats(stats))
+
+
+_default: T.Optional[SamplingProfiler] = None
+
+
+def default_profiler() -> SamplingProfiler:
+    """
+    The profiler shared by run.py --profile and the controller's hotkey, so
+    either can stop what the other started.
+    """
+    global _default
+    if _default is None:
+        _default = SamplingProfiler()
+    return _default
@@ -0,0 +1,123 @@
+import threading
+import time
+import typing as T
+from djitellopy import Tello
+from .stats import LatencyHistogram
+
+# (left_right, forward_backward, up_down, yaw), each -100 to 100.
+RCValues = T.Tuple[int, int, int, int]
+
+DEFAULT_RATE_HZ = 30.0
+# Unchanged sticks are still resent this often, so one lost packet can't
+# leave the drone acting on stale values for long.
+DEFAULT_KEEPALIVE_S = 0.2
+
+
+class RCSender:
+    """
+    Sends RC packets to the drone from its own thread at a fixed rate,
+    independent of how fast the UI draws.
+
+    The loop only calls set() with the latest stick values. Each tick sends
+    whatever was set most recently, and skips the packet if it is identical
+    to the last one sent, unless the keepalive interval has passed.
+    """
+
+    def __init__(self, tello: Tello, rate_hz: float = DEFAULT_RATE_HZ, keepalive_s: float = DEFAULT_KEEPALIVE_S) -> None:
+        self.tello = tello
+        self.period_s = 1.0 / rate_hz
+        self.keepalive_s = keepalive_s
+        # Replaced wholesale by set()/clear(), so the sender never sees a
+        # half-updated value.
+        self._values: T.Optional[RCValues] = None
+        self._last_sent: T.Optional[RCValues] = None
+        self._last_sent_at = 0.0
+
+        # How late each tick woke up relative to its deadline.
+        self.jitter = LatencyHistogram("rc jitter")
+        self.ticks = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.missed_ticks = 0
+        self._started_at = 0.0
+
+        self._stop = threading.Event()
+        self._thread: T.Optional[threading.Thread] = None
+
+    def set(self, left_right: int, forward_backward: int, up_down: int, yaw: int) -> None:
+        self._values = (left_right, forward_backward, up_down, yaw)
+
+    def clear(self) -> None:
+        """
+        Stops sending until the next set(), e.g. while the drone is landed.
+        """
+        self._values = None
+        self._last_sent = None
+
+    def start(self) -> "RCSender":
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="RCSender", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def __enter__(self) -> "RCSender":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            deadline += self.period_s
+            now = time.monotonic()
+            if deadline > now:
+                # Event.wait so close() doesn't have to wait out a tick.
+                if self._stop.wait(deadline - now):
+                    return
+                now = time.monotonic()
+            elif now - deadline > self.period_s:
+                # Fell more than a tick behind. Don't burst to catch up,
+                # just start the schedule again from now.
+                self.missed_ticks += int((now - deadline) / self.period_s)
+                deadline = now
+            self.jitter.record((now - deadline) * 1e9)
+            self.ticks += 1
+            self._tick(now)
+
+    def _tick(self, now: float) -> None:
+        values = self._values
+        if values is None:
+            return
+        if values == self._last_sent and now - self._last_sent_at < self.keepalive_s:
+            self.coalesced += 1
+            return
+        lr, fb, ud, yaw = values
+        self.tello.send_rc_control(
+            left_right_velocity=lr,
+            forward_backward_velocity=fb,
+            up_down_velocity=ud,
+            yaw_velocity=yaw,
+        )
+        self._last_sent = values
+        self._last_sent_at = now
+        self.sent += 1
+
+    @property
+    def tick_rate_hz(self) -> float:
+        elapsed = time.monotonic() - self._started_at
+        return self.ticks / elapsed if self._started_at and elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"rc: {self.tick_rate_hz:.1f}Hz target={1 / self.period_s:.0f}Hz "
+            f"sent={self.sent} coalesced={self.coalesced} missed={self.missed_ticks} "
+            f"{self.jitter.summary()}"
+        )
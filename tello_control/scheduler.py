@@ -0,0 +1,116 @@
+import time
+import typing as T
+from enum import Enum
+from .stats import LatencyHistogram
+
+# Sleeping is only accurate to about a millisecond (worse on Windows). Loops
+# that need better can pass this as spin_s, to busy-wait the last stretch
+# before each deadline instead.
+PRECISE_SPIN_S = 0.001
+# A tick that ends later than its deadline by up to this fraction of the
+# period is jitter: the next one starts right away, on the original
+# schedule, instead of being skipped.
+DEFAULT_LATE_TOLERANCE = 0.25
+# With CATCH_UP, never run more than this many late ticks back to back.
+MAX_CATCH_UP_TICKS = 4
+
+
+class OverrunPolicy(Enum):
+    # Drop the ticks that were missed and wait for the next one on the
+    # original schedule (unless within the late tolerance).
+    SKIP = "skip"
+    # Run the missed ticks immediately, back to back, until on schedule
+    # again (up to MAX_CATCH_UP_TICKS, then skip the rest).
+    CATCH_UP = "catch_up"
+
+
+class LoopScheduler:
+    """
+    Paces a loop to a fixed rate using absolute deadlines on a monotonic
+    clock, so time spent in the loop body and sleep inaccuracy don't add up
+    into drift.
+
+    Call wait() at the end of each iteration.
+    """
+
+    def __init__(
+        self,
+        rate_hz: float,
+        policy: OverrunPolicy = OverrunPolicy.SKIP,
+        spin_s: float = 0.0,
+        name: str = "",
+        late_tolerance: float = DEFAULT_LATE_TOLERANCE,
+    ) -> None:
+        self.period_s = 1.0 / rate_hz
+        self.policy = policy
+        self.spin_s = spin_s
+        self.late_tolerance_s = late_tolerance * self.period_s
+        self.name = name
+        # How late each tick started relative to its deadline.
+        self.jitter = LatencyHistogram(f"{name} jitter" if name else "jitter")
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Starts the schedule over from now, and clears the counters.
+        """
+        self._started_at = time.perf_counter()
+        self.deadline = self._started_at + self.period_s
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter.reset()
+
+    def remaining(self) -> float:
+        """
+        Seconds left until the current tick's deadline, 0 if it has passed.
+        """
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def wait(self) -> bool:
+        """
+        Blocks until the next tick is due. Returns False if the iteration
+        that just ended overran its deadline.
+        """
+        late_s = time.perf_counter() - self.deadline
+        overran = late_s > 0
+        if overran:
+            self.overruns += 1
+            missed = int(late_s // self.period_s)
+            catch_up = self.policy == OverrunPolicy.CATCH_UP and missed < MAX_CATCH_UP_TICKS
+            if catch_up or late_s <= self.late_tolerance_s:
+                # Start the next tick right away. The ones after it stay on
+                # the original schedule, so they come quicker until caught up.
+                self.jitter.record(late_s * 1e9)
+                self.deadline += self.period_s
+                self.ticks += 1
+                return False
+            # Skip to the next deadline that's still in the future.
+            self.skipped += missed
+            self.deadline += (missed + 1) * self.period_s
+
+        sleep_s = self.deadline - time.perf_counter() - self.spin_s
+        if sleep_s > 0:
+            time.sleep(sleep_s)
+        if self.spin_s > 0:
+            while time.perf_counter() < self.deadline:
+                pass
+        self.jitter.record((time.perf_counter() - self.deadline) * 1e9)
+        self.deadline += self.period_s
+        self.ticks += 1
+        return not overran
+
+    @property
+    def rate_hz(self) -> float:
+        """
+        Achieved ticks per second since the schedule started.
+        """
+        elapsed = time.perf_counter() - self._started_at
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.name + ': ' if self.name else ''}{self.rate_hz:.1f}Hz "
+            f"target={1 / self.period_s:.0f}Hz ticks={self.ticks} "
+            f"overruns={self.overruns} skipped={self.skipped} {self.jitter.summary()}"
+        )
@@ -0,0 +1,313 @@
+"""
+Stands in for the controller and the drone, so autonomous scripts can be run
+and evaluated without flying.
+
+    python run.py tello_control.simulator --warp 0 --lockstep
+    python run.py tello_control.donuts
+
+The simulator takes commands and velocities from DroneIPC like the
+controller does, moves a simple kinematic drone on a virtual clock, and
+publishes what its camera would see of a textured ground plane.
+"""
+import argparse
+import math
+import time
+import typing as T
+from dataclasses import dataclass
+import numpy as np
+import cv2
+from .autonomous import DroneIPC, TAKEOFF, LAND, EMERGENCY, STREAMON, STREAMOFF
+from .scheduler import LoopScheduler
+
+CAMERA_FPS = 30
+PHYSICS_STEPS_PER_FRAME = 4
+
+# RC 100 maps to these speeds (roughly the drone's default speed mode).
+MAX_SPEED_M_S = 1.0
+MAX_CLIMB_M_S = 1.0
+MAX_YAW_DEG_S = 100.0
+# Velocity reaches ~63% of its target after this long.
+RESPONSE_TIME_S = 0.3
+TAKEOFF_HEIGHT_M = 0.8
+TAKEOFF_CLIMB_M_S = 0.5
+LAND_DESCENT_M_S = 0.5
+MAX_HEIGHT_M = 10.0
+
+# Horizontal field of view of the forward camera, and how far it looks down.
+CAMERA_HFOV_DEG = 70.0
+CAMERA_PITCH_DEG = 10.0
+SKY_BGR = (235, 206, 135)
+GROUND_BGR = (60, 110, 60)
+
+# The texture covers GROUND_SIZE_M x GROUND_SIZE_M meters, centered on the
+# origin.
+GROUND_SIZE_M = 40.0
+GROUND_TEXTURE_PX = 2048
+
+
+@dataclass
+class Pose:
+    # Meters. x is forward at yaw 0, y is left, z is up.
+    x: float = 0.0
+    y: float = 0.0
+    z: float = 0.0
+    # Degrees, counterclockwise seen from above.
+    yaw: float = 0.0
+
+
+def make_ground_texture(seed: int = 0) -> np.ndarray:
+    """
+    A 1 m checkerboard with colored square markers scattered on it, so
+    there's something to track and recognize.
+    """
+    px_per_m = GROUND_TEXTURE_PX / GROUND_SIZE_M
+    cells = (np.arange(GROUND_TEXTURE_PX) / px_per_m).astype(np.int32)
+    checker = (cells[:, None] + cells[None, :]) % 2
+    texture = np.empty((GROUND_TEXTURE_PX, GROUND_TEXTURE_PX, 3), dtype=np.uint8)
+    texture[:] = GROUND_BGR
+    texture[checker == 1] = (80, 140, 80)
+
+    rng = np.random.default_rng(seed)
+    marker_px = int(0.5 * px_per_m)
+    for _ in range(60):
+        left, top = rng.integers(0, GROUND_TEXTURE_PX - marker_px, size=2)
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.rectangle(texture, (int(left), int(top)), (int(left) + marker_px, int(top) + marker_px), color, -1)
+    # A cross at the origin: red along +x, blue along +y.
+    center = GROUND_TEXTURE_PX // 2
+    cv2.line(texture, (center, center), (center + int(2 * px_per_m), center), (0, 0, 255), 8)
+    cv2.line(texture, (center, center), (center, center - int(2 * px_per_m)), (255, 0, 0), 8)
+    return texture
+
+
+class Simulator:
+    """
+    Kinematic drone model plus camera renderer, stepped on a virtual clock.
+    Can be driven through DroneIPC (run()), or directly from Python with
+    step() for evaluations that want the true pose.
+    """
+
+    def __init__(self, width: int, height: int, seed: int = 0) -> None:
+        self.width = width
+        self.height = height
+        self.texture = make_ground_texture(seed)
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+
+        focal = (width / 2) / math.tan(math.radians(CAMERA_HFOV_DEG) / 2)
+        self.K = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]])
+        # Rows above this are sky.
+        self.horizon_row = int(math.floor(height / 2 - focal * math.tan(math.radians(CAMERA_PITCH_DEG))))
+        m_per_px = GROUND_SIZE_M / GROUND_TEXTURE_PX
+        center = GROUND_TEXTURE_PX / 2
+        # Texture pixel -> ground meters. Texture up is +y.
+        self.texture_to_ground = np.array([
+            [m_per_px, 0, -m_per_px * center],
+            [0, -m_per_px, m_per_px * center],
+            [0, 0, 1],
+        ])
+
+        self.reset()
+
+    def reset(self, pose: T.Optional[Pose] = None) -> None:
+        self.pose = pose or Pose()
+        # Forward, left, up (m/s) and yaw (deg/s), in the drone's frame.
+        self.velocity = np.zeros((4,), dtype=np.float64)
+        self.rc = (0, 0, 0, 0)
+        self.flying = self.pose.z > 0
+        self.stream_on = True
+        self.time_ns = 0
+        # TAKEOFF or LAND while one is in progress.
+        self.maneuver: T.Optional[int] = None
+
+    def set_rc(self, left_right: int, fwd_back: int, up_down: int, yaw: int) -> None:
+        self.rc = (left_right, fwd_back, up_down, yaw)
+
+    def start_command(self, flags: int) -> None:
+        if flags & EMERGENCY:
+            self.flying = False
+            self.maneuver = None
+            self.pose.z = 0.0
+            self.velocity[:] = 0
+        if flags & STREAMON:
+            self.stream_on = True
+        if flags & STREAMOFF:
+            self.stream_on = False
+        if flags & TAKEOFF and not self.flying:
+            self.maneuver = TAKEOFF
+        if flags & LAND and self.flying:
+            self.maneuver = LAND
+
+    def step(self, dt: float) -> None:
+        """
+        Advances the model by `dt` virtual seconds.
+        """
+        pose = self.pose
+        if self.maneuver == TAKEOFF:
+            pose.z = min(TAKEOFF_HEIGHT_M, pose.z + TAKEOFF_CLIMB_M_S * dt)
+            if pose.z >= TAKEOFF_HEIGHT_M:
+                self.flying = True
+                self.maneuver = None
+        elif self.maneuver == LAND:
+            self.velocity[:] = 0
+            pose.z = max(0.0, pose.z - LAND_DESCENT_M_S * dt)
+            if pose.z <= 0:
+                self.flying = False
+                self.maneuver = None
+        elif self.flying:
+            left_right, fwd_back, up_down, yaw = self.rc
+            target = np.array([
+                fwd_back / 100 * MAX_SPEED_M_S,
+                -left_right / 100 * MAX_SPEED_M_S,
+                up_down / 100 * MAX_CLIMB_M_S,
+                # RC yaw is clockwise, pose.yaw counterclockwise.
+                -yaw / 100 * MAX_YAW_DEG_S,
+            ])
+            self.velocity += (target - self.velocity) * (1 - math.exp(-dt / RESPONSE_TIME_S))
+            forward, left, up, yaw_rate = self.velocity
+            heading = math.radians(pose.yaw)
+            pose.x += (forward * math.cos(heading) - left * math.sin(heading)) * dt
+            pose.y += (forward * math.sin(heading) + left * math.cos(heading)) * dt
+            pose.z = min(max(pose.z + up * dt, 0.1), MAX_HEIGHT_M)
+            pose.yaw = (pose.yaw + yaw_rate * dt) % 360
+        self.time_ns += int(dt * 1e9)
+
+    @property
+    def busy(self) -> bool:
+        """
+        True while a takeoff or landing is in progress.
+        """
+        return self.maneuver is not None
+
+    def telemetry(self) -> T.Dict[str, T.Union[int, float]]:
+        """
+        The model's state in the fields (and units) of the drone's state
+        packets, for DroneIPC.save_telemetry.
+        """
+        pose = self.pose
+        forward, left, up, _ = self.velocity
+        # The drone reports yaw clockwise in -180..180.
+        yaw = -((pose.yaw + 180) % 360 - 180)
+        return {
+            "yaw": int(round(yaw)),
+            # Decimeters per second.
+            "vgx": int(round(forward * 10)),
+            "vgy": int(round(left * 10)),
+            "vgz": int(round(up * 10)),
+            # Centimeters.
+            "h": int(round(pose.z * 100)),
+            "tof": int(round(pose.z * 100)),
+            "bat": 100,
+        }
+
+    def render(self) -> np.ndarray:
+        """
+        Draws the camera view into self.frame, and returns it.
+        """
+        pose = self.pose
+        heading = math.radians(pose.yaw)
+        pitch = math.radians(CAMERA_PITCH_DEG)
+        forward = np.array([math.cos(heading), math.sin(heading), 0.0])
+        left = np.array([-math.sin(heading), math.cos(heading), 0.0])
+        up = np.array([0.0, 0.0, 1.0])
+        # Camera axes in world coordinates (OpenCV convention: x right,
+        # y down, z out of the lens).
+        z_axis = math.cos(pitch) * forward - math.sin(pitch) * up
+        x_axis = -left
+        y_axis = np.cross(z_axis, x_axis)
+        R = np.stack([x_axis, y_axis, z_axis])
+        position = np.array([pose.x, pose.y, max(pose.z, 0.05)])
+        # Ground plane (z = 0) -> image.
+        ground_to_image = self.K @ np.column_stack([R[:, 0], R[:, 1], -R @ position])
+        homography = ground_to_image @ self.texture_to_ground
+
+        cv2.warpPerspective(
+            self.texture,
+            homography,
+            (self.width, self.height),
+            dst=self.frame,
+            flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=GROUND_BGR,
+        )
+        # Above the horizon the homography maps to ground behind the camera.
+        self.frame[: max(self.horizon_row + 1, 0)] = SKY_BGR
+        return self.frame
+
+
+def run(ipc: DroneIPC, simulator: Simulator, warp: float, lockstep: bool, episode_s: float, max_steps: int) -> None:
+    """
+    Steps the simulator against the scripts attached to `ipc`, one camera
+    frame at a time. `warp` is virtual seconds per real second (0 for as
+    fast as possible). With `lockstep`, each step waits for the script to
+    react to the previous frame.
+    """
+    dt = 1.0 / CAMERA_FPS
+    scheduler = LoopScheduler(CAMERA_FPS * warp, name="simulator") if warp > 0 else None
+    pending = []
+    episode = 0
+    # Simulated time restarts at each episode, but what scripts see must keep
+    # going forward, so it's offset by the time of the episodes before.
+    base_ns = 0
+    steps = 0
+    started = time.perf_counter()
+    try:
+        while max_steps <= 0 or steps < max_steps:
+            for command in ipc.poll_commands():
+                simulator.start_command(command.flags)
+                pending.append(command)
+            state = ipc.get_state()
+            simulator.set_rc(state.left_right_vel, state.fwd_back_vel, state.up_down_vel, state.yaw_vel)
+
+            for _ in range(PHYSICS_STEPS_PER_FRAME):
+                simulator.step(dt / PHYSICS_STEPS_PER_FRAME)
+            if pending and not simulator.busy:
+                for command in pending:
+                    ipc.ack_command(command)
+                pending.clear()
+
+            timestamp_ns = base_ns + simulator.time_ns
+            ipc.save_telemetry(simulator.telemetry(), timestamp_ns=timestamp_ns)
+            if simulator.stream_on:
+                ipc.save_frame(simulator.render(), timestamp_ns=timestamp_ns)
+                # Scripts have nothing to react to during takeoff/landing.
+                if lockstep and not simulator.busy:
+                    # Fall back to real time if the script stops answering.
+                    ipc.wait_for_state(timeout=0.5)
+            steps += 1
+
+            if episode_s > 0 and simulator.time_ns >= episode_s * 1e9:
+                episode += 1
+                print(f"episode {episode}: ended at {simulator.pose}")
+                base_ns += simulator.time_ns
+                simulator.reset()
+            if scheduler is not None:
+                scheduler.wait()
+    finally:
+        elapsed = time.perf_counter() - started
+        print(
+            f"simulator: {steps} steps in {elapsed:.1f}s ({steps / elapsed:.0f} steps/s, "
+            f"{steps * dt / elapsed:.1f}x real time)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--warp", type=float, default=1.0, help="virtual seconds per real second, 0 for unpaced")
+    parser.add_argument("--lockstep", action="store_true", help="wait for the script to react to each frame")
+    parser.add_argument("--episode-s", type=float, default=0.0, help="reset the drone every this many virtual seconds")
+    parser.add_argument("--steps", type=int, default=0, help="stop after this many frames")
+    parser.add_argument("--seed", type=int, default=0, help="ground texture seed")
+    args = parser.parse_args()
+
+    with DroneIPC() as ipc:
+        simulator = Simulator(ipc.layout.width, ipc.layout.height, seed=args.seed)
+        try:
+            run(ipc, simulator, args.warp, args.lockstep, args.episode_s, args.steps)
+        except KeyboardInterrupt:
+            pass
+        print(ipc.command_latency.summary())
+        print(ipc.state_latency.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import json
+import time
+import typing as T
+from pathlib import Path
+import numpy as np
+import pygame
+
+DEFAULT_CAPACITY = 4096
+PERCENTILES = (50, 95, 99)
+
+
+def _noop(*args, **kwargs) -> None:
+    pass
+
+
+class StageTimer:
+    """
+    Timestamps each stage of every loop iteration into a preallocated ring,
+    so we can see where a slow frame's time went.
+
+    Per iteration, call begin(), then mark(i) as stage i finishes, then
+    end(). Nothing allocates on that path, and when disabled the three calls
+    are no-ops.
+    """
+
+    def __init__(self, stages: T.Sequence[str], capacity: int = DEFAULT_CAPACITY, enabled: bool = True) -> None:
+        self.stages = tuple(stages)
+        self.enabled = enabled
+        # Row per iteration: start time, then the time each stage ended, in
+        # perf_counter_ns.
+        self._ring = np.zeros((capacity, len(self.stages) + 1), dtype=np.int64)
+        self._row = self._ring[0]
+        # Iterations recorded so far. The next goes at n_iterations % capacity.
+        self.n_iterations = 0
+        self._last_report = time.perf_counter()
+        if not enabled:
+            self.begin = _noop
+            self.mark = _noop
+            self.end = _noop
+
+    def begin(self) -> None:
+        self._row = self._ring[self.n_iterations % len(self._ring)]
+        self._row[:] = 0
+        self._row[0] = time.perf_counter_ns()
+
+    def mark(self, stage: int) -> None:
+        self._row[stage + 1] = time.perf_counter_ns()
+
+    def end(self) -> None:
+        self.n_iterations += 1
+
+    def durations_ns(self) -> np.ndarray:
+        """
+        (iterations, stages) durations of the retained iterations, oldest
+        first. A stage that was skipped in an iteration takes 0.
+        """
+        n = min(self.n_iterations, len(self._ring))
+        rows = np.take(self._ring, np.arange(self.n_iterations - n, self.n_iterations) % len(self._ring), axis=0)
+        # Skipped stages ended when the stage before them did.
+        ends = np.maximum.accumulate(rows, axis=1)
+        return np.diff(ends, axis=1)
+
+    def summary_lines(self) -> T.List[str]:
+        durations = self.durations_ns()
+        if len(durations) == 0:
+            return []
+        lines = []
+        totals = durations.sum(axis=1)
+        for name, column in (*zip(self.stages, durations.T), ("total", totals)):
+            values = np.percentile(column, PERCENTILES) / 1e6
+            parts = " ".join(f"p{p}={v:.2f}" for p, v in zip(PERCENTILES, values))
+            lines.append(f"{name:>8}: {parts} max={column.max() / 1e6:.2f}ms")
+        return lines
+
+    def report_due(self, interval_s: float) -> bool:
+        """
+        True at most once every `interval_s`, for periodic summaries.
+        """
+        if not self.enabled:
+            return False
+        now = time.perf_counter()
+        if now - self._last_report < interval_s:
+            return False
+        self._last_report = now
+        return True
+
+    def dump(self, path: T.Union[str, Path]) -> None:
+        """
+        Writes the retained iterations' stage durations (in ms), one per
+        line, as NDJSON if `path` ends in .ndjson and as CSV otherwise.
+        """
+        path = Path(path)
+        durations = self.durations_ns() / 1e6
+        first = self.n_iterations - len(durations)
+        with open(path, "w") as f:
+            if path.suffix == ".ndjson":
+                for i, row in enumerate(durations):
+                    record = {"iteration": first + i, **dict(zip(self.stages, row.tolist()))}
+                    print(json.dumps(record), file=f)
+            else:
+                print(",".join(("iteration", *self.stages)), file=f)
+                for i, row in enumerate(durations):
+                    print(",".join((str(first + i), *(f"{v:.4f}" for v in row))), file=f)
+
+    def render_overlay(self, font: pygame.font.Font) -> T.Optional[pygame.Surface]:
+        lines = self.summary_lines()
+        if not lines:
+            return None
+        rendered = [font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(each.get_width() for each in rendered)
+        height = sum(each.get_height() for each in rendered)
+        overlay = pygame.Surface((width + 8, height + 8))
+        overlay.fill((0, 0, 0))
+        top = 4
+        for each in rendered:
+            overlay.blit(each, (4, top))
+            top += each.get_height()
+        return overlay
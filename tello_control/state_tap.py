@@ -0,0 +1,72 @@
+"""
+Hands every state packet the drone sends to a callback, as djitellopy
+parses it.
+
+djitellopy's state thread only keeps the newest packet, in
+drones[host]["state"], so anything that samples it (e.g. once per frame)
+misses packets whenever it's slower than the drone. The tap swaps the
+drone's entry in that table for a dict that also passes each new state to
+the callback, on djitellopy's thread, as it's stored.
+"""
+import threading
+import typing as T
+from djitellopy import Tello
+from djitellopy import tello as djitellopy_tello
+
+State = T.Dict[str, T.Union[int, float, str]]
+
+
+class _TappedEntry(dict):
+    def __init__(self, entry: T.Dict[str, T.Any], on_state: T.Callable[[State], None]) -> None:
+        super().__init__(entry)
+        self.on_state = on_state
+
+    def __setitem__(self, key: str, value: T.Any) -> None:
+        super().__setitem__(key, value)
+        if key == "state" and value:
+            self.on_state(value)
+
+
+class StateTap:
+    """
+    Calls `callback` with each state packet from `tello` while entered.
+    The callback runs on djitellopy's state thread, so it should be quick.
+    """
+
+    def __init__(self, tello: Tello, callback: T.Callable[[State], None]) -> None:
+        # djitellopy files state under the host the drone was created with.
+        self.host = tello.address[0]
+        self.callback = callback
+        self.packets = 0
+        self.errors = 0
+        # Held while the callback runs, so that once __exit__ returns it
+        # won't be called again (e.g. with a closed DroneIPC).
+        self._lock = threading.Lock()
+        self._active = False
+
+    def _on_state(self, state: State) -> None:
+        with self._lock:
+            if not self._active:
+                return
+            self.packets += 1
+            # An exception here would end djitellopy's state thread for good.
+            try:
+                self.callback(state)
+            except Exception as e:
+                self.errors += 1
+                Tello.LOGGER.error(f"state tap: {e!r}")
+
+    def __enter__(self) -> "StateTap":
+        self._active = True
+        drones = djitellopy_tello.drones
+        drones[self.host] = _TappedEntry(drones[self.host], self._on_state)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        drones = djitellopy_tello.drones
+        drones[self.host] = dict(drones[self.host])
+        with self._lock:
+            self._active = False
+
+    def summary(self) -> str:
+        return f"state tap: {self.packets} packets, {self.errors} errors"
@@ -0,0 +1,66 @@
+import math
+import typing as T
+import numpy as np
+
+# Log-linear buckets: each power of two is split into this many buckets, so
+# any recorded value is off by at most ~9% once bucketed.
+SUB_BUCKETS = 8
+N_BUCKETS = 64 * SUB_BUCKETS
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram of durations in nanoseconds. Recording is O(1) and
+    never allocates, so it is safe to use on hot paths.
+    """
+
+    def __init__(self, name: str = "") -> None:
+        self.name = name
+        self.counts = np.zeros((N_BUCKETS,), dtype=np.int64)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = 0
+        self.max_ns = 0
+
+    def record(self, value_ns: int) -> None:
+        value_ns = max(int(value_ns), 0)
+        bucket = 0 if value_ns < 1 else min(int(math.log2(value_ns) * SUB_BUCKETS), N_BUCKETS - 1)
+        self.counts[bucket] += 1
+        if self.count == 0 or value_ns < self.min_ns:
+            self.min_ns = value_ns
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+        self.count += 1
+        self.total_ns += value_ns
+
+    def reset(self) -> None:
+        self.counts.fill(0)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = 0
+        self.max_ns = 0
+
+    def percentile(self, p: float) -> float:
+        """
+        Approximate `p`th percentile (0 to 100), in nanoseconds.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = math.ceil(self.count * p / 100.0)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), max(rank, 1)))
+        # Report the middle of the bucket, clamped to what was actually seen.
+        low = 2 ** (bucket / SUB_BUCKETS)
+        high = 2 ** ((bucket + 1) / SUB_BUCKETS)
+        return float(min(max((low + high) / 2, self.min_ns), self.max_ns))
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.count if self.count else 0.0
+
+    def summary(self, percentiles: T.Sequence[float] = (50, 95, 99)) -> str:
+        parts = [f"{self.name}:"] if self.name else []
+        parts.append(f"n={self.count}")
+        if self.count:
+            parts.extend(f"p{p:g}={self.percentile(p) / 1e6:.2f}ms" for p in percentiles)
+            parts.append(f"max={self.max_ns / 1e6:.2f}ms")
+        return " ".join(parts)
@@ -0,0 +1,234 @@
+"""
+Trades video quality for loop rate when the ground station can't keep up.
+
+The governor steps the drone's stream down QUALITY_LEVELS when the loop is
+overloaded and back up once it has had headroom for a while, so control
+stays responsive on weak hardware instead of starving behind the video.
+"""
+import time
+import typing as T
+from dataclasses import dataclass
+import numpy as np
+from djitellopy import Tello
+from .command_executor import CommandExecutor, PRIORITY_BACKGROUND
+from .tello_protocol import discard_responses
+from .video_decoder import VideoDecoder
+
+# Load is judged over windows of this long.
+WINDOW_S = 2.0
+# Fraction of the frame budget (or of the video's frame interval, for
+# decoding) above which a window counts as overloaded, and below which it
+# counts as having headroom.
+HIGH_LOAD = 0.85
+LOW_LOAD = 0.5
+# Fraction of loop frames that may miss their deadline, or of video frames
+# the decoder may shed, before a window counts as overloaded.
+MAX_OVERRUN_FRACTION = 0.1
+MAX_SHED_FRACTION = 0.1
+# Step down after this many overloaded windows in a row, and up after this
+# many with headroom. Stepping up is slow, so quality doesn't oscillate.
+DOWNGRADE_WINDOWS = 1
+UPGRADE_WINDOWS = 5
+# The stream restarts at a keyframe after a change, so give the new setting
+# this long before judging it.
+SETTLE_S = 4.0
+# Each setting is its own background job of one attempt, so a flight command
+# submitted meanwhile waits for at most one of them, this long.
+COMMAND_TIMEOUT_S = 2
+
+
+@dataclass(frozen=True)
+class StreamQuality:
+    resolution: str
+    fps: str
+    bitrate: int
+
+    def __str__(self) -> str:
+        resolution = "720p" if self.resolution == Tello.RESOLUTION_720P else "480p"
+        fps = {Tello.FPS_30: 30, Tello.FPS_15: 15, Tello.FPS_5: 5}[self.fps]
+        bitrate = f"{self.bitrate}Mbps" if self.bitrate != Tello.BITRATE_AUTO else "auto"
+        return f"{resolution}@{fps} {bitrate}"
+
+    @property
+    def frame_interval_s(self) -> float:
+        return 1.0 / {Tello.FPS_30: 30, Tello.FPS_15: 15, Tello.FPS_5: 5}[self.fps]
+
+
+# Best first. The first is what the drone streams after power-on.
+QUALITY_LEVELS = [
+    StreamQuality(Tello.RESOLUTION_720P, Tello.FPS_30, Tello.BITRATE_AUTO),
+    StreamQuality(Tello.RESOLUTION_720P, Tello.FPS_30, Tello.BITRATE_3MBPS),
+    StreamQuality(Tello.RESOLUTION_480P, Tello.FPS_30, Tello.BITRATE_2MBPS),
+    StreamQuality(Tello.RESOLUTION_480P, Tello.FPS_15, Tello.BITRATE_1MBPS),
+    StreamQuality(Tello.RESOLUTION_480P, Tello.FPS_5, Tello.BITRATE_1MBPS),
+]
+
+
+def _commands(old: T.Optional[StreamQuality], new: StreamQuality) -> T.List[str]:
+    # Only what changed (everything, if `old` isn't known), lowest cost
+    # first when stepping down.
+    commands = []
+    if old is None or new.bitrate != old.bitrate:
+        commands.append(f"setbitrate {new.bitrate}")
+    if old is None or new.fps != old.fps:
+        commands.append(f"setfps {new.fps}")
+    if old is None or new.resolution != old.resolution:
+        commands.append(f"setresolution {new.resolution}")
+    return commands
+
+
+def _send(tello: Tello, command: str) -> None:
+    # One attempt: djitellopy's set_video_* retry three times, 7 s each.
+    # (djitellopy insists on an int timeout.) A reply that came in after an
+    # earlier setting timed out would otherwise be taken for this one's.
+    discard_responses(tello)
+    response = tello.send_command_with_return(command, timeout=COMMAND_TIMEOUT_S)
+    if "ok" not in response.lower():
+        raise RuntimeError(f"Command '{command}' was unsuccessful: {response}")
+
+
+class StreamGovernor:
+    """
+    Call record_frame() once per loop iteration. Changes go through the
+    executor as background jobs, and are printed and kept in `changes`.
+
+    The drone's settings aren't known until the governor sets them, so it
+    sends the whole first level once the stream is on.
+    """
+
+    def __init__(
+        self,
+        tello: Tello,
+        executor: CommandExecutor,
+        target_hz: float,
+        decoder: T.Optional[VideoDecoder] = None,
+        levels: T.Sequence[StreamQuality] = QUALITY_LEVELS,
+    ) -> None:
+        self.tello = tello
+        self.executor = executor
+        self.target_hz = target_hz
+        self.decoder = decoder
+        self.levels = list(levels)
+        self.level = 0
+        # Whether the drone has been told self.quality.
+        self.applied = False
+        # Set if the drone refuses a change (older firmware doesn't take
+        # these commands), after which the governor leaves it alone.
+        self.disabled = False
+        self.changes: T.List[str] = []
+
+        self._work_s = np.zeros((int(WINDOW_S * target_hz * 4) + 1,), dtype=np.float64)
+        self._n_frames = 0
+        self._n_overruns = 0
+        self._window_started = time.monotonic()
+        self._settled_at = 0.0
+        self._overloaded_windows = 0
+        self._headroom_windows = 0
+        self._decoder_counts = self._read_decoder()
+        self._job_names: T.List[str] = []
+
+    @property
+    def quality(self) -> StreamQuality:
+        return self.levels[self.level]
+
+    def _read_decoder(self) -> T.Tuple[int, int, int, int]:
+        decoder = self.decoder
+        if decoder is None:
+            return (0, 0, 0, 0)
+        return (
+            decoder.frames_received,
+            decoder.frames_skipped + decoder.frames_dropped,
+            decoder.decode_latency.count,
+            decoder.decode_latency.total_ns,
+        )
+
+    def record_frame(self, work_s: float, on_time: bool) -> None:
+        """
+        `work_s` is how long the iteration took before waiting for the next
+        tick, and `on_time` whether it made its deadline.
+        """
+        if self._n_frames < len(self._work_s):
+            self._work_s[self._n_frames] = work_s
+        self._n_frames += 1
+        if not on_time:
+            self._n_overruns += 1
+        now = time.monotonic()
+        if now - self._window_started >= WINDOW_S:
+            self._end_window(now)
+
+    def _end_window(self, now: float) -> None:
+        n = min(self._n_frames, len(self._work_s))
+        loop_load = float(np.percentile(self._work_s[:n], 90)) * self.target_hz if n else 0.0
+        overrun_fraction = self._n_overruns / max(self._n_frames, 1)
+
+        counts = self._read_decoder()
+        received, shed, decoded, decode_ns = (now_count - then for now_count, then in zip(counts, self._decoder_counts))
+        self._decoder_counts = counts
+        shed_fraction = shed / received if received else 0.0
+        decode_load = (decode_ns / decoded / 1e9) / self.quality.frame_interval_s if decoded else 0.0
+
+        self._n_frames = 0
+        self._n_overruns = 0
+        self._window_started = now
+
+        if self.disabled or not self.tello.stream_on or self._busy() or now < self._settled_at:
+            self._overloaded_windows = 0
+            self._headroom_windows = 0
+            return
+        if not self.applied:
+            self._set_level(self.level, "starting level")
+            return
+
+        reason = (
+            f"loop p90 {loop_load:.0%} of budget, {overrun_fraction:.0%} late, "
+            f"decode {decode_load:.0%} of frame interval, {shed_fraction:.0%} shed"
+        )
+        if loop_load > HIGH_LOAD or overrun_fraction > MAX_OVERRUN_FRACTION or decode_load > HIGH_LOAD or shed_fraction > MAX_SHED_FRACTION:
+            self._overloaded_windows += 1
+            self._headroom_windows = 0
+        elif loop_load < LOW_LOAD and overrun_fraction == 0 and decode_load < LOW_LOAD and shed_fraction == 0:
+            self._headroom_windows += 1
+            self._overloaded_windows = 0
+        else:
+            self._overloaded_windows = 0
+            self._headroom_windows = 0
+
+        if self._overloaded_windows >= DOWNGRADE_WINDOWS and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1, reason)
+        elif self._headroom_windows >= UPGRADE_WINDOWS and self.level > 0:
+            self._set_level(self.level - 1, reason)
+
+    def _busy(self) -> bool:
+        return any(self.executor.busy(name) for name in self._job_names)
+
+    def _set_level(self, level: int, reason: str) -> None:
+        old = self.quality if self.applied else None
+        new = self.levels[level]
+        previous_level = self.level
+        self.level = level
+        self.applied = True
+        self._overloaded_windows = 0
+        self._headroom_windows = 0
+        self._settled_at = time.monotonic() + SETTLE_S
+        change = f"stream quality: {old if old is not None else '?'} -> {new} ({reason})"
+        print(change)
+        self.changes.append(change)
+
+        def on_done(ok: bool) -> None:
+            if not ok and not self.disabled:
+                self.level = previous_level
+                self.disabled = True
+                for name in self._job_names:
+                    self.executor.cancel(name)
+                print("stream quality: the drone refused the change, leaving the stream alone")
+
+        self._job_names = [f"stream quality: {command}" for command in _commands(old, new)]
+        for name, command in zip(self._job_names, _commands(old, new)):
+            self.executor.submit(
+                name, lambda command=command: _send(self.tello, command), COMMAND_TIMEOUT_S,
+                on_done=on_done, priority=PRIORITY_BACKGROUND,
+            )
+
+    def summary(self) -> str:
+        state = "disabled" if self.disabled else str(self.quality)
+        return f"stream governor: {len(self.changes)} changes, now {state}"
@@ -0,0 +1,32 @@
+"""
+Ports and sizes of the Tello's UDP protocol, shared by the controller, the
+video pipeline and fake_tello.
+"""
+import typing as T
+
+# djitellopy binds 8889 itself to send commands from, so on the same machine
+# fake_tello has to listen somewhere else.
+DEFAULT_COMMAND_PORT = 18889
+# Where the drone sends state packets and video, on the ground station.
+CLIENT_STATE_PORT = 8890
+CLIENT_VIDEO_PORT = 11111
+# Payload size the drone splits its video stream into. A shorter packet ends
+# a frame.
+VIDEO_PACKET_LENGTH = 1460
+
+
+def discard_responses(tello: T.Any) -> int:
+    """
+    Drops the replies djitellopy has received but not matched to a command,
+    and returns how many there were.
+
+    djitellopy hands each command whichever reply is oldest, so a reply
+    nobody waited for (to a fire-and-forget emergency, or one that came in
+    after its command timed out) would be taken as the answer to the next
+    command, and every answer after it would be one behind. Call this just
+    before sending a command.
+    """
+    responses = tello.get_own_udp_object()["responses"]
+    n = len(responses)
+    del responses[:n]
+    return n
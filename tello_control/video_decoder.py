@@ -0,0 +1,231 @@
+"""
+Decodes the drone's video stream, keeping only the newest frame.
+
+djitellopy decodes every frame in order through OpenCV, and when decoding
+falls behind, the backlog shows up as a view that lags seconds behind the
+drone. VideoDecoder receives the stream itself and sheds that backlog:
+
+    - Frames queued behind a newer keyframe are discarded undecoded, since
+      nothing after the keyframe refers to them.
+    - Other queued frames are decoded (the next frame needs them) but not
+      converted to BGR. Only the newest is converted and published.
+
+Every published frame carries its id and when it was received and decoded,
+so consumers can see how old it is.
+"""
+import socket
+import threading
+import time
+import typing as T
+from collections import deque
+from dataclasses import dataclass
+import numpy as np
+from .tello_protocol import CLIENT_VIDEO_PORT, VIDEO_PACKET_LENGTH
+from .stats import LatencyHistogram
+
+# Room for a couple of seconds of video, so nothing is lost to a slow
+# receive thread.
+RECEIVE_BUFFER_BYTES = 4 * 1024 * 1024
+RECEIVE_LENGTH = 2048
+# NAL unit types that start a decodable sequence: IDR slice, SPS.
+KEYFRAME_NAL_TYPES = (5, 7)
+
+
+@dataclass
+class DecodedFrame:
+    # Counts published frames, from 1.
+    frame_id: int
+    # BGR. A new array per frame, never written after publishing.
+    image: np.ndarray
+    # time.monotonic_ns() when the frame's first packet arrived, and when it
+    # finished decoding.
+    received_ns: int
+    decoded_ns: int
+
+    def age_ns(self, now_ns: T.Optional[int] = None) -> int:
+        return (now_ns if now_ns is not None else time.monotonic_ns()) - self.received_ns
+
+
+@dataclass
+class _AccessUnit:
+    data: bytearray
+    received_ns: int
+    keyframe: bool
+
+
+def is_keyframe(data: T.Union[bytes, bytearray]) -> bool:
+    """
+    Whether an Annex-B access unit holds an IDR slice or an SPS.
+    """
+    start = data.find(b"\x00\x00\x01")
+    while start != -1 and start + 3 < len(data):
+        if data[start + 3] & 0x1F in KEYFRAME_NAL_TYPES:
+            return True
+        start = data.find(b"\x00\x00\x01", start + 3)
+    return False
+
+
+class VideoDecoder:
+    """
+    Receives the video stream on `port` and decodes it on its own threads.
+    latest() returns the newest decoded frame.
+
+    Like the drone's own SDK examples, this takes a packet shorter than
+    VIDEO_PACKET_LENGTH to end a frame.
+
+    Raises ImportError if PyAV isn't installed.
+    """
+
+    def __init__(self, port: int = CLIENT_VIDEO_PORT, host: str = "0.0.0.0") -> None:
+        import av
+
+        self._av = av
+        self._codec = av.CodecContext.create("h264", "r")
+        # Frame threading would hold frames back to fill its threads, and the
+        # stream has no B-frames to wait for.
+        self._codec.thread_type = "SLICE"
+        self._codec.flags |= av.codec.context.Flags.low_delay
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_BYTES)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.5)
+
+        self._pending: T.Deque[_AccessUnit] = deque()
+        self._pending_changed = threading.Condition()
+        self._latest: T.Optional[DecodedFrame] = None
+        self._latest_changed = threading.Condition()
+        self._taken_id = 0
+        # Nothing decodes until the first keyframe.
+        self._synced = False
+
+        self.packets = 0
+        self.frames_received = 0
+        self.frames_published = 0
+        # Decoded only as a reference for a newer frame.
+        self.frames_skipped = 0
+        # Discarded undecoded, behind a newer keyframe or before the first.
+        self.frames_dropped = 0
+        self.decode_errors = 0
+        self.decode_latency = LatencyHistogram("receive->decoded")
+        self.pickup_age = LatencyHistogram("receive->taken")
+        self._stop = threading.Event()
+        self._threads: T.List[threading.Thread] = []
+
+    def start(self) -> "VideoDecoder":
+        for name, target in (("receive", self._receive_loop), ("decode", self._decode_loop)):
+            thread = threading.Thread(target=target, name=f"VideoDecoder-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._pending_changed:
+            self._pending_changed.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self.socket.close()
+
+    def __enter__(self) -> "VideoDecoder":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _receive_loop(self) -> None:
+        buffer = bytearray(RECEIVE_LENGTH)
+        unit: T.Optional[_AccessUnit] = None
+        while not self._stop.is_set():
+            try:
+                n = self.socket.recv_into(buffer)
+            except socket.timeout:
+                continue
+            self.packets += 1
+            if unit is None:
+                unit = _AccessUnit(bytearray(), time.monotonic_ns(), False)
+            unit.data += buffer[:n]
+            if n == VIDEO_PACKET_LENGTH:
+                continue
+            unit.keyframe = is_keyframe(unit.data)
+            self.frames_received += 1
+            with self._pending_changed:
+                self._pending.append(unit)
+                self._pending_changed.notify()
+            unit = None
+
+    def _decode_loop(self) -> None:
+        while not self._stop.is_set():
+            with self._pending_changed:
+                while not self._pending and not self._stop.is_set():
+                    self._pending_changed.wait()
+                units = list(self._pending)
+                self._pending.clear()
+            if not units:
+                continue
+
+            # Start from the newest keyframe, if there's one.
+            keyframes = [i for i, unit in enumerate(units) if unit.keyframe]
+            if keyframes:
+                self._synced = True
+                self.frames_dropped += keyframes[-1]
+                units = units[keyframes[-1]:]
+            elif not self._synced:
+                self.frames_dropped += len(units)
+                continue
+
+            for i, unit in enumerate(units):
+                newest = i == len(units) - 1
+                try:
+                    frames = self._codec.decode(self._av.Packet(bytes(unit.data)))
+                except self._av.error.FFmpegError:
+                    self.decode_errors += 1
+                    continue
+                for frame in frames:
+                    if newest:
+                        self._publish(frame.to_ndarray(format="bgr24"), unit.received_ns)
+                    else:
+                        self.frames_skipped += 1
+
+    def _publish(self, image: np.ndarray, received_ns: int) -> None:
+        decoded_ns = time.monotonic_ns()
+        self.decode_latency.record(decoded_ns - received_ns)
+        with self._latest_changed:
+            self.frames_published += 1
+            self._latest = DecodedFrame(self.frames_published, image, received_ns, decoded_ns)
+            self._latest_changed.notify_all()
+
+    def latest(self) -> T.Optional[DecodedFrame]:
+        """
+        The newest decoded frame, or None before the first.
+        """
+        latest = self._latest
+        if latest is not None and latest.frame_id != self._taken_id:
+            self._taken_id = latest.frame_id
+            self.pickup_age.record(latest.age_ns())
+        return latest
+
+    def wait_for_frame(self, after: int, timeout: T.Optional[float] = None) -> T.Optional[DecodedFrame]:
+        """
+        Waits for a frame with id greater than `after`, and returns it (or
+        None on timeout).
+        """
+        with self._latest_changed:
+            if not self._latest_changed.wait_for(lambda: self._latest is not None and self._latest.frame_id > after, timeout):
+                return None
+        return self.latest()
+
+    @property
+    def frame(self) -> T.Optional[np.ndarray]:
+        """
+        The newest image, like djitellopy's BackgroundFrameRead.frame.
+        """
+        latest = self.latest()
+        return latest.image if latest is not None else None
+
+    def summary(self) -> str:
+        return (
+            f"decoder: received={self.frames_received} published={self.frames_published} "
+            f"skipped={self.frames_skipped} dropped={self.frames_dropped} errors={self.decode_errors}\n"
+            f"{self.decode_latency.summary()}\n{self.pickup_age.summary()}"
+        )
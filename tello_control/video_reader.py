@@ -1,38 +1,52 @@
-import time
-from .autonomous import DroneIPC, DroneState, CAMERA_W, CAMERA_H
+import argparse
+from pathlib import Path
+from .autonomous import DroneIPC, DroneState
+from .scheduler import LoopScheduler
+from .video_recorder import DEFAULT_QUEUE_LENGTH, ENCODERS, DropPolicy, VideoRecorder
 import cv2
 
 def main():
-    frames_per_second = 30
-    output_filename = "/tmp/dronevideo.avi"
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    frame_size = (CAMERA_W, CAMERA_H)
-    video_writer = cv2.VideoWriter(
-       output_filename,
-       fourcc,
-       frames_per_second,
-       frame_size,
-    )
-    show_frame = True
+    parser = argparse.ArgumentParser(description="Records the drone's video from DroneIPC.")
+    parser.add_argument("--encoder", choices=sorted(ENCODERS), default="mjpg")
+    parser.add_argument("--output", default="/tmp/dronevideo", help="file name, without the extension")
+    parser.add_argument("--fps", type=float, default=30, help="frame rate written to the file")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE_LENGTH, help="frames buffered for the encoder")
+    parser.add_argument("--drop", choices=[policy.value for policy in DropPolicy], default=DropPolicy.DROP_OLDEST.value, help="which frames to lose when the encoder falls behind")
+    parser.add_argument("--no-preview", action="store_true")
+    args = parser.parse_args()
 
-    ms_per_iteration = 1000.0 / frames_per_second
-    cap = cv2.VideoCapture(0)
+    encoder = ENCODERS[args.encoder]()
+    output_filename = Path(args.output + encoder.extension)
+    show_frame = not args.no_preview
+
+    # Encoding happens off this thread; this only paces the preview.
+    scheduler = LoopScheduler(args.fps, name="preview")
     with DroneIPC() as ipc:
-        while True:
-            start_ts = time.perf_counter()
-            frame = ipc.get_frame()
-            if show_frame:
-              cv2.imshow('writer', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-              break
-            video_writer.write(frame)
-            end_ts = time.perf_counter()
-            elapsed_ms = end_ts - start_ts
-            wait_ms = max(0, ms_per_iteration - elapsed_ms)
-            time.sleep(wait_ms / 1000.0)
-    cap.release()
-    video_writer.release()
+        recorder = VideoRecorder(
+            ipc,
+            encoder,
+            output_filename,
+            args.fps,
+            queue_length=args.queue,
+            policy=DropPolicy(args.drop),
+            preview=show_frame,
+        )
+        with recorder:
+            try:
+                while True:
+                    if show_frame:
+                        image = recorder.preview_frame()
+                        if image is not None:
+                            cv2.imshow('writer', image)
+                        if cv2.waitKey(1) & 0xFF == ord('q'):
+                            break
+                    scheduler.wait()
+            except KeyboardInterrupt:
+                pass
+        print(recorder.summary())
+    print(f"wrote {output_filename}")
+    print(scheduler.summary())
     cv2.destroyAllWindows()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,407 @@
+"""
+Records DroneIPC frames to disk without making capture wait on encoding.
+
+Capture, encode and preview run as separate stages:
+
+    capture thread  waits for each new frame and copies it into a pooled
+                    buffer, then queues it
+    encode thread   converts queued frames to BGR and hands them to the
+                    encoder, once per frame id
+    main thread     shows the newest encoded frame, at its own pace
+
+The queue between capture and encode is bounded. When the encoder falls
+behind, the drop policy decides which frames are lost, and every loss is
+counted.
+"""
+import shutil
+import struct
+import subprocess
+import threading
+import time
+import typing as T
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+import numpy as np
+import cv2
+from .autonomous import DroneIPC
+from .stats import LatencyHistogram
+
+DEFAULT_QUEUE_LENGTH = 8
+# How long the capture thread waits for a frame before checking for close().
+CAPTURE_POLL_S = 0.1
+
+
+class DropPolicy(Enum):
+    # Lose the oldest queued frame, so the recording stays current.
+    DROP_OLDEST = "oldest"
+    # Lose the frame that just arrived, so the recording has no gaps
+    # inside what was already queued.
+    DROP_NEWEST = "newest"
+    # Hold up capture. Frames the producer publishes meanwhile are missed.
+    BLOCK = "block"
+
+
+class Encoder(ABC):
+    """
+    Writes BGR frames to a file. Subclasses implement open/write, and close
+    if they hold anything open.
+    """
+
+    extension = ""
+
+    @abstractmethod
+    def open(self, path: Path, width: int, height: int, fps: float) -> None:
+        ...
+
+    @abstractmethod
+    def write(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class OpenCVEncoder(Encoder):
+    """
+    cv2.VideoWriter with the given codec. MJPG encodes each frame on its own
+    and is cheap enough to keep up at 960x720@30; XVID makes smaller files
+    but costs more per frame.
+    """
+
+    extension = ".avi"
+
+    def __init__(self, fourcc: str = "MJPG") -> None:
+        self.fourcc = fourcc
+        self._writer: T.Optional[cv2.VideoWriter] = None
+
+    def open(self, path: Path, width: int, height: int, fps: float) -> None:
+        self._writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*self.fourcc), fps, (width, height))
+        if not self._writer.isOpened():
+            raise RuntimeError(f"OpenCV can't write {self.fourcc} to {path}")
+
+    def write(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        self._writer.write(image)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+
+# Before each raw frame: frame id, timestamp, width, height.
+RAW_FRAME_HEADER = struct.Struct("<QqII")
+
+
+class RawEncoder(Encoder):
+    """
+    Uncompressed BGR frames, each after a RAW_FRAME_HEADER. Costs only disk
+    bandwidth (about 62 MB/s at 960x720@30), and keeps every frame's id and
+    timestamp.
+    """
+
+    extension = ".bgr"
+
+    def __init__(self) -> None:
+        self._file: T.Optional[T.BinaryIO] = None
+
+    def open(self, path: Path, width: int, height: int, fps: float) -> None:
+        self._file = open(path, "wb")
+
+    def write(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        height, width = image.shape[:2]
+        self._file.write(RAW_FRAME_HEADER.pack(frame_id, timestamp_ns, width, height))
+        self._file.write(memoryview(np.ascontiguousarray(image)).cast("B"))
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FFmpegEncoder(Encoder):
+    """
+    Pipes raw frames to an ffmpeg process, which encodes on its own cores.
+    """
+
+    extension = ".mp4"
+
+    def __init__(self, codec: str = "libx264", options: T.Sequence[str] = ("-preset", "ultrafast")) -> None:
+        self.codec = codec
+        self.options = tuple(options)
+        self._process: T.Optional[subprocess.Popen] = None
+
+    def open(self, path: Path, width: int, height: int, fps: float) -> None:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg isn't on the PATH")
+        self._process = subprocess.Popen(
+            [
+                ffmpeg, "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                "-c:v", self.codec, *self.options, "-pix_fmt", "yuv420p", str(path),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        self._process.stdin.write(memoryview(np.ascontiguousarray(image)).cast("B"))
+
+    def close(self) -> None:
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+
+def _store_encoder(codec_name: str) -> Encoder:
+    # video_store builds on this module, so it's imported when needed.
+    from .video_store import FrameCodec, StoreEncoder
+    return StoreEncoder(FrameCodec[codec_name])
+
+
+ENCODERS: T.Dict[str, T.Callable[[], Encoder]] = {
+    "mjpg": lambda: OpenCVEncoder("MJPG"),
+    "xvid": lambda: OpenCVEncoder("XVID"),
+    "raw": RawEncoder,
+    "ffmpeg": FFmpegEncoder,
+    "store": lambda: _store_encoder("RAW"),
+    "store-jpeg": lambda: _store_encoder("JPEG"),
+}
+
+
+@dataclass
+class QueuedFrame:
+    frame_id: int
+    timestamp_ns: int
+    # One of the queue's pooled buffers, in the session's layout.
+    image: np.ndarray
+
+
+class FrameQueue:
+    """
+    Bounded FIFO of frames between capture and encode, backed by a fixed
+    pool of buffers so nothing is allocated per frame.
+    """
+
+    def __init__(self, shape: T.Tuple[int, ...], capacity: int, policy: DropPolicy) -> None:
+        self.capacity = capacity
+        self.policy = policy
+        # Enough for a full queue, plus the frame being captured and the one
+        # being encoded, so capture never waits for a buffer unless blocking.
+        self._free = [np.empty(shape, dtype=np.uint8) for _ in range(capacity + 2)]
+        self._queued: T.Deque[QueuedFrame] = deque()
+        self._changed = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.high_water = 0
+
+    def acquire(self) -> T.Optional[np.ndarray]:
+        """
+        A free buffer to capture into, or None once closed.
+        """
+        with self._changed:
+            while not self._free and not self._closed:
+                self._changed.wait()
+            return self._free.pop() if not self._closed else None
+
+    def release(self, image: np.ndarray) -> None:
+        with self._changed:
+            self._free.append(image)
+            self._changed.notify_all()
+
+    def put(self, frame: QueuedFrame) -> None:
+        with self._changed:
+            if len(self._queued) >= self.capacity:
+                if self.policy == DropPolicy.DROP_OLDEST:
+                    self._free.append(self._queued.popleft().image)
+                    self.dropped += 1
+                elif self.policy == DropPolicy.DROP_NEWEST:
+                    self._free.append(frame.image)
+                    self.dropped += 1
+                    return
+                else:
+                    while len(self._queued) >= self.capacity and not self._closed:
+                        self._changed.wait()
+            self._queued.append(frame)
+            self.high_water = max(self.high_water, len(self._queued))
+            self._changed.notify_all()
+
+    def get(self) -> T.Optional[QueuedFrame]:
+        """
+        The oldest queued frame, or None once closed and drained. Release
+        its image when done with it.
+        """
+        with self._changed:
+            while not self._queued and not self._closed:
+                self._changed.wait()
+            if not self._queued:
+                return None
+            frame = self._queued.popleft()
+            self._changed.notify_all()
+            return frame
+
+    def close(self) -> None:
+        """
+        Stops capture from queueing more. The encoder still drains what's
+        queued.
+        """
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+
+class VideoRecorder:
+    """
+    Records every frame published to `ipc` through `encoder`, with capture
+    and encoding on their own threads. Call preview_frame() from the main
+    thread for something to show.
+    """
+
+    def __init__(
+        self,
+        ipc: DroneIPC,
+        encoder: Encoder,
+        path: T.Union[str, Path],
+        fps: float,
+        queue_length: int = DEFAULT_QUEUE_LENGTH,
+        policy: DropPolicy = DropPolicy.DROP_OLDEST,
+        preview: bool = True,
+    ) -> None:
+        self.ipc = ipc
+        self.encoder = encoder
+        self.path = Path(path)
+        self.fps = fps
+        layout = ipc.layout
+        self.width = layout.width
+        self.height = layout.height
+        self.queue = FrameQueue(layout.shape, queue_length, policy)
+
+        self.preview = preview
+        self._preview_image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._shown_image = np.empty_like(self._preview_image)
+        self._preview_frame_id = 0
+        self._preview_shown_id = 0
+        self._preview_lock = threading.Lock()
+
+        self.captured = 0
+        # Published while capture wasn't looking, e.g. while blocked.
+        self.missed = 0
+        self.encoded = 0
+        # Frames that reached the encoder with an id it had already written.
+        self.duplicates = 0
+        self.encode_time = LatencyHistogram("encode")
+        self._last_captured_id = 0
+        self._last_written_id = 0
+        self._started_at = 0.0
+        self._stop = threading.Event()
+        self._threads: T.List[threading.Thread] = []
+
+    def start(self) -> None:
+        self.encoder.open(self.path, self.width, self.height, self.fps)
+        # Only record what's published from now on.
+        self._last_captured_id = self.ipc.latest_frame_id
+        self._started_at = time.perf_counter()
+        for name, target in (("capture", self._capture_loop), ("encode", self._encode_loop)):
+            thread = threading.Thread(target=target, name=f"VideoRecorder-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self) -> None:
+        """
+        Stops capturing, finishes encoding what's queued, and closes the file.
+        """
+        self._stop.set()
+        capture, encode = self._threads or (None, None)
+        if capture is not None:
+            capture.join()
+        self.queue.close()
+        if encode is not None:
+            encode.join()
+        self._threads.clear()
+        self.encoder.close()
+
+    def __enter__(self) -> "VideoRecorder":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _capture_loop(self) -> None:
+        ipc = self.ipc
+        while not self._stop.is_set():
+            if not ipc.wait_for_frame(timeout=CAPTURE_POLL_S, after=self._last_captured_id):
+                continue
+            image = self.queue.acquire()
+            if image is None:
+                return
+            frame = ipc.read_frame(after=self._last_captured_id, into=image)
+            if frame is None:
+                self.queue.release(image)
+                continue
+            self.missed += frame.frame_id - self._last_captured_id - 1
+            self._last_captured_id = frame.frame_id
+            self.captured += 1
+            self.queue.put(QueuedFrame(frame.frame_id, frame.timestamp_ns, image))
+
+    def _encode_loop(self) -> None:
+        try:
+            self._encode_frames()
+        finally:
+            # If the encoder failed, don't leave capture blocked on a queue
+            # nobody drains.
+            self.queue.close()
+
+    def _encode_frames(self) -> None:
+        bgr = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            try:
+                if frame.frame_id <= self._last_written_id:
+                    self.duplicates += 1
+                    continue
+                started = time.perf_counter_ns()
+                image = self.ipc.to_bgr(frame.image, out=bgr)
+                self.encoder.write(image, frame.frame_id, frame.timestamp_ns)
+                self.encode_time.record(time.perf_counter_ns() - started)
+                self._last_written_id = frame.frame_id
+                self.encoded += 1
+                if self.preview:
+                    with self._preview_lock:
+                        np.copyto(self._preview_image, image)
+                        self._preview_frame_id = frame.frame_id
+            finally:
+                self.queue.release(frame.image)
+
+    def preview_frame(self) -> T.Optional[np.ndarray]:
+        """
+        The newest encoded frame, if there's one that hasn't been returned
+        yet. Valid until the next call.
+        """
+        with self._preview_lock:
+            if self._preview_frame_id == self._preview_shown_id:
+                return None
+            self._preview_shown_id = self._preview_frame_id
+            np.copyto(self._shown_image, self._preview_image)
+            return self._shown_image
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        return (
+            f"recorder: captured={self.captured} encoded={self.encoded} ({self.encoded / elapsed:.1f}fps) "
+            f"dropped={self.dropped} missed={self.missed} duplicates={self.duplicates} "
+            f"queue_high_water={self.queue.high_water}/{self.queue.capacity} "
+            f"{self.encode_time.summary()} mean={self.encode_time.mean_ns / 1e6:.2f}ms"
+        )
@@ -0,0 +1,367 @@
+"""
+Flight video as memory-mappable segment files, for seeking by capture time
+and reprocessing without decoding a whole video.
+
+A store is a directory of segments. Each segment is a pair of files:
+
+    <n>.frames  a header, then each frame's bytes, back to back
+    <n>.index   one INDEX_DTYPE record per frame: id, capture time, where
+                its bytes are in <n>.frames
+
+Raw frames come back from the reader as read-only views of the mapped
+file, so reading is bounded by the disk rather than by a decoder. JPEG
+frames take a fifth of the space but are decoded on read.
+
+    python run.py tello_control.video_reader --encoder store --output /tmp/flight
+    python run.py tello_control.video_store /tmp/flight --play --start 10 --end 20
+"""
+import argparse
+import struct
+import time
+import typing as T
+from enum import IntEnum
+from pathlib import Path
+import numpy as np
+import cv2
+from .binary_log import LogWriter, read_log
+from .video_recorder import Encoder
+
+SEGMENT_MAGIC = b"TVSG"
+SEGMENT_VERSION = 1
+# magic, version, codec, width, height, channels
+SEGMENT_HEADER = struct.Struct("<4sHHIII")
+SEGMENT_HEADER_LENGTH = 64
+# Log kind of index files, see binary_log.py.
+INDEX_KIND = 3
+
+INDEX_DTYPE = np.dtype([
+    ("frame_id", np.uint64),
+    ("timestamp_ns", np.int64),
+    ("offset", np.uint64),
+    ("length", np.uint32),
+    ("_pad", np.uint32),
+])
+
+# 1 GiB, or a minute of video, whichever comes first. Raw 960x720 BGR at
+# 30 fps is 62 MB/s, which fills a GiB in about 17 s, so raw segments
+# rotate on size. JPEG takes about a fifth of that, 90 s per GiB, so JPEG
+# segments rotate every minute.
+DEFAULT_SEGMENT_BYTES = 1 << 30
+DEFAULT_SEGMENT_S = 60.0
+DEFAULT_JPEG_QUALITY = 90
+
+
+class FrameCodec(IntEnum):
+    """
+    How frames are stored in a segment. Values are stored in segment
+    headers, so never renumber them.
+    """
+
+    RAW = 0
+    JPEG = 1
+
+
+def _segment_paths(directory: Path, number: int) -> T.Tuple[Path, Path]:
+    return directory / f"{number:06d}.frames", directory / f"{number:06d}.index"
+
+
+def _segment_numbers(directory: Path) -> T.List[int]:
+    return sorted(int(path.stem) for path in directory.glob("*.frames") if path.stem.isdigit())
+
+
+class StoreWriter:
+    """
+    Appends frames to a store, starting a new segment when the current one
+    would pass `max_segment_bytes` or spans `max_segment_s` of capture time.
+    """
+
+    def __init__(
+        self,
+        directory: T.Union[str, Path],
+        width: int,
+        height: int,
+        channels: int = 3,
+        codec: FrameCodec = FrameCodec.RAW,
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        max_segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        max_segment_s: float = DEFAULT_SEGMENT_S,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        self.codec = codec
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_ns = int(max_segment_s * 1e9)
+        existing = _segment_numbers(self.directory)
+        self._next_segment = existing[-1] + 1 if existing else 0
+        self._frames: T.Optional[T.BinaryIO] = None
+        self._index: T.Optional[LogWriter] = None
+        self._offset = 0
+        self._segment_start_ns = 0
+        self.segments_written = 0
+
+    def _open_segment(self, timestamp_ns: int) -> None:
+        self._close_segment()
+        frames_path, index_path = _segment_paths(self.directory, self._next_segment)
+        self._next_segment += 1
+        # The index first: readers take a segment once its frames header is
+        # complete, and expect its index to be there by then.
+        self._index = LogWriter(index_path, INDEX_KIND, INDEX_DTYPE)
+        # Unbuffered, so frame bytes are on disk before their index record.
+        self._frames = open(frames_path, "wb", buffering=0)
+        height, width = self.shape[:2]
+        channels = self.shape[2] if len(self.shape) == 3 else 1
+        header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, self.codec, width, height, channels)
+        self._frames.write(header.ljust(SEGMENT_HEADER_LENGTH, b"\0"))
+        self._offset = SEGMENT_HEADER_LENGTH
+        self._segment_start_ns = timestamp_ns
+        self.segments_written += 1
+
+    def _close_segment(self) -> None:
+        if self._frames is not None:
+            self._frames.close()
+            self._index.close()
+            self._frames = None
+            self._index = None
+
+    def append(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        if image.shape != self.shape:
+            raise ValueError(f"frame is {image.shape}, the store holds {self.shape}")
+        if self.codec == FrameCodec.JPEG:
+            ok, encoded = cv2.imencode(".jpg", image, self.jpeg_params)
+            if not ok:
+                raise RuntimeError("JPEG encoding failed")
+            data = memoryview(encoded).cast("B")
+        else:
+            data = memoryview(np.ascontiguousarray(image)).cast("B")
+
+        if (
+            self._frames is None
+            or self._offset + len(data) > self.max_segment_bytes
+            or timestamp_ns - self._segment_start_ns >= self.max_segment_ns
+        ):
+            self._open_segment(timestamp_ns)
+        self._frames.write(data)
+        record = self._index.record
+        record["frame_id"] = frame_id
+        record["timestamp_ns"] = timestamp_ns
+        record["offset"] = self._offset
+        record["length"] = len(data)
+        self._index.append()
+        # A frame is large next to its record, so flushing each one costs
+        # little, and readers see frames as soon as they're written.
+        self._index.flush()
+        self._offset += len(data)
+
+    def close(self) -> None:
+        self._close_segment()
+
+    def __enter__(self) -> "StoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class StoreEncoder(Encoder):
+    """
+    Lets VideoRecorder write to a store. The output path is the store's
+    directory.
+    """
+
+    extension = ""
+
+    def __init__(self, codec: FrameCodec = FrameCodec.RAW, **options) -> None:
+        self.codec = codec
+        self.options = options
+        self._writer: T.Optional[StoreWriter] = None
+
+    def open(self, path: Path, width: int, height: int, fps: float) -> None:
+        self._writer = StoreWriter(path, width, height, codec=self.codec, **self.options)
+
+    def write(self, image: np.ndarray, frame_id: int, timestamp_ns: int) -> None:
+        self._writer.append(image, frame_id, timestamp_ns)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class _Segment:
+    def __init__(self, frames_path: Path, index_path: Path) -> None:
+        self.frames_path = frames_path
+        self.index_path = index_path
+        with open(frames_path, "rb") as f:
+            magic, version, codec, width, height, channels = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"{frames_path} is not a version {SEGMENT_VERSION} segment")
+        self.codec = FrameCodec(codec)
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        self.index = np.zeros((0,), dtype=INDEX_DTYPE)
+        self.data = np.zeros((0,), dtype=np.uint8)
+
+    def refresh(self) -> None:
+        """
+        Picks up frames written since the last refresh.
+        """
+        self.index = read_log(self.index_path, INDEX_KIND, INDEX_DTYPE)
+        needed = int(self.index["offset"][-1] + self.index["length"][-1]) if len(self.index) else 0
+        if needed > len(self.data):
+            self.data = np.memmap(self.frames_path, dtype=np.uint8, mode="r")
+
+
+class StoreReader:
+    """
+    Random access to a store's frames, by position, frame id or capture
+    time. The store can still be being written; refresh() picks up new
+    frames.
+
+    Frames are numbered 0..len()-1 across all segments, in recording order.
+    """
+
+    def __init__(self, directory: T.Union[str, Path]) -> None:
+        self.directory = Path(directory)
+        self._segments: T.List[_Segment] = []
+        self.refresh()
+
+    def refresh(self) -> None:
+        known = len(self._segments)
+        for number in _segment_numbers(self.directory)[known:]:
+            frames_path, index_path = _segment_paths(self.directory, number)
+            if frames_path.stat().st_size < SEGMENT_HEADER_LENGTH:
+                # Still being started. Next time.
+                break
+            self._segments.append(_Segment(frames_path, index_path))
+        # Only the last segment (and any new ones) can have grown.
+        for segment in self._segments[max(known - 1, 0):]:
+            segment.refresh()
+        counts = [len(segment.index) for segment in self._segments]
+        # Position of each segment's first frame.
+        self._starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        if self._segments:
+            self.frame_ids = np.concatenate([segment.index["frame_id"] for segment in self._segments])
+            self.timestamps_ns = np.concatenate([segment.index["timestamp_ns"] for segment in self._segments])
+        else:
+            self.frame_ids = np.zeros((0,), dtype=np.uint64)
+            self.timestamps_ns = np.zeros((0,), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.frame_ids)
+
+    @property
+    def n_segments(self) -> int:
+        return len(self._segments)
+
+    def _locate(self, position: int) -> T.Tuple[_Segment, int]:
+        if not 0 <= position < len(self):
+            raise IndexError(f"frame {position} out of range, the store has {len(self)}")
+        segment_number = int(np.searchsorted(self._starts, position, side="right")) - 1
+        return self._segments[segment_number], position - int(self._starts[segment_number])
+
+    def image(self, position: int) -> np.ndarray:
+        """
+        The frame at `position`. Raw frames are read-only views of the mapped
+        file, so copy them to keep them past close().
+        """
+        segment, i = self._locate(position)
+        offset = int(segment.index["offset"][i])
+        data = segment.data[offset: offset + int(segment.index["length"][i])]
+        if segment.codec == FrameCodec.JPEG:
+            return cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+        return data.reshape(segment.shape)
+
+    def position_of(self, frame_id: int) -> T.Optional[int]:
+        """
+        Position of the frame with id `frame_id`, if it was recorded. Ids
+        only increase within one recording, so look them up in a store
+        holding a single one.
+        """
+        position = int(np.searchsorted(self.frame_ids, frame_id))
+        if position < len(self) and int(self.frame_ids[position]) == frame_id:
+            return position
+        return None
+
+    def position_at(self, timestamp_ns: int) -> T.Optional[int]:
+        """
+        Position of the last frame captured at or before `timestamp_ns`.
+        """
+        position = int(np.searchsorted(self.timestamps_ns, timestamp_ns, side="right")) - 1
+        return position if position >= 0 else None
+
+    def between(self, start_ns: int, end_ns: int) -> T.Iterator[T.Tuple[np.ndarray, np.ndarray]]:
+        """
+        Frames captured in [start_ns, end_ns), as (index records, images)
+        per segment. For raw segments, images is a single (n, height, width,
+        ...) view of the mapped file, so the whole range is read without
+        copying.
+        """
+        first = int(np.searchsorted(self.timestamps_ns, start_ns, side="left"))
+        end = int(np.searchsorted(self.timestamps_ns, end_ns, side="left"))
+        while first < end:
+            segment, i = self._locate(first)
+            n = min(end - first, len(segment.index) - i)
+            index = segment.index[i: i + n]
+            if segment.codec == FrameCodec.JPEG:
+                images = np.stack([self.image(position) for position in range(first, first + n)])
+            else:
+                # Raw frames in a segment are all the same size, back to back.
+                frame_length = int(np.prod(segment.shape))
+                offset = int(index["offset"][0])
+                images = segment.data[offset: offset + n * frame_length].reshape((n, *segment.shape))
+            yield index, images
+            first += n
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.index = np.zeros((0,), dtype=INDEX_DTYPE)
+            segment.data = np.zeros((0,), dtype=np.uint8)
+        self._segments.clear()
+
+    def __enter__(self) -> "StoreReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarizes, times or plays back a recorded video store.")
+    parser.add_argument("directory")
+    parser.add_argument("--start", type=float, default=0.0, help="seconds after the first frame")
+    parser.add_argument("--end", type=float, default=float("inf"), help="seconds after the first frame")
+    parser.add_argument("--play", action="store_true", help="show the frames at their recorded pace")
+    args = parser.parse_args()
+
+    with StoreReader(args.directory) as reader:
+        if len(reader) == 0:
+            print(f"{args.directory}: no frames")
+            return
+        first_ns = int(reader.timestamps_ns[0])
+        duration_s = (int(reader.timestamps_ns[-1]) - first_ns) / 1e9
+        print(f"{args.directory}: {len(reader)} frames in {reader.n_segments} segments, {duration_s:.1f}s")
+
+        start_ns = first_ns + int(args.start * 1e9)
+        end_ns = first_ns + int(min(args.end, duration_s + 1) * 1e9)
+        started = time.perf_counter()
+        n_frames = 0
+        n_bytes = 0
+        for index, images in reader.between(start_ns, end_ns):
+            if args.play:
+                for record, image in zip(index, images):
+                    delay_s = (int(record["timestamp_ns"]) - start_ns) / 1e9 - (time.perf_counter() - started)
+                    cv2.imshow("store", image)
+                    if cv2.waitKey(max(int(delay_s * 1000), 1)) & 0xFF == ord('q'):
+                        return
+            else:
+                # Touch every byte, like a batch job would.
+                images.sum(dtype=np.uint64)
+            n_frames += len(index)
+            n_bytes += images.nbytes
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"read {n_frames} frames in {elapsed:.2f}s ({n_frames / elapsed:.0f} frames/s, {n_bytes / elapsed / 1e6:.0f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,24 @@
-import time
-from .autonomous import DroneIPC, DroneState, CAMERA_W, CAMERA_H
+from .autonomous import DroneIPC, DroneState
+from .scheduler import LoopScheduler
 import cv2
 
 def main():
     frames_per_second = 30
     show_frame = False
 
-    ms_per_iteration = 1000.0 / frames_per_second
+    scheduler = LoopScheduler(frames_per_second, name="capture")
     cap = cv2.VideoCapture(0)
     with DroneIPC() as ipc:
         while True:
-            start_ts = time.perf_counter()
             _, frame = cap.read()
-            frame = cv2.resize(frame, (CAMERA_W, CAMERA_H))
             if show_frame:
               cv2.imshow('writer', frame)
               if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
+            # Resized/converted to the session's layout on the way in.
             ipc.save_frame(frame)
-            end_ts = time.perf_counter()
-            elapsed_ms = end_ts - start_ts
-            wait_ms = max(0, ms_per_iteration - elapsed_ms)
-            time.sleep(wait_ms / 1000.0)
+            scheduler.wait()
+    print(scheduler.summary())
     cap.release()
     cv2.destroyAllWindows()
 
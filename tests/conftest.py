@@ -0,0 +1,44 @@
+import os
+import threading
+import uuid
+import pytest
+
+
+@pytest.fixture
+def session() -> str:
+    """
+    A DroneIPC session name no other test (or running controller) uses.
+    """
+    return f"test-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def fake_tello():
+    """
+    A FakeTello serving on a free local port.
+    """
+    from tello_control.fake_tello import FakeTello
+
+    fake = FakeTello(port=0, state_hz=50)
+    thread = threading.Thread(target=fake.serve_forever, daemon=True)
+    thread.start()
+    yield fake
+    fake.close()
+    thread.join()
+    fake.socket.close()
+
+
+@pytest.fixture
+def tello(fake_tello):
+    """
+    A djitellopy Tello talking to `fake_tello`.
+    """
+    from djitellopy import Tello
+
+    tello = Tello(host="127.0.0.1")
+    tello.address = ("127.0.0.1", fake_tello.socket.getsockname()[1])
+    yield tello
+    # Otherwise Tello.__del__ tries to land and stop the stream, long after
+    # the fake is gone, retrying for half a minute.
+    tello.is_flying = False
+    tello.stream_on = False
@@ -0,0 +1,330 @@
+import multiprocessing
+import sys
+import threading
+import time
+import numpy as np
+import pytest
+from tello_control.autonomous import (
+    ACK_DROPPED,
+    ACK_FAILED,
+    ACK_OK,
+    ACK_UNKNOWN,
+    COMMAND_RING_LENGTH,
+    LAND,
+    RC_OFFSET,
+    RC_STRUCT,
+    TAKEOFF,
+    DroneIPC,
+    DroneState,
+    FrameOverwrittenError,
+)
+from tello_control.frame_layout import (
+    FrameLayout,
+    Lane,
+    PixelFormat,
+    lanes_from_mask,
+    lanes_to_mask,
+    parse_lanes,
+)
+from tello_control.ipc_notify import FRAME_EVENT, STATE_EVENT, SUBSCRIBER_EVENTS
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="subscriber table is Linux only")
+
+LAYOUT = FrameLayout(32, 24)
+N_SUBSCRIBERS = 8
+
+
+def _claim_and_wait(session: str, barrier, rows, woken) -> None:
+    with DroneIPC(session) as ipc:
+        barrier.wait()
+        ipc._notifier.subscribe(FRAME_EVENT)
+        rows.put(ipc._notifier._row)
+        woken.put(ipc.wait_for_frame(timeout=10, after=0))
+
+
+def test_concurrent_subscribers_get_their_own_rows(session):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(N_SUBSCRIBERS)
+    rows = context.Queue()
+    woken = context.Queue()
+    with DroneIPC(session, layout=LAYOUT) as ipc:
+        processes = [
+            context.Process(target=_claim_and_wait, args=(session, barrier, rows, woken))
+            for _ in range(N_SUBSCRIBERS)
+        ]
+        for process in processes:
+            process.start()
+        claimed = [rows.get(timeout=30) for _ in processes]
+        assert None not in claimed
+        assert len(set(claimed)) == N_SUBSCRIBERS
+
+        # Every one of them is woken, none left waiting on a shared row.
+        ipc.save_frame(np.zeros(LAYOUT.shape, dtype=np.uint8))
+        assert [woken.get(timeout=30) for _ in processes] == [True] * N_SUBSCRIBERS
+        for process in processes:
+            process.join(timeout=30)
+            assert process.exitcode == 0
+
+
+def _attach_repeatedly(session: str, barrier, seen) -> None:
+    barrier.wait()
+    frame_ids = set()
+    for _ in range(50):
+        with DroneIPC(session) as ipc:
+            frame_ids.add(ipc.latest_frame_id)
+    seen.put(sorted(frame_ids))
+
+
+def test_attaching_never_resets_a_live_session(session):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(N_SUBSCRIBERS)
+    seen = context.Queue()
+    with DroneIPC(session, layout=LAYOUT) as ipc:
+        ipc.save_frame(np.full(LAYOUT.shape, 7, dtype=np.uint8))
+        processes = [
+            context.Process(target=_attach_repeatedly, args=(session, barrier, seen))
+            for _ in range(N_SUBSCRIBERS)
+        ]
+        for process in processes:
+            process.start()
+        assert [seen.get(timeout=60) for _ in processes] == [[1]] * N_SUBSCRIBERS
+        for process in processes:
+            process.join(timeout=30)
+        assert ipc.latest_frame_id == 1
+        assert (ipc.get_frame() == 7).all()
+        path, lock_path = ipc.path, ipc.lock_path
+    # The last one out cleans up.
+    assert not path.exists() and not lock_path.exists()
+
+
+def test_wait_for_frame_is_woken_by_another_handle(session):
+    with DroneIPC(session, layout=LAYOUT) as producer, DroneIPC(session) as consumer:
+        timer = threading.Timer(0.1, producer.save_frame, (np.zeros(LAYOUT.shape, dtype=np.uint8),))
+        timer.start()
+        started = time.monotonic()
+        assert consumer.wait_for_frame(timeout=5)
+        assert time.monotonic() - started < 2
+        timer.join()
+        assert not consumer.wait_for_frame(timeout=0.05, after=producer.latest_frame_id)
+
+
+def test_each_wait_subscribes_to_its_own_event(session):
+    with DroneIPC(session, layout=LAYOUT) as ipc:
+        assert not ipc.wait_for_frame(timeout=0.01)
+        assert not ipc.wait_for_state(timeout=0.01)
+        notifier = ipc._notifier
+        # Frames no longer wake a handle that now waits for state.
+        assert notifier._table[notifier._row, SUBSCRIBER_EVENTS] == STATE_EVENT
+
+
+def _publish_uniform_frames(ipc: DroneIPC, stop: threading.Event) -> None:
+    frame = np.empty(LAYOUT.shape, dtype=np.uint8)
+    while not stop.is_set():
+        # Every pixel of frame n is n % 256, so a torn read shows up as a
+        # frame that isn't uniform.
+        frame.fill((ipc.latest_frame_id + 1) % 256)
+        ipc.save_frame(frame)
+
+
+def test_frame_reads_are_never_torn(session):
+    with DroneIPC(session, layout=LAYOUT) as producer, DroneIPC(session) as consumer:
+        stop = threading.Event()
+        writer = threading.Thread(target=_publish_uniform_frames, args=(producer, stop))
+        writer.start()
+        try:
+            reads = 0
+            deadline = time.monotonic() + 1.0
+            while time.monotonic() < deadline:
+                frame = consumer.read_frame(after=0)
+                if frame is not None:
+                    reads += 1
+                    assert (frame.image == frame.frame_id % 256).all()
+                try:
+                    with consumer.borrow_frame() as image:
+                        frame_id = consumer.last_frame_id
+                        copy = None if image is None else image.copy()
+                except FrameOverwrittenError:
+                    continue
+                if copy is not None:
+                    assert (copy == frame_id % 256).all()
+        finally:
+            stop.set()
+            writer.join()
+        assert reads > 0
+
+
+def test_get_state_never_returns_a_torn_write(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        script.save_state(DroneState(left_right_vel=10, up_down_vel=20, fwd_back_vel=30, yaw_vel=40))
+        state = controller.get_state()
+        assert (state.left_right_vel, state.yaw_vel) == (10, 40)
+        # A script stuck halfway through a write: odd sequence, new values.
+        sequence = RC_STRUCT.unpack_from(script._shmem, RC_OFFSET)[0]
+        RC_STRUCT.pack_into(script._shmem, RC_OFFSET, sequence + 1, time.monotonic_ns(), -50, -50, 0, 0)
+        state = controller.get_state()
+        assert (state.left_right_vel, state.up_down_vel, state.fwd_back_vel, state.yaw_vel) == (10, 20, 30, 40)
+
+
+def test_commands_are_delivered_once_in_order(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        takeoff = script.send_command(TAKEOFF)
+        land = script.send_command(LAND)
+        assert script.get_state().takeoff and script.get_state().land
+        commands = controller.poll_commands()
+        assert [(c.sequence, c.flags) for c in commands] == [(takeoff, TAKEOFF), (land, LAND)]
+        assert controller.poll_commands() == []
+
+
+def test_each_command_gets_its_own_ack(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        takeoff = script.send_command(TAKEOFF)
+        land = script.send_command(LAND)
+        first, second = controller.poll_commands()
+        # Acked out of order, with different outcomes.
+        controller.ack_command(second, ok=True)
+        assert script.wait_for_ack(takeoff, timeout=0.05) is None
+        assert script.get_state().takeoff and not script.get_state().land
+        controller.ack_command(first, ok=False)
+        assert script.wait_for_ack(takeoff, timeout=1) == ACK_FAILED
+        assert script.wait_for_ack(land, timeout=1) == ACK_OK
+        assert not script.get_state().takeoff
+
+
+def test_wait_for_ack_is_woken_by_the_controller(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        sequence = script.send_command(TAKEOFF)
+
+        def serve() -> None:
+            assert controller.wait_for_state(timeout=5)
+            for command in controller.poll_commands():
+                controller.ack_command(command)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        assert script.wait_for_ack(sequence, timeout=5) == ACK_OK
+        thread.join()
+
+
+def test_mailbox_overflow_acks_dropped_commands(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        n = COMMAND_RING_LENGTH + 3
+        sequences = [script.send_command(TAKEOFF) for _ in range(n)]
+        commands = controller.poll_commands()
+        assert [c.sequence for c in commands] == sequences[-COMMAND_RING_LENGTH:]
+        for sequence in sequences[:-COMMAND_RING_LENGTH]:
+            assert script.wait_for_ack(sequence, timeout=1) == ACK_DROPPED
+        for command in commands:
+            controller.ack_command(command)
+        for sequence in sequences[-COMMAND_RING_LENGTH:]:
+            assert script.wait_for_ack(sequence, timeout=1) == ACK_OK
+
+
+def test_overwritten_ack_is_unknown(session):
+    with DroneIPC(session, layout=LAYOUT) as controller, DroneIPC(session) as script:
+        first = script.send_command(TAKEOFF)
+        controller.ack_command(controller.poll_commands()[0])
+        for _ in range(COMMAND_RING_LENGTH):
+            script.send_command(LAND)
+            for command in controller.poll_commands():
+                controller.ack_command(command)
+        assert script.wait_for_ack(first, timeout=1) == ACK_UNKNOWN
+
+
+def test_parses_layouts():
+    assert FrameLayout.parse("480x360:nv12") == FrameLayout(480, 360, PixelFormat.NV12)
+    assert FrameLayout.parse("64X48") == FrameLayout(64, 48, PixelFormat.BGR24)
+    assert FrameLayout.parse("64x48:Gray8").shape == (48, 64)
+
+
+@pytest.mark.parametrize("pixel_format", [PixelFormat.NV12, PixelFormat.I420])
+def test_rejects_odd_yuv_sizes(pixel_format):
+    with pytest.raises(ValueError):
+        FrameLayout(31, 24, pixel_format)
+    with pytest.raises(ValueError):
+        FrameLayout(32, 23, pixel_format)
+    assert FrameLayout(32, 24, pixel_format).nbytes == 32 * 24 * 3 // 2
+    assert FrameLayout(31, 23).nbytes == 31 * 23 * 3
+
+
+def test_rejects_empty_sizes():
+    with pytest.raises(ValueError):
+        FrameLayout(0, 24)
+
+
+@pytest.mark.parametrize("pixel_format", [PixelFormat.NV12, PixelFormat.I420])
+def test_yuv_round_trips(pixel_format):
+    layout = FrameLayout(32, 24, pixel_format)
+    # Flat 8x8 blocks, so chroma subsampling loses nothing.
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(16, 240, size=(3, 4, 3), dtype=np.uint8)
+    bgr = np.repeat(np.repeat(blocks, 8, axis=0), 8, axis=1)
+    frame = np.empty(layout.shape, dtype=np.uint8)
+    layout.from_bgr(bgr, frame)
+    back = layout.to_bgr(frame)
+    assert back.shape == bgr.shape
+    assert np.abs(back.astype(np.int16) - bgr).max() <= 3
+
+
+def test_nv12_and_i420_agree():
+    bgr = np.random.default_rng(1).integers(0, 256, size=(24, 32, 3), dtype=np.uint8)
+    images = []
+    for pixel_format in (PixelFormat.NV12, PixelFormat.I420):
+        layout = FrameLayout(32, 24, pixel_format)
+        frame = np.empty(layout.shape, dtype=np.uint8)
+        layout.from_bgr(bgr, frame)
+        images.append(layout.to_bgr(frame))
+    assert (images[0] == images[1]).all()
+
+
+def test_converts_frames_of_other_sizes_on_the_way_in(session):
+    layout = FrameLayout(32, 24, PixelFormat.NV12)
+    with DroneIPC(session, layout=layout) as ipc:
+        ipc.save_frame(np.full((240, 320, 3), (40, 120, 200), dtype=np.uint8))
+        frame = ipc.read_frame()
+        assert frame.image.shape == layout.shape
+        assert np.abs(ipc.to_bgr(frame.image).astype(np.int16) - (40, 120, 200)).max() <= 3
+
+
+def test_attaching_with_another_layout_is_refused(session):
+    with DroneIPC(session, layout=LAYOUT) as ipc:
+        with DroneIPC(session) as other:
+            assert other.layout == ipc.layout
+        with pytest.raises(ValueError):
+            with DroneIPC(session, layout=FrameLayout(64, 48)):
+                pass
+
+
+def test_lane_masks_round_trip():
+    assert parse_lanes(" gray, Half ") == (Lane.HALF, Lane.GRAY)
+    assert parse_lanes("") == ()
+    for mask in range(8):
+        assert lanes_to_mask(lanes_from_mask(mask)) == mask
+
+
+def test_publishes_lanes_with_each_frame(session):
+    layout = FrameLayout(96, 72)
+    color = (40, 120, 200)
+    with DroneIPC(session, layout=layout, lanes=[Lane.GRAY, Lane.HALF]) as producer, DroneIPC(session) as consumer:
+        # Whoever attaches later gets the lanes from the header.
+        assert producer.lanes == consumer.lanes == (Lane.HALF, Lane.GRAY)
+        assert consumer.lane_layout(Lane.HALF) == FrameLayout(48, 36, PixelFormat.BGR24)
+        assert consumer.lane_layout(Lane.GRAY) == FrameLayout(32, 24, PixelFormat.GRAY8)
+        with pytest.raises(ValueError):
+            consumer.lane_layout(Lane.QUARTER)
+
+        producer.save_frame(np.full(layout.shape, color, dtype=np.uint8))
+        half = consumer.read_frame(after=0, lane=Lane.HALF)
+        assert half.image.shape == (36, 48, 3)
+        assert (half.image == color).all()
+        gray = consumer.read_frame(after=0, lane=Lane.GRAY)
+        assert gray.image.shape == (24, 32)
+        assert np.abs(gray.image.astype(np.int16) - 0.114 * 40 - 0.587 * 120 - 0.299 * 200).max() <= 1
+
+
+def test_attaching_with_other_lanes_is_refused(session):
+    with DroneIPC(session, layout=LAYOUT, lanes=[Lane.HALF]):
+        with pytest.raises(ValueError):
+            with DroneIPC(session, lanes=[Lane.GRAY]):
+                pass
+        with DroneIPC(session, lanes=[Lane.HALF]) as other:
+            assert other.lanes == (Lane.HALF,)
@@ -0,0 +1,119 @@
+import pygame
+import pytest
+from tello_control.controller_state import (
+    KEYBOARD_BUTTONS,
+    MAC_SHIELD_CONTROLLER,
+    STEAM_DECK_INTEGRATED_CONTROLLER,
+    WINDOWS_SHIELD_CONTROLLER,
+    Axis1D,
+    AxisBinding,
+    BindingTable,
+    Button,
+    Hat,
+    Input,
+)
+
+
+def _events(instance_id: int = 0):
+    events = []
+    for axis in range(8):
+        for value in (-1.0, -0.5, -0.05, 0.0, 0.08, 0.3, 1.0):
+            events.append(pygame.event.Event(pygame.JOYAXISMOTION, axis=axis, value=value, instance_id=instance_id))
+    for button in range(18):
+        events.append(pygame.event.Event(pygame.JOYBUTTONDOWN, button=button, instance_id=instance_id))
+        events.append(pygame.event.Event(pygame.JOYBUTTONUP, button=button, instance_id=instance_id))
+    for value in ((0, 1), (-1, 0), (0, 0)):
+        events.append(pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=value, instance_id=instance_id))
+    for binding in KEYBOARD_BUTTONS:
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=binding.key))
+        events.append(pygame.event.Event(pygame.KEYUP, key=binding.key))
+    events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=(1, 2)))
+    return events
+
+
+def _snapshot(controller: Input):
+    return (
+        {axis: controller[axis] for axis in Axis1D},
+        {button: (controller[button], controller.get_down(button), controller.get_up(button)) for button in Button},
+        {hat: controller[hat] for hat in Hat},
+    )
+
+
+@pytest.mark.parametrize("profile", [WINDOWS_SHIELD_CONTROLLER, MAC_SHIELD_CONTROLLER, STEAM_DECK_INTEGRATED_CONTROLLER])
+def test_table_matches_asking_every_binding(profile):
+    bindings = profile + KEYBOARD_BUTTONS
+    table = BindingTable(bindings)
+    by_table, by_binding = Input(), Input()
+    # Compared after every event, so edges and intermediate values count.
+    for event in _events():
+        table.process_event(event, by_table)
+        for binding in bindings:
+            binding.process_event(event, by_binding)
+        assert _snapshot(by_table) == _snapshot(by_binding)
+        by_table._tick()
+        by_binding._tick()
+
+
+def test_axis_deadzone_scale_and_offset():
+    stick = AxisBinding(axis=Axis1D.L_THUMBSTICK_Y, axis_id=1, multiply=-1)
+    trigger = AxisBinding(axis=Axis1D.L_TRIGGER, axis_id=2, multiply=0.5, offset=0.5)
+    table = BindingTable([stick, trigger])
+    controller = Input()
+
+    def move(axis_id: int, value: float) -> None:
+        table.process_event(pygame.event.Event(pygame.JOYAXISMOTION, axis=axis_id, value=value), controller)
+
+    move(1, 0.05)
+    assert controller[Axis1D.L_THUMBSTICK_Y] == 0.0
+    move(1, 0.55)
+    assert controller[Axis1D.L_THUMBSTICK_Y] == pytest.approx(-0.5)
+    move(1, -1.0)
+    assert controller[Axis1D.L_THUMBSTICK_Y] == pytest.approx(1.0)
+    move(2, -1.0)
+    assert controller[Axis1D.L_TRIGGER] == pytest.approx(0.0)
+    move(2, 1.0)
+    assert controller[Axis1D.L_TRIGGER] == pytest.approx(1.0)
+
+
+def test_button_edges_last_one_frame():
+    table = BindingTable(STEAM_DECK_INTEGRATED_CONTROLLER)
+    controller = Input()
+    table.process_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=0), controller)
+    assert controller[Button.A] and controller.get_down(Button.A)
+    controller._tick()
+    assert controller[Button.A] and not controller.get_down(Button.A)
+    table.process_event(pygame.event.Event(pygame.JOYBUTTONUP, button=0), controller)
+    assert controller.get_up(Button.A)
+    controller._tick()
+    assert not controller.get_up(Button.A)
+
+
+def test_table_ignores_other_joysticks():
+    table = BindingTable(STEAM_DECK_INTEGRATED_CONTROLLER, instance_id=1)
+    controller = Input()
+    table.process_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, instance_id=2), controller)
+    assert not controller[Button.A]
+    table.process_event(pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, instance_id=1), controller)
+    assert controller[Button.A]
+    # Keys don't come from a joystick, so they aren't filtered.
+    table = BindingTable(KEYBOARD_BUTTONS, instance_id=1)
+    controller = Input()
+    table.process_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_t), controller)
+    assert controller[Button.A]
+
+
+def test_taps_shorter_than_a_frame_are_kept():
+    table = BindingTable(KEYBOARD_BUTTONS)
+    controller = Input()
+    table.process_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_t), controller)
+    table.process_event(pygame.event.Event(pygame.KEYUP, key=pygame.K_t), controller)
+    assert not controller[Button.A]
+    assert controller.get_down(Button.A) and controller.get_up(Button.A)
+    controller._tick()
+    assert not controller.get_down(Button.A) and not controller.get_up(Button.A)
+
+
+def test_releasing_an_unpressed_button_is_not_an_edge():
+    controller = Input()
+    controller[Button.B] = False
+    assert not controller.get_up(Button.B) and not controller.get_down(Button.B)
@@ -0,0 +1,85 @@
+import time
+import typing as T
+from tello_control.command_executor import CommandExecutor
+from tello_control.controller import emergency_stop
+from tello_control.state_tap import StateTap
+from tello_control.tello_protocol import discard_responses
+
+
+def _wait_until(predicate: T.Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_flies_through_djitellopy(fake_tello, tello):
+    tello.connect()
+    assert tello.get_battery() > 0
+
+    tello.takeoff()
+    assert fake_tello.flying
+    assert _wait_until(lambda: tello.get_height() == 80)
+    assert tello.send_command_with_return("height?") == "8dm"
+
+    tello.send_rc_control(10, 20, 30, 40)
+    assert _wait_until(lambda: fake_tello.rc == (10, 20, 30, 40))
+
+    tello.land()
+    assert not fake_tello.flying
+    assert _wait_until(lambda: tello.get_height() == 0)
+    assert fake_tello.commands["takeoff"] == 1
+    assert fake_tello.commands["land"] == 1
+
+
+def test_answers_with_latency(fake_tello, tello):
+    fake_tello.latency_s = 0.1
+    started = time.monotonic()
+    assert tello.send_command_with_return("command") == "ok"
+    assert time.monotonic() - started >= 0.1
+
+
+def test_commands_after_an_emergency_get_their_own_replies(fake_tello, tello):
+    tello.connect()
+    emergency_stop(tello)
+    assert fake_tello.commands["emergency"] == 1
+    # The drone's "ok" to the emergency comes in with nobody waiting for it.
+    assert _wait_until(lambda: len(tello.get_own_udp_object()["responses"]) == 1)
+
+    executor = CommandExecutor(before_job=lambda: discard_responses(tello))
+    replies = []
+    try:
+        for query in ("battery?", "height?"):
+            executor.submit(query, lambda query=query: replies.append(tello.send_command_with_return(query)), 5)
+        assert _wait_until(lambda: not executor.busy())
+    finally:
+        executor.close()
+    assert replies == [str(fake_tello.battery), "0dm"]
+
+
+def test_state_tap_sees_every_packet(fake_tello, tello):
+    tello.connect()
+    states = []
+    with StateTap(tello, states.append) as tap:
+        assert _wait_until(lambda: len(states) >= 20)
+    seen = len(states)
+    assert tap.packets == seen and tap.errors == 0
+    assert all("bat" in state for state in states)
+    # Nothing after the tap is closed, and djitellopy keeps receiving.
+    time.sleep(0.1)
+    assert len(states) == seen
+    assert tello.get_current_state()
+
+
+def test_state_tap_survives_a_failing_callback(fake_tello, tello):
+    tello.connect()
+
+    def fail(state) -> None:
+        raise ValueError("boom")
+
+    with StateTap(tello, fail) as tap:
+        assert _wait_until(lambda: tap.errors >= 3)
+    before = tello.get_current_state()
+    assert _wait_until(lambda: tello.get_current_state() is not before)
@@ -0,0 +1,67 @@
+import socket
+import time
+import pytest
+from tello_control.h264_tee import H264Tee, read_index, replay
+
+av = pytest.importorskip("av")
+
+from tello_control.fake_tello import _make_encoder, _test_pattern  # noqa: E402
+from tello_control.video_decoder import VideoDecoder  # noqa: E402
+
+RESOLUTION = (160, 120)
+FPS = 30
+N_FRAMES = 30
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _encode_clip(path) -> bytes:
+    encoder = _make_encoder(av, RESOLUTION, FPS, 1)
+    data = bytearray()
+    for frame_index in range(N_FRAMES):
+        frame = av.VideoFrame.from_ndarray(_test_pattern(*RESOLUTION, frame_index), format="bgr24")
+        frame.pts = frame_index
+        for packet in encoder.encode(frame):
+            data += bytes(packet)
+    for packet in encoder.encode(None):
+        data += bytes(packet)
+    path.write_bytes(data)
+    return bytes(data)
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_records_and_replays_the_stream_unchanged(tmp_path):
+    clip = _encode_clip(tmp_path / "clip.h264")
+    tee_port, decoder_port = _free_port(), _free_port()
+    recording = tmp_path / "flight"
+
+    with VideoDecoder(port=decoder_port, host="127.0.0.1") as decoder:
+        with H264Tee(recording, port=tee_port, forward_port=decoder_port, host="127.0.0.1") as tee:
+            sent = replay(tmp_path / "clip.h264", port=tee_port, fps=FPS * 10)
+            assert _wait_for(lambda: tee.packets == sent)
+        assert _wait_for(lambda: decoder.frames_published > 0)
+
+    # Passed through byte for byte, with one index record per packet.
+    assert (tmp_path / "flight.h264").read_bytes() == clip
+    index = read_index(recording)
+    assert len(index) == sent
+    assert int(index["length"].sum()) == len(clip)
+
+    # The recording replays (at its recorded pace) into a decoder.
+    with VideoDecoder(port=decoder_port, host="127.0.0.1") as decoder:
+        assert replay(recording, port=decoder_port, speed=4.0) == sent
+        frame = decoder.wait_for_frame(after=0, timeout=5)
+        assert frame is not None
+        assert frame.image.shape == (RESOLUTION[1], RESOLUTION[0], 3)
@@ -0,0 +1,95 @@
+import pygame
+import pytest
+from tello_control import input_log
+from tello_control.controller_state import (
+    KEYBOARD_BUTTONS,
+    STEAM_DECK_INTEGRATED_CONTROLLER,
+    Axis1D,
+    BindingTable,
+    Button,
+    Input,
+)
+from tello_control.input_log import InputRecorder, InputReplayer
+
+BINDINGS = STEAM_DECK_INTEGRATED_CONTROLLER + KEYBOARD_BUTTONS
+
+# Events per frame, as the controller's loop would see them.
+SESSION = [
+    [pygame.event.Event(pygame.JOYAXISMOTION, axis=1, value=-0.75, instance_id=0)],
+    [pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, instance_id=0)],
+    [],
+    [
+        pygame.event.Event(pygame.JOYBUTTONUP, button=0, instance_id=0),
+        pygame.event.Event(pygame.JOYHATMOTION, hat=0, value=(1, 0), instance_id=0),
+    ],
+    # A key tapped within one frame.
+    [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_l), pygame.event.Event(pygame.KEYUP, key=pygame.K_l)],
+    [pygame.event.Event(pygame.MOUSEMOTION, pos=(3, 4))],
+]
+
+
+def _edges(controller: Input):
+    return (
+        controller.get_down(Button.A), controller.get_up(Button.A),
+        controller.get_down(Button.B), controller.get_up(Button.B),
+    )
+
+
+def _record(path, session=SESSION, append: bool = False):
+    table = BindingTable(BINDINGS)
+    controller = Input()
+    seen = []
+    with InputRecorder(path, append=append) as recorder:
+        for events in session:
+            controller._tick()
+            for event in events:
+                recorder.record_event(event)
+                table.process_event(event, controller)
+            recorder.record_input(controller)
+            seen.append(_edges(controller))
+    return seen
+
+
+def test_replays_what_was_recorded(tmp_path):
+    path = tmp_path / "session"
+    seen = _record(path)
+    # Only events bindings react to are kept.
+    assert len(InputReplayer(path, BINDINGS).events) == sum(len(events) for events in SESSION) - 1
+
+    replayer = InputReplayer(path, BINDINGS)
+    controller = Input()
+    replayed = [_edges(frame) for frame in replayer.frames(controller, realtime=False)]
+    assert replayed == seen
+    assert replayer.mismatches == 0
+    assert controller[Button.A] is False
+    # -0.75 through the dead zone, then inverted.
+    assert controller[Axis1D.L_THUMBSTICK_Y] == pytest.approx(0.65 / 0.9)
+
+
+def test_recording_replaces_unless_appending(tmp_path):
+    path = tmp_path / "session"
+    _record(path)
+    _record(path)
+    assert len(InputReplayer(path, BINDINGS).inputs) == len(SESSION)
+    _record(path, append=True)
+    assert len(InputReplayer(path, BINDINGS).inputs) == 2 * len(SESSION)
+
+
+def test_refuses_timestamps_that_go_backwards(tmp_path, monkeypatch):
+    path = tmp_path / "session"
+    _record(path)
+    # As if appended after a reboot, when the monotonic clock started over.
+    monkeypatch.setattr(input_log.time, "monotonic_ns", lambda: 1)
+    _record(path, append=True)
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        InputReplayer(path, BINDINGS)
+
+
+def test_refuses_other_logs(tmp_path):
+    path = tmp_path / "session"
+    _record(path)
+    (tmp_path / "session.events").rename(tmp_path / "session.inputs")
+    (tmp_path / "session.events").write_bytes((tmp_path / "session.inputs").read_bytes())
+    with pytest.raises(ValueError):
+        InputReplayer(path, BINDINGS)
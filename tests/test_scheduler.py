@@ -0,0 +1,102 @@
+import pytest
+from tello_control import scheduler
+from tello_control.scheduler import MAX_CATCH_UP_TICKS, LoopScheduler, OverrunPolicy
+
+RATE_HZ = 50
+PERIOD_S = 1.0 / RATE_HZ
+
+
+class FakeClock:
+    """
+    Stands in for the time module: sleep() moves the clock forward exactly.
+    """
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.slept = 0
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += 1
+        self.now += seconds
+
+    def work(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def test_ticks_stay_on_schedule(clock):
+    loop = LoopScheduler(RATE_HZ)
+    started = clock.now
+    for tick in range(1, 11):
+        # Uneven work doesn't accumulate into drift.
+        clock.work(PERIOD_S * (0.2 if tick % 2 else 0.7))
+        assert loop.wait()
+        assert clock.now == pytest.approx(started + tick * PERIOD_S)
+    assert (loop.ticks, loop.overruns, loop.skipped) == (10, 0, 0)
+    assert loop.rate_hz == pytest.approx(RATE_HZ)
+
+
+def test_small_overruns_run_the_next_tick_right_away(clock):
+    loop = LoopScheduler(RATE_HZ, late_tolerance=0.25)
+    started = clock.now
+    clock.work(PERIOD_S * 1.2)
+    slept = clock.slept
+    assert not loop.wait()
+    assert clock.slept == slept
+    assert loop.skipped == 0
+    # Back on the original schedule after a short tick.
+    clock.work(PERIOD_S * 0.1)
+    assert loop.wait()
+    assert clock.now == pytest.approx(started + 2 * PERIOD_S)
+
+
+def test_skip_drops_missed_ticks(clock):
+    loop = LoopScheduler(RATE_HZ, policy=OverrunPolicy.SKIP)
+    started = clock.now
+    clock.work(PERIOD_S * 2.5)
+    assert not loop.wait()
+    assert (loop.overruns, loop.skipped) == (1, 1)
+    # The next deadline still in the future, on the original grid.
+    assert clock.now == pytest.approx(started + 3 * PERIOD_S)
+    clock.work(PERIOD_S * 0.5)
+    assert loop.wait()
+    assert clock.now == pytest.approx(started + 4 * PERIOD_S)
+
+
+def test_catch_up_runs_missed_ticks_back_to_back(clock):
+    loop = LoopScheduler(RATE_HZ, policy=OverrunPolicy.CATCH_UP)
+    started = clock.now
+    clock.work(PERIOD_S * 2.5)
+    results = [loop.wait() for _ in range(3)]
+    assert results == [False, False, True]
+    assert loop.skipped == 0
+    assert clock.now == pytest.approx(started + 3 * PERIOD_S)
+
+
+def test_catch_up_gives_up_when_too_far_behind(clock):
+    loop = LoopScheduler(RATE_HZ, policy=OverrunPolicy.CATCH_UP)
+    started = clock.now
+    clock.work(PERIOD_S * (MAX_CATCH_UP_TICKS + 1.5))
+    assert not loop.wait()
+    assert loop.skipped == MAX_CATCH_UP_TICKS
+    assert clock.now == pytest.approx(started + (MAX_CATCH_UP_TICKS + 2) * PERIOD_S)
+
+
+def test_reset_starts_over_from_now(clock):
+    loop = LoopScheduler(RATE_HZ)
+    clock.work(PERIOD_S * 10)
+    loop.reset()
+    started = clock.now
+    assert loop.remaining() == pytest.approx(PERIOD_S)
+    assert loop.wait()
+    assert clock.now == pytest.approx(started + PERIOD_S)
+    assert loop.overruns == 0
@@ -0,0 +1,20 @@
+import sys
+import numpy as np
+import pytest
+from tello_control.autonomous import DroneIPC
+from tello_control.frame_layout import FrameLayout
+from tello_control.simulator import CAMERA_FPS, Simulator, run
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="subscriber table is Linux only")
+
+
+def test_timestamps_keep_increasing_across_episodes(session):
+    with DroneIPC(session, layout=FrameLayout(64, 48)) as ipc:
+        simulator = Simulator(64, 48)
+        # Three frames per episode.
+        run(ipc, simulator, warp=0, lockstep=False, episode_s=2.5 / CAMERA_FPS, max_steps=10)
+        timestamps = ipc.read_telemetry(after=0)["timestamp_ns"]
+        assert len(timestamps) == 10
+        assert (np.diff(timestamps) > 0).all()
+        frame = ipc.read_frame(after=0)
+        assert frame.timestamp_ns == timestamps[-1]
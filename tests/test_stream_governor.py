@@ -0,0 +1,131 @@
+import time
+import pytest
+from djitellopy import Tello
+from tello_control import stream_governor
+from tello_control.command_executor import CommandExecutor
+from tello_control.fake_tello import BITRATES_MBPS, FRAME_RATES, RESOLUTIONS
+from tello_control.stream_governor import QUALITY_LEVELS, UPGRADE_WINDOWS, StreamGovernor, StreamQuality
+
+TARGET_HZ = 60
+IDLE = 0.1 / TARGET_HZ
+OVERLOADED = 2.0 / TARGET_HZ
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor()
+    yield executor
+    executor.close()
+
+
+@pytest.fixture
+def governor(monkeypatch, tello, executor):
+    monkeypatch.setattr(stream_governor, "SETTLE_S", 0.0)
+    tello.stream_on = True
+    return StreamGovernor(tello, executor, TARGET_HZ)
+
+
+def _settings(quality: StreamQuality):
+    # What the fake should be streaming at `quality`.
+    return (RESOLUTIONS[quality.resolution], FRAME_RATES[quality.fps], BITRATES_MBPS[quality.bitrate])
+
+
+def _streaming(fake_tello):
+    return (fake_tello.resolution, fake_tello.fps, fake_tello.bitrate_mbps)
+
+
+def _window(governor: StreamGovernor, work_s: float) -> None:
+    for _ in range(10):
+        governor.record_frame(work_s, on_time=work_s * TARGET_HZ < 1)
+    governor._end_window(time.monotonic())
+    deadline = time.monotonic() + 10
+    while governor._busy():
+        assert time.monotonic() < deadline
+        governor.executor.dispatch_completions()
+        time.sleep(0.01)
+    governor.executor.dispatch_completions()
+
+
+def test_sends_the_starting_level(fake_tello, governor):
+    # Not the drone's defaults, so there's something to see.
+    fake_tello.resolution, fake_tello.fps = RESOLUTIONS["low"], FRAME_RATES["low"]
+    _window(governor, IDLE)
+    assert governor.applied
+    assert _streaming(fake_tello) == _settings(QUALITY_LEVELS[0])
+    for command in ("setbitrate", "setfps", "setresolution"):
+        assert fake_tello.commands[command] == 1
+
+
+def test_waits_for_the_stream(fake_tello, governor, tello):
+    tello.stream_on = False
+    _window(governor, OVERLOADED)
+    assert not governor.applied and governor.level == 0
+    assert fake_tello.commands["setresolution"] == 0
+
+
+def test_steps_down_under_load_and_back_up_with_headroom(fake_tello, governor):
+    _window(governor, IDLE)
+    for level in range(1, len(QUALITY_LEVELS)):
+        _window(governor, OVERLOADED)
+        assert governor.level == level
+        assert _streaming(fake_tello) == _settings(QUALITY_LEVELS[level])
+    # Already at the bottom.
+    _window(governor, OVERLOADED)
+    assert governor.level == len(QUALITY_LEVELS) - 1
+
+    for _ in range(UPGRADE_WINDOWS - 1):
+        _window(governor, IDLE)
+    assert governor.level == len(QUALITY_LEVELS) - 1
+    _window(governor, IDLE)
+    assert governor.level == len(QUALITY_LEVELS) - 2
+    assert _streaming(fake_tello) == _settings(QUALITY_LEVELS[-2])
+    assert not governor.disabled
+
+
+def test_gives_up_when_the_drone_refuses(fake_tello, tello, executor, monkeypatch):
+    monkeypatch.setattr(stream_governor, "SETTLE_S", 0.0)
+    tello.stream_on = True
+    unsupported = StreamQuality("4k", Tello.FPS_30, Tello.BITRATE_AUTO)
+    governor = StreamGovernor(tello, executor, TARGET_HZ, levels=[QUALITY_LEVELS[0], unsupported])
+    _window(governor, IDLE)
+    _window(governor, OVERLOADED)
+    assert governor.disabled
+    assert governor.level == 0
+    _window(governor, OVERLOADED)
+    assert fake_tello.commands["setresolution"] == 2
+
+
+def test_flight_commands_go_ahead_of_quality_changes(fake_tello, tello, governor, monkeypatch):
+    sent = []
+    send = tello.send_command_with_return
+
+    def record(command, *args, **kwargs):
+        sent.append(command)
+        return send(command, *args, **kwargs)
+
+    monkeypatch.setattr(tello, "send_command_with_return", record)
+    fake_tello.latency_s = 0.2
+    # The first window sends all three settings.
+    governor._end_window(time.monotonic())
+    deadline = time.monotonic() + 5
+    while governor.executor.in_flight is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    governor.executor.submit("land", tello.land, 5)
+    while governor._busy() or governor.executor.busy("land"):
+        assert time.monotonic() < deadline
+        governor.executor.dispatch_completions()
+        time.sleep(0.01)
+    assert [command.split()[0] for command in sent] == ["setbitrate", "land", "setfps", "setresolution"]
+
+
+def test_a_late_reply_is_not_taken_for_the_next_setting(fake_tello, tello, monkeypatch):
+    monkeypatch.setattr(stream_governor, "COMMAND_TIMEOUT_S", 1)
+    fake_tello.latency_s = 1.3
+    with pytest.raises(RuntimeError):
+        stream_governor._send(tello, "setbitrate 5")
+    # Let the "ok" come in after its command gave up on it.
+    time.sleep(0.5)
+    fake_tello.latency_s = 0.0
+    with pytest.raises(RuntimeError):
+        stream_governor._send(tello, "setresolution 4k")
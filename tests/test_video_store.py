@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from tello_control.video_store import FrameCodec, StoreReader, StoreWriter
+
+WIDTH, HEIGHT = 32, 24
+FRAME_BYTES = WIDTH * HEIGHT * 3
+FRAME_NS = 33_000_000
+
+
+def _frame(i: int) -> np.ndarray:
+    return np.full((HEIGHT, WIDTH, 3), i % 256, dtype=np.uint8)
+
+
+def _write(directory, n: int, **options) -> StoreWriter:
+    with StoreWriter(directory, WIDTH, HEIGHT, **options) as writer:
+        for i in range(n):
+            writer.append(_frame(i), frame_id=100 + i, timestamp_ns=1_000_000_000 + i * FRAME_NS)
+    return writer
+
+
+def test_segments_rotate_on_size(tmp_path):
+    # Room for four frames after the 64-byte header.
+    writer = _write(tmp_path, 10, max_segment_bytes=64 + 4 * FRAME_BYTES)
+    assert writer.segments_written == 3
+    with StoreReader(tmp_path) as reader:
+        assert reader.n_segments == 3
+        assert len(reader) == 10
+        for i in range(10):
+            assert (reader.image(i) == _frame(i)).all()
+
+
+def test_segments_rotate_on_time(tmp_path):
+    # Three frames per segment: the fourth is 99 ms after the first.
+    writer = _write(tmp_path, 10, max_segment_s=0.09)
+    assert writer.segments_written == 4
+    with StoreReader(tmp_path) as reader:
+        assert len(reader) == 10
+        assert [int(i) for i in reader.frame_ids] == list(range(100, 110))
+
+
+def test_a_new_writer_adds_segments_after_the_existing_ones(tmp_path):
+    _write(tmp_path, 2)
+    _write(tmp_path, 3)
+    with StoreReader(tmp_path) as reader:
+        assert reader.n_segments == 2
+        assert len(reader) == 5
+
+
+def test_position_lookups(tmp_path):
+    _write(tmp_path, 10, max_segment_bytes=64 + 4 * FRAME_BYTES)
+    with StoreReader(tmp_path) as reader:
+        assert reader.position_of(105) == 5
+        assert reader.position_of(99) is None
+        assert reader.position_of(110) is None
+
+        assert reader.position_at(1_000_000_000 + 5 * FRAME_NS) == 5
+        assert reader.position_at(1_000_000_000 + 5 * FRAME_NS + 1) == 5
+        assert reader.position_at(1_000_000_000 + 5 * FRAME_NS - 1) == 4
+        assert reader.position_at(999_999_999) is None
+        assert reader.position_at(10 ** 12) == 9
+
+        with pytest.raises(IndexError):
+            reader.image(10)
+
+
+def test_between_spans_segments(tmp_path):
+    _write(tmp_path, 10, max_segment_bytes=64 + 4 * FRAME_BYTES)
+    with StoreReader(tmp_path) as reader:
+        start_ns = 1_000_000_000 + 2 * FRAME_NS
+        end_ns = 1_000_000_000 + 9 * FRAME_NS
+        chunks = list(reader.between(start_ns, end_ns))
+        # Frames 2-3, 4-7 and 8, one chunk per segment.
+        assert [len(index) for index, images in chunks] == [2, 4, 1]
+        frame_ids = [int(i) for index, images in chunks for i in index["frame_id"]]
+        assert frame_ids == list(range(102, 109))
+        for index, images in chunks:
+            assert images.shape == (len(index), HEIGHT, WIDTH, 3)
+            for frame_id, image in zip(index["frame_id"], images):
+                assert (image == _frame(int(frame_id) - 100)).all()
+
+        assert list(reader.between(end_ns, start_ns)) == []
+
+
+def test_jpeg_frames_come_back_close(tmp_path):
+    _write(tmp_path, 6, codec=FrameCodec.JPEG, max_segment_s=0.09)
+    with StoreReader(tmp_path) as reader:
+        assert len(reader) == 6
+        assert np.abs(reader.image(4).astype(int) - _frame(4)).max() <= 2
+        chunks = list(reader.between(0, 10 ** 12))
+        assert [len(index) for index, images in chunks] == [3, 3]
+        assert chunks[1][1].shape == (3, HEIGHT, WIDTH, 3)
+
+
+def test_refresh_picks_up_new_frames(tmp_path):
+    with StoreWriter(tmp_path, WIDTH, HEIGHT, max_segment_bytes=64 + 4 * FRAME_BYTES) as writer:
+        writer.append(_frame(0), frame_id=0, timestamp_ns=0)
+        with StoreReader(tmp_path) as reader:
+            assert len(reader) == 1
+            for i in range(1, 6):
+                writer.append(_frame(i), frame_id=i, timestamp_ns=i * FRAME_NS)
+            reader.refresh()
+            assert len(reader) == 6
+            assert reader.n_segments == 2
+            assert (reader.image(5) == _frame(5)).all()
+
+
+def test_frames_of_another_shape_are_refused(tmp_path):
+    with StoreWriter(tmp_path, WIDTH, HEIGHT) as writer:
+        with pytest.raises(ValueError):
+            writer.append(np.zeros((HEIGHT, WIDTH), dtype=np.uint8), frame_id=0, timestamp_ns=0)